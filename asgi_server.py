@@ -0,0 +1,450 @@
+# asgi_server.py
+# Async serving mode for the same GraphQL schema and resolvers as
+# backend_server.py, using Ariadne's ASGI app under uvicorn. OpenAI calls go
+# through AsyncOpenAI and the hot user/progress queries through aiosqlite, so
+# a slow plan generation no longer holds up loginUser or logWeight. Resolvers
+# without an async version run in Starlette's threadpool.
+#
+# Usage: uvicorn asgi_server:app --port 5001   (or SERVER_MODE=async ./startup.sh)
+
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import asynccontextmanager
+
+import openai
+from ariadne import make_executable_schema
+from ariadne.asgi import GraphQL
+from ariadne.asgi.handlers import GraphQLHTTPHandler
+from graphql import GraphQLObjectType
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import backend_server as sync_server
+from async_db import AsyncConnectionPool
+from dashboard_cache import BUMP_VERSION_SQL, CURRENT_VERSION_SQL, dashboard_user_id, make_etag, make_request_key
+from instrumentation import InstrumentedConnection, RequestProfiler, begin_request, detach_request, end_request, observe_llm, span, time_resolvers
+from llm_cache import make_cache_key
+from llm_gateway import BULK, INTERACTIVE, AsyncLLMGateway, LLMGatewayError
+from persisted_queries import PersistedQueryError
+from plan_stream import IncrementalPlanParser
+from progress_io import FORMATS, detect_format, export_progress, parse_log_date
+from query_cost import USER_HEADER, QueryCostError
+from single_flight import AsyncSingleFlight
+
+db = AsyncConnectionPool(sync_server.DB_PATH, size=int(os.getenv("ASYNC_DB_POOL_SIZE", "4")),
+                         factory=InstrumentedConnection if sync_server.INSTRUMENTATION_ENABLED else sqlite3.Connection)
+
+# Same limits and retry policy as the sync gateway, on one pooled AsyncOpenAI
+# client per worker. Fan-out mode still uses sync_server.llm_gateway.
+llm_gateway = AsyncLLMGateway(
+    lambda: openai.AsyncOpenAI(api_key=openai.api_key, base_url=openai.base_url, max_retries=0),
+    observer=observe_llm if sync_server.INSTRUMENTATION_ENABLED else None,
+    **sync_server.LLM_GATEWAY_SETTINGS,
+)
+
+
+# Coalesces identical in-flight prompts like sync_server.llm_flight: across
+# workers through llm_inflight when LLM_SINGLE_FLIGHT is "shared" (see single_flight.py).
+llm_flight = AsyncSingleFlight(
+    sync_server.db_pool if sync_server.LLM_SINGLE_FLIGHT == "shared" else None,
+    lease_seconds=sync_server.LLM_SINGLE_FLIGHT_LEASE_SECONDS, error_types=sync_server.LLM_FLIGHT_ERRORS,
+)
+
+
+async def chat_completion(model, system_prompt, user_prompt, json_mode=False, priority=BULK, deadline=None):
+    """Async counterpart of backend_server.chat_completion."""
+    async def call():
+        options = {"response_format": {"type": "json_object"}} if json_mode else {}
+        return await llm_gateway.complete(model, sync_server.chat_messages(system_prompt, user_prompt), priority=priority, deadline=deadline, **options)
+    if sync_server.LLM_SINGLE_FLIGHT == "off":
+        return await call()
+    return await llm_flight.do(make_cache_key(model, system_prompt, user_prompt), call)
+
+
+def stream_chat_completion(model, system_prompt, user_prompt):
+    """Async counterpart of backend_server.stream_chat_completion."""
+    def open_stream():
+        return llm_gateway.stream(model, sync_server.chat_messages(system_prompt, user_prompt), response_format={"type": "json_object"})
+    if sync_server.LLM_SINGLE_FLIGHT == "off":
+        return open_stream()
+    return llm_flight.stream(make_cache_key(model, system_prompt, user_prompt), open_stream)
+
+
+async def complete_json(system_prompt, user_prompt, deadline=None):
+    return await chat_completion(sync_server.PLAN_MODEL, system_prompt, user_prompt, json_mode=True, deadline=deadline)
+
+
+async def generate_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies=None):
+    """Async version of backend_server.generate_diet_plan; cache and storage calls run in the threadpool."""
+    bmi, system_prompt, user_prompt = sync_server.build_plan_prompts(weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies)
+    cache_key = make_cache_key(sync_server.PLAN_MODEL, system_prompt, user_prompt)
+    content = await run_in_threadpool(sync_server.plan_cache.get, cache_key) if sync_server.LLM_CACHE_ENABLED else None
+    from_cache = content is not None
+    if not from_cache:
+        deadline = llm_gateway.deadline(BULK)
+        if sync_server.PLAN_GENERATION_MODE == "fanout":
+            # The fan-out engine has its own bounded thread pool for the per-day calls.
+            plan = await run_in_threadpool(sync_server.plan_fanout.generate, bmi, activityLevel, dietaryPreference, allergies, includeCheatMeal, deadline)
+            content = json.dumps(plan)
+        else:
+            content = await complete_json(system_prompt, user_prompt, deadline=deadline)
+    response_data = json.loads(content)
+    sync_server.validate_plan(response_data)
+    if sync_server.LLM_CACHE_ENABLED and not from_cache:
+        await run_in_threadpool(sync_server.plan_cache.put, cache_key, content)
+    return await run_in_threadpool(sync_server.store_diet_plan, userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, bmi, response_data)
+
+
+async def stream_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies=None):
+    """Async version of backend_server.stream_diet_plan, reading the completion from AsyncLLMGateway.stream."""
+    bmi, system_prompt, user_prompt = sync_server.build_plan_prompts(weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies)
+    cache_key = make_cache_key(sync_server.PLAN_MODEL, system_prompt, user_prompt)
+    content = await run_in_threadpool(sync_server.plan_cache.get, cache_key) if sync_server.LLM_CACHE_ENABLED else None
+    from_cache = content is not None
+    parser = IncrementalPlanParser()
+    if from_cache:
+        for event in parser.feed(content):
+            yield event
+    else:
+        async for text in stream_chat_completion(sync_server.PLAN_MODEL, system_prompt, user_prompt):
+            for event in parser.feed(text):
+                yield event
+        content = parser.text()
+    response_data = json.loads(content)
+    sync_server.validate_plan(response_data)
+    if sync_server.LLM_CACHE_ENABLED and not from_cache:
+        await run_in_threadpool(sync_server.plan_cache.put, cache_key, content)
+    yield ("dietPlan", await run_in_threadpool(sync_server.store_diet_plan, userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, bmi, response_data))
+
+
+async def sse_events(plan_args):
+    """Async version of backend_server.sse_events."""
+    try:
+        async for event, payload in stream_diet_plan(*plan_args):
+            yield sync_server.sse_message(event, payload)
+    except (LLMGatewayError, openai.RateLimitError) as e:
+        print(f"plan stream: LLM unavailable: {e}")
+        yield f"event: error\ndata: {json.dumps({'message': sync_server.LLM_BUSY_MESSAGE})}\n\n"
+    except Exception as e:
+        print(f"--- ERROR in plan stream ---")
+        print(f"Error Type: {type(e).__name__}")
+        print(f"Error Details: {e}")
+        print(f"----------------------------")
+        yield f"event: error\ndata: {json.dumps({'message': 'A server error occurred. Please check the backend logs for details.'})}\n\n"
+
+
+# --- Async Resolvers ---
+async def resolve_register_user(_, info, username, password):
+    async with db.connection() as conn:
+        try:
+            await conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, sync_server.hash_password(password)))
+            await conn.commit()
+            user_data = await (await conn.execute("SELECT * FROM users WHERE username = ?", (username,))).fetchone()
+            return {"success": True, "message": "Registration successful!", "user": dict(user_data)}
+        except sqlite3.IntegrityError:
+            await conn.rollback()
+            return {"success": False, "message": "Username already exists."}
+
+
+async def resolve_login_user(_, info, username, password):
+    async with db.connection() as conn:
+        cursor = await conn.execute("SELECT * FROM users WHERE username = ? AND password_hash = ?", (username, sync_server.hash_password(password)))
+        user_data = await cursor.fetchone()
+    if user_data:
+        return {"success": True, "message": "Login successful!", "user": dict(user_data)}
+    return {"success": False, "message": "Invalid username or password."}
+
+
+async def resolve_log_weight(_, info, userId, weight, date):
+    try:
+        date = parse_log_date(date)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    async with db.connection() as conn:
+        try:
+            await conn.execute("INSERT OR REPLACE INTO user_progress (user_id, weight_kg, log_date) VALUES (?, ?, ?)", (userId, weight, date))
+            await conn.execute(BUMP_VERSION_SQL, (userId,))
+            await conn.commit()
+            return {"success": True, "message": "Weight logged successfully!"}
+        except Exception as e:
+            await conn.rollback()
+            return {"success": False, "message": str(e)}
+
+
+async def resolve_generate_diet_plan(_, info, userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies):
+    if not openai.api_key:
+        return {"success": False, "message": "OpenAI API key is not configured. Please check your .env file."}
+    try:
+        plan_dict = await generate_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies)
+        return {"success": True, "message": "Comprehensive plan generated!", "dietPlan": plan_dict}
+    except (LLMGatewayError, openai.RateLimitError) as e:
+        print(f"generateDietPlan: LLM unavailable: {e}")
+        return {"success": False, "message": sync_server.LLM_BUSY_MESSAGE}
+    except Exception as e:
+        print(f"--- ERROR in generateDietPlan ---")
+        print(f"Error Type: {type(e).__name__}")
+        print(f"Error Details: {e}")
+        print(f"---------------------------------")
+        return {"success": False, "message": f"A server error occurred. Please check the backend logs for details."}
+
+
+async def resolve_swap_meal(_, info, mealName, dishToSwap, dietaryPreference):
+    cache_key = sync_server.swap_cache.make_key(mealName, dishToSwap, dietaryPreference)
+    cached_meal = sync_server.swap_cache.next_candidate(cache_key)
+    if not cached_meal:
+        cached_meal = await run_in_threadpool(sync_server.catalog_swap, cache_key, mealName, dishToSwap, dietaryPreference)
+    if cached_meal:
+        return cached_meal
+    if not openai.api_key: return None
+    try:
+        system_prompt, user_prompt = sync_server.build_swap_prompts(mealName, dishToSwap, dietaryPreference)
+        content = await chat_completion("gpt-3.5-turbo-1106", system_prompt, user_prompt, json_mode=True, priority=INTERACTIVE)
+        return sync_server.take_swap_candidate(cache_key, content, dishToSwap)
+    except Exception as e:
+        print(f"An unexpected error occurred during swap: {e}")
+        return None
+
+
+async def resolve_get_recipe(_, info, dishName):
+    cached_recipe = await run_in_threadpool(sync_server.recipe_store.get, dishName)
+    if cached_recipe is not None:
+        return cached_recipe
+    if not openai.api_key: return "API key not configured."
+    try:
+        recipe = await chat_completion(sync_server.RECIPE_MODEL, sync_server.RECIPE_SYSTEM_PROMPT, f"What is the recipe for '{dishName}'?", priority=INTERACTIVE)
+        await run_in_threadpool(sync_server.recipe_store.put, dishName, recipe)
+        return recipe
+    except (LLMGatewayError, openai.RateLimitError) as e:
+        print(f"getRecipe: LLM unavailable: {e}")
+        return sync_server.LLM_BUSY_MESSAGE
+    except Exception as e:
+        print(f"An unexpected error during recipe fetch: {e}")
+        return "Sorry, I couldn't fetch the recipe at this time."
+
+
+ASYNC_RESOLVERS = {
+    ("Mutation", "registerUser"): resolve_register_user,
+    ("Mutation", "loginUser"): resolve_login_user,
+    ("Mutation", "logWeight"): resolve_log_weight,
+    ("Mutation", "generateDietPlan"): resolve_generate_diet_plan,
+    ("Mutation", "swapMeal"): resolve_swap_meal,
+    ("Mutation", "getRecipe"): resolve_get_recipe,
+}
+# Resolvers that never do I/O stay on the event loop.
+INLINE_RESOLVERS = {("Query", "getUserDashboard"), ("DietPlan", "generated_plan"), ("DayPlan", "totals"), ("DayPlan", "calories_consistent")}
+
+
+def in_threadpool(resolver):
+    async def resolve(*args, **kwargs):
+        return await run_in_threadpool(resolver, *args, **kwargs)
+    return resolve
+
+
+def make_async_schema():
+    """Builds the backend_server schema again, with every blocking resolver swapped for a non-blocking one."""
+    async_schema = make_executable_schema(
+        sync_server.type_defs, sync_server.query, sync_server.mutation, sync_server.plan_job,
+        sync_server.user_dashboard, sync_server.diet_plan, sync_server.plan_type, sync_server.day_plan,
+    )
+    for type_name, graphql_type in async_schema.type_map.items():
+        if not isinstance(graphql_type, GraphQLObjectType) or type_name.startswith("__"):
+            continue
+        for field_name, field in graphql_type.fields.items():
+            key = (type_name, field_name)
+            if key in ASYNC_RESOLVERS:
+                field.resolve = ASYNC_RESOLVERS[key]
+            elif field.resolve is not None and key not in INLINE_RESOLVERS:
+                field.resolve = in_threadpool(field.resolve)
+    return async_schema
+
+
+schema = make_async_schema()
+if sync_server.INSTRUMENTATION_ENABLED:
+    time_resolvers(schema)
+
+
+# --- GraphQL Endpoint ---
+class CachingGraphQLHTTPHandler(GraphQLHTTPHandler):
+    """Adds persisted queries and the dashboard response cache, as in backend_server.graphql_server."""
+
+    async def graphql_http_server(self, request):
+        if request.method != "POST":
+            return await super().graphql_http_server(request)
+        try:
+            payload = await request.json()
+            with span("parse"):
+                data, document = sync_server.persisted_queries.resolve(payload)
+            cost, client = sync_server.price_query(data, document, request.headers.get(USER_HEADER), request.client.host if request.client else None)
+        except (PersistedQueryError, QueryCostError) as error:
+            return JSONResponse({"errors": [error.formatted]})
+        except ValueError:
+            return Response("Request body is not a valid JSON", status_code=400)
+
+        headers = {}
+        user_id = None
+        if sync_server.DASHBOARD_CACHE_ENABLED and document and isinstance(data.get("variables") or {}, dict):
+            user_id = dashboard_user_id(document, data.get("variables"), data.get("operationName"))
+        try:
+            if user_id is not None:
+                request_key = make_request_key(document, data.get("variables"), data.get("operationName"))
+                async with db.connection() as conn:
+                    row = await (await conn.execute(CURRENT_VERSION_SQL, (user_id,))).fetchone()
+                version = row["version"] if row else 0
+                headers = {"ETag": make_etag(user_id, version, request_key), "Cache-Control": "private, no-cache"}
+                if headers["ETag"] in request.headers.get("if-none-match", ""):
+                    sync_server.charge_query(cost, client, cached=True)
+                    sync_server.dashboard_cache.record_not_modified()
+                    return Response(status_code=304, headers=headers)
+                body = sync_server.dashboard_cache.get(request_key, version)
+                if body is not None:
+                    sync_server.charge_query(cost, client, cached=True)
+                    return graphql_response(request, body, headers=headers)
+            sync_server.charge_query(cost, client)
+        except QueryCostError as error:
+            return JSONResponse({"errors": [error.formatted]})
+
+        context = sync_server.graphql_context(request, cost)
+        with span("execute"):
+            success, result = await self.execute_graphql_query(request, data, context_value=context, query_document=document)
+        sync_server.report_cost(result, context)
+        body = sync_server.serialize(result, context)
+        if user_id is not None and success and "errors" not in result:
+            sync_server.dashboard_cache.put(request_key, version, body)
+            return graphql_response(request, body, headers=headers)
+        return graphql_response(request, body, status_code=200 if success else 400)
+
+
+def graphql_response(request, body, status_code=200, headers=None):
+    """Sends a serialized GraphQL result, compressed if the client accepts it."""
+    with span("compress"):
+        body, headers = sync_server.response_encoder.encode(body, request.headers.get("accept-encoding"), headers)
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+graphql_app = GraphQL(
+    schema,
+    query_validator=sync_server.query_documents.validate,
+    http_handler=CachingGraphQLHTTPHandler(),
+    debug=os.getenv("ASGI_DEBUG", "0") == "1",
+)
+
+
+# --- Other Routes ---
+async def stream_plan(request):
+    """Same SSE stream as backend_server's /plans/stream, read from the OpenAI stream on the event loop."""
+    if not openai.api_key:
+        return JSONResponse({"success": False, "message": "OpenAI API key is not configured. Please check your .env file."}, status_code=503)
+    data = await request.json()
+    try:
+        plan_args = (
+            data["userId"], float(data["weight"]), float(data["height"]), data["activityLevel"],
+            bool(data["includeCheatMeal"]), data["dietaryPreference"], data.get("allergies"),
+        )
+    except (KeyError, TypeError, ValueError):
+        return JSONResponse({"success": False, "message": "Missing or invalid plan arguments."}, status_code=400)
+    return StreamingResponse(sse_events(plan_args), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def import_progress_upload(request):
+    """
+    Raw-body version of backend_server's /progress/import (multipart needs
+    python-multipart, which this mode does not depend on). The body is spooled
+    as it arrives, then parsed and written in the threadpool.
+    """
+    user_id = request.query_params.get("userId")
+    fmt = request.query_params.get("format") or detect_format(request.headers.get("content-type"))
+    if not user_id or fmt not in FORMATS:
+        return JSONResponse({"success": False, "message": "Pass ?userId= and a csv or ndjson upload."}, status_code=400)
+    with tempfile.SpooledTemporaryFile(max_size=sync_server.PROGRESS_IMPORT_SPOOL_BYTES) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        result = await run_in_threadpool(sync_server.run_progress_import, user_id, sync_server.parse_upload(body, fmt))
+    return JSONResponse(result, status_code=200 if result["success"] else 400)
+
+
+async def export_progress_download(request):
+    user_id = request.query_params.get("userId")
+    fmt = request.query_params.get("format", "csv")
+    if not user_id or fmt not in FORMATS:
+        return JSONResponse({"success": False, "message": "Pass ?userId= and format=csv or ndjson."}, status_code=400)
+    headers = {"Content-Disposition": f'attachment; filename="weight-history-{user_id}.{fmt}"'}
+    # A sync generator, so Starlette pulls each page in the threadpool.
+    return StreamingResponse(export_progress(sync_server.db_pool, user_id, fmt),
+                             media_type="text/csv" if fmt == "csv" else "application/x-ndjson", headers=headers)
+
+
+async def cache_stats(request):
+    return JSONResponse({"dashboard": sync_server.dashboard_cache.stats(), "llm": sync_server.plan_cache.stats(), "query_documents": sync_server.query_documents.stats(), "llm_single_flight": llm_flight.stats(), "llm_gateway": llm_gateway.stats(), "progress_analytics": sync_server.progress_analytics_cache.stats(), "query_cost": sync_server.query_cost.stats(), "dish_catalog": sync_server.dish_catalog.stats()})
+
+
+async def metrics_endpoint(request):
+    return Response(sync_server.metrics.render(), media_type=sync_server.metrics.CONTENT_TYPE)
+
+
+# --- Request Tracing ---
+class RequestTracing:
+    """
+    ASGI middleware doing what backend_server's before/after_request hooks do:
+    latency per route, slow-request breakdowns and X-Profile profiling. A
+    profile here covers everything the event loop ran meanwhile, but not the
+    threadpool.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace, token = begin_request(scope["method"], scope["path"] if scope["path"] in self.routes else "unmatched")
+        profile_header = dict(scope["headers"]).get(RequestProfiler.HEADER.lower().encode())
+        profile = sync_server.request_profiler.start(profile_header.decode("latin-1") if profile_header else None)
+        finished = False
+
+        async def send_traced(message):
+            nonlocal finished, profile
+            if message["type"] == "http.response.start" and not finished:
+                finished = True
+                seconds = end_request(trace, message["status"], sync_server.SLOW_REQUEST_MS)
+                if profile is not None:
+                    name = sync_server.request_profiler.finish(profile, f"{trace.method} {trace.route} {seconds * 1000:.0f}ms")
+                    profile = None
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-file", name.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            detach_request(token)
+            if not finished:
+                end_request(trace, 500, sync_server.SLOW_REQUEST_MS)
+            if profile is not None:
+                sync_server.request_profiler.finish(profile, f"{trace.method} {trace.route} failed")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(sync_server.start_background_work)
+    yield
+    await db.close_all()
+
+
+app = Starlette(
+    routes=[
+        Route("/graphql", graphql_app, methods=["GET", "POST"]),
+        Route("/plans/stream", stream_plan, methods=["POST"]),
+        Route("/progress/import", import_progress_upload, methods=["POST"]),
+        Route("/progress/export", export_progress_download, methods=["GET"]),
+        Route("/cache/stats", cache_stats, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+if sync_server.INSTRUMENTATION_ENABLED:
+    app.add_middleware(RequestTracing, routes={route.path for route in app.routes})
@@ -0,0 +1,68 @@
+# async_db.py
+# aiosqlite counterpart of db.ConnectionPool for the ASGI server (asgi_server.py).
+# Each aiosqlite connection runs its queries on its own background thread, so
+# awaiting a query never blocks the event loop.
+
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from db import PRAGMAS, STATEMENT_CACHE_SIZE
+
+
+class AsyncConnectionPool:
+    """
+    A fixed-size pool of aiosqlite connections with the same pragmas as the
+    sync pool. WAL lets the pooled readers run alongside a writer; writers
+    still take turns, waiting up to busy_timeout. `factory` is the
+    sqlite3.Connection class aiosqlite opens.
+    """
+
+    def __init__(self, db_path, size=4, pragmas=PRAGMAS, factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = pragmas
+        self.factory = factory
+        self._idle = None
+        self._opened = []
+        self._open_lock = None
+
+    async def _open(self):
+        conn = await aiosqlite.connect(self.db_path, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            await conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    async def _acquire(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            self._open_lock = asyncio.Lock()
+        if self._idle.empty():
+            async with self._open_lock:
+                if len(self._opened) < self.size:
+                    conn = await self._open()
+                    self._opened.append(conn)
+                    return conn
+        return await self._idle.get()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Yields a connection; any transaction left open by an error is rolled back."""
+        conn = await self._acquire()
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                await conn.rollback()
+            raise
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close_all(self):
+        connections, self._opened = self._opened, []
+        for conn in connections:
+            await conn.close()
+        self._idle = None
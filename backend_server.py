@@ -5,11 +5,36 @@ import sqlite3
 import json
 import os
 import hashlib
-from flask import Flask, request, jsonify
-from ariadne import QueryType, MutationType, make_executable_schema, gql, graphql_sync
+import base64
+import io
+import shutil
+import tempfile
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from ariadne import QueryType, MutationType, ObjectType, make_executable_schema, gql, graphql_sync
+from graphql import FieldNode, FragmentSpreadNode, GraphQLError, InlineFragmentNode
 from ariadne.explorer import ExplorerGraphiQL
 import openai
 from dotenv import load_dotenv
+from dashboard_cache import DashboardResponseCache, bump_version, current_version, dashboard_user_id, make_etag, make_request_key
+from dataloaders import PlanLoaders
+from db import ConnectionPool, PooledConnection
+from dish_catalog import DishCatalog, plausible_nutrition
+from instrumentation import InstrumentedConnection, RequestProfiler, begin_request, detach_request, end_request, metrics, observe_llm, span, time_resolvers
+from jobs import PlanJobQueue
+from migrations import migrate
+from persisted_queries import DocumentCache, PersistedQueries, PersistedQueryError
+from query_cost import USER_HEADER, QueryCostAnalyzer, QueryCostError, operation_client
+from plan_store import PLAN_JSON_SHAPES, calories_consistent, day_totals, insert_plan_parts, normalize_plan, plan_json_values
+from plan_batch import BatchPlanGenerator
+from plan_fanout import FanOutPlanGenerator
+from plan_stream import IncrementalPlanParser
+from progress_analytics import METHODS as ANALYTICS_METHODS, compute_analytics, load_history
+from progress_io import FORMATS, detect_format, export_progress, import_progress, parse_csv, parse_entries, parse_log_date, parse_ndjson
+from llm_cache import LLMResponseCache, MemoryTier, SQLiteTier, make_cache_key
+from llm_gateway import BULK, INTERACTIVE, CircuitOpenError, DeadlineExceededError, LLMGateway, LLMGatewayError
+from response_encoding import ResponseEncoder, can_splice, splice
+from recipe_store import RecipeStore, SwapCandidateCache
+from single_flight import SingleFlight
 
 # --- Load Environment Variables ---
 load_dotenv()
@@ -19,78 +44,160 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # --- Define Database Path ---
 DATA_DIR = "data"
-DB_PATH = os.path.join(DATA_DIR, "diet_planner.db")
+DB_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR, "diet_planner.db"))
+
+# --- Instrumentation ---
+# Latency histograms for requests, resolvers, SQL and OpenAI calls, served on
+# /metrics (see instrumentation.py). Requests slower than SLOW_REQUEST_MS are
+# logged with a breakdown of where the time went. Setting PROFILE_TOKEN lets a
+# request sent with "X-Profile: <token>" be profiled into PROFILE_DIR.
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "1") == "1"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+request_profiler = RequestProfiler(os.getenv("PROFILE_TOKEN"), os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles")))
+
+# --- Connection Pool ---
+# One reused, WAL-mode connection per worker thread (see db.py).
+db_pool = ConnectionPool(DB_PATH, factory=InstrumentedConnection if INSTRUMENTATION_ENABLED else PooledConnection)
+
+# --- Diet Plan Response Cache ---
+# Identical profiles produce identical prompts, so completions are reused
+# (see llm_cache.py). Set LLM_CACHE_VARIANTS > 1 to keep results varied.
+PLAN_MODEL = "gpt-3.5-turbo-1106"
+plan_cache = LLMResponseCache(
+    MemoryTier(max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "256"))),
+    SQLiteTier(db_pool) if os.getenv("LLM_CACHE_PERSIST", "1") == "1" else None,
+    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    variants=int(os.getenv("LLM_CACHE_VARIANTS", "1")),
+)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+
+# --- Recipe & Swap Caches ---
+# Recipes are the same for every user, so they are served from the recipes
+# table after the first request. swapMeal first looks for close dishes in the
+# catalogue of meals already served in stored plans (see dish_catalog.py),
+# and only then asks the model; either way it takes a batch of alternatives
+# and hands them out one per call. The catalogue is built in the background
+# when a worker starts and caught up every SWAP_CATALOG_REFRESH_SECONDS, or
+# right after this worker stores a plan.
+recipe_store = RecipeStore(db_pool)
+swap_cache = SwapCandidateCache(max_keys=int(os.getenv("SWAP_CACHE_MAX_KEYS", "1024")))
+SWAP_BATCH_SIZE = int(os.getenv("SWAP_BATCH_SIZE", "3"))
+dish_catalog = DishCatalog(db_pool, tolerance=float(os.getenv("SWAP_CATALOG_TOLERANCE", "0.2")))
+SWAP_CATALOG_ENABLED = os.getenv("SWAP_CATALOG_ENABLED", "1") == "1"
+SWAP_CATALOG_REFRESH_SECONDS = float(os.getenv("SWAP_CATALOG_REFRESH_SECONDS", "30"))
+
+# --- Dashboard Response Cache ---
+# Streamlit re-sends the same dashboard query on every rerun. Responses are
+# cached per user and query until logWeight or a new plan bumps the user's
+# version; clients can revalidate with If-None-Match (see dashboard_cache.py).
+dashboard_cache = DashboardResponseCache(max_entries=int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "1024")))
+DASHBOARD_CACHE_ENABLED = os.getenv("DASHBOARD_CACHE_ENABLED", "1") == "1"
+
+# --- Response Encoding ---
+# /graphql responses are serialized with orjson when it is installed, splice
+# in the stored plan JSON instead of re-encoding it, and are compressed with
+# brotli or gzip once they reach RESPONSE_COMPRESSION_MIN_BYTES.
+response_encoder = ResponseEncoder(
+    compress=os.getenv("RESPONSE_COMPRESSION_ENABLED", "1") == "1",
+    min_bytes=int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024")),
+    gzip_level=int(os.getenv("RESPONSE_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("RESPONSE_BROTLI_QUALITY", "4")),
+    splice=os.getenv("SPLICE_STORED_JSON", "1") == "1",
+)
+
+# --- Progress Analytics Cache ---
+# progressAnalytics reads the whole weight history, so results are kept per
+# user and arguments under the same version counter, which logWeight bumps.
+progress_analytics_cache = DashboardResponseCache(max_entries=int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "1024")))
+MAX_ANALYTICS_POINTS = int(os.getenv("MAX_ANALYTICS_POINTS", "1000"))
 
 
 # --- Database Initialization ---
 def init_db():
     """
-    Initializes the database and creates tables if they don't exist.
+    Initializes the database by applying any pending migrations (see migrations.py).
     This function also ensures the data directory exists.
     """
-    os.makedirs(DATA_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    # Create 'users' table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    # Create 'user_progress' table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_progress (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            weight_kg REAL NOT NULL,
-            log_date DATE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(user_id, log_date)
-        )
-    ''')
-    # Create 'diet_plans' table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS diet_plans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            weight_kg REAL NOT NULL,
-            height_cm REAL NOT NULL,
-            activity_level TEXT NOT NULL,
-            dietary_preference TEXT NOT NULL,
-            include_cheat_meal BOOLEAN NOT NULL,
-            bmi REAL NOT NULL,
-            generated_plan_json TEXT NOT NULL,
-            exercise_plan_json TEXT,
-            shopping_list_json TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully.")
-
+    os.makedirs(os.path.dirname(db_pool.db_path) or ".", exist_ok=True)
+    with db_pool.connection() as conn:
+        applied = migrate(conn)
+    print(f"Database initialized successfully. Applied migrations: {applied or 'none'}.")
 
-# --- Database Helper Functions ---
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
 
 # --- Password Hashing ---
 def hash_password(password):
     """Hashes a password using SHA256 for secure storage."""
     return hashlib.sha256(password.encode()).hexdigest()
 
+# --- Query Helpers ---
+# Scalar DietPlan fields that map straight onto diet_plans columns.
+PLAN_SUMMARY_COLUMNS = ("created_at", "weight_kg", "bmi", "dietary_preference")
+
+def selected_fields(info):
+    """Names of the fields selected under the field being resolved, fragments included."""
+    names = set()
+    pending = [node.selection_set for node in info.field_nodes if node.selection_set]
+    while pending:
+        for selection in pending.pop().selections:
+            if isinstance(selection, FieldNode):
+                names.add(selection.name.value)
+            elif isinstance(selection, InlineFragmentNode):
+                pending.append(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                pending.append(info.fragments[selection.name.value].selection_set)
+    return names
+
+def plan_columns(info, selection=None):
+    """The diet_plans columns needed for the DietPlan fields this query selects."""
+    selection = selected_fields(info) if selection is None else selection
+    return ["id"] + [column for column in PLAN_SUMMARY_COLUMNS if column in selection] + (["user_id"] if "user" in selection else [])
+
+def request_loaders(info):
+    """The request's data loaders; an execution without them (no HTTP request) loads each key on its own."""
+    context = info.context
+    return context["loaders"] if isinstance(context, dict) and "loaders" in context else PlanLoaders(db_pool)
+
+def node_selection(info):
+    """Fields selected under edges { node { ... } } of a connection field."""
+    names = set()
+    for edges_node in info.field_nodes[0].selection_set.selections:
+        if isinstance(edges_node, FieldNode) and edges_node.name.value == "edges" and edges_node.selection_set:
+            for node in edges_node.selection_set.selections:
+                if isinstance(node, FieldNode) and node.name.value == "node" and node.selection_set:
+                    names |= {field.name.value for field in node.selection_set.selections if isinstance(field, FieldNode)}
+    return names
+
+# --- Cursor Pagination ---
+# Cursors are opaque, base64-encoded keyset positions, so a page is an index
+# seek rather than an OFFSET scan and stays stable while new rows arrive.
+MAX_PAGE_SIZE = {"plans": 50, "progress": 1000}
+
+def encode_cursor(*keys):
+    return base64.urlsafe_b64encode(json.dumps(keys).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise GraphQLError("Invalid pagination cursor.")
+
+def make_connection(rows, first, cursor_keys):
+    """Builds a Relay-style connection from up to first + 1 rows."""
+    page = rows[:first]
+    edges = [{"cursor": encode_cursor(*cursor_keys(row)), "node": row} for row in page]
+    return {
+        "edges": edges,
+        "pageInfo": {"hasNextPage": len(rows) > first, "endCursor": edges[-1]["cursor"] if edges else None},
+    }
+
 # --- GraphQL Schema Definition (SDL) ---
 type_defs = gql("""
     scalar Date
-    type Query { getUserDashboard(userId: ID!): UserDashboard }
+    type Query {
+        getUserDashboard(userId: ID!): UserDashboard
+        getPlanJob(jobId: ID!): PlanJob
+        getPlan(id: ID!): DietPlan
+    }
     type Mutation {
         registerUser(username: String!, password: String!): AuthResponse
         loginUser(username: String!, password: String!): AuthResponse
@@ -98,17 +205,42 @@ type_defs = gql("""
             userId: ID!, weight: Float!, height: Float!, activityLevel: String!, 
             includeCheatMeal: Boolean!, dietaryPreference: String!, allergies: [String!]
         ): DietPlanResponse
+        requestDietPlan(
+            userId: ID!, weight: Float!, height: Float!, activityLevel: String!, 
+            includeCheatMeal: Boolean!, dietaryPreference: String!, allergies: [String!]
+        ): PlanJobResponse
+        generateDietPlans(profiles: [PlanProfileInput!]!): BatchPlanResponse
         swapMeal(mealName: String!, dishToSwap: String!, dietaryPreference: String!): Meal
         getRecipe(dishName: String!): String
         logWeight(userId: ID!, weight: Float!, date: Date!): ProgressResponse
+        importWeights(userId: ID!, entries: [WeightEntryInput!]!): WeightImportResponse
     }
     type AuthResponse { success: Boolean!, message: String, user: User }
     type User { id: ID!, username: String! }
     type ProgressEntry { weight_kg: Float!, log_date: Date! }
-    type UserDashboard { pastPlans: [DietPlan!], progressHistory: [ProgressEntry!] }
+    type UserDashboard {
+        pastPlans: [DietPlan!]
+        progressHistory: [ProgressEntry!]
+        pastPlansConnection(first: Int = 10, after: String): DietPlanConnection!
+        progressHistoryConnection(first: Int = 100, after: String): ProgressEntryConnection!
+        progressAnalytics(
+            targetPoints: Int = 120, method: String = "auto", windowDays: Int = 7,
+            trendDays: Int = 90, goalWeights: [Float!]
+        ): ProgressAnalytics!
+    }
+    type ProgressPoint { log_date: Date!, weight_kg: Float!, rolling_avg_kg: Float! }
+    type ProgressTrend { slope_kg_per_week: Float!, r_squared: Float!, fitted_from: Date!, fitted_to: Date!, current_kg: Float! }
+    type GoalProjection { goal_kg: Float!, projected_date: Date, days_from_last_log: Int }
+    type ProgressAnalytics { total_entries: Int!, method: String!, points: [ProgressPoint!]!, trend: ProgressTrend, goals: [GoalProjection!]! }
+    type PageInfo { hasNextPage: Boolean!, endCursor: String }
+    type DietPlanEdge { cursor: String!, node: DietPlan! }
+    type DietPlanConnection { edges: [DietPlanEdge!]!, pageInfo: PageInfo! }
+    type ProgressEntryEdge { cursor: String!, node: ProgressEntry! }
+    type ProgressEntryConnection { edges: [ProgressEntryEdge!]!, pageInfo: PageInfo! }
     type Meal { name: String!, dish: String!, quantity: String!, nutrition: Nutrition! }
     type Nutrition { calories: Int!, protein_g: Int!, carbs_g: Int!, fat_g: Int! }
-    type DayPlan { day: String!, daily_calories: Int!, meals: [Meal!]! }
+    type DayPlan { day: String!, daily_calories: Int!, meals: [Meal!]!, totals: Nutrition!, calories_consistent: Boolean! }
+    type WeeklyTotals { days: Int!, total: Nutrition!, daily_average: Nutrition!, mismatched_days: Int! }
     type Exercise { day: String!, activity: String! }
     type ShoppingList { category: String!, items: [String!]! }
     type Plan { diet: [DayPlan!]!, exercises: [Exercise!]!, shoppingList: [ShoppingList!]! }
@@ -118,116 +250,433 @@ type_defs = gql("""
         weight_kg: Float!, 
         bmi: Float!, 
         dietary_preference: String!, 
-        generated_plan: Plan! 
+        generated_plan: Plan!,
+        weeklyTotals: WeeklyTotals,
+        user: User
     }
     type DietPlanResponse { success: Boolean!, message: String, dietPlan: DietPlan }
     type ProgressResponse { success: Boolean!, message: String }
+    input WeightEntryInput { date: Date!, weight: Float! }
+    type WeightImportResponse { success: Boolean!, message: String, imported: Int!, rejected: Int!, errors: [String!]! }
+    type PlanJob { id: ID!, status: String!, error: String, dietPlan: DietPlan }
+    type PlanJobResponse { success: Boolean!, message: String, job: PlanJob }
+    input PlanProfileInput {
+        userId: ID!, weight: Float!, height: Float!, activityLevel: String!,
+        includeCheatMeal: Boolean!, dietaryPreference: String!, allergies: [String!]
+    }
+    type BatchPlanItem { index: Int!, userId: ID!, success: Boolean!, error: String, dietPlan: DietPlan }
+    type BatchPlanResponse {
+        success: Boolean!, message: String, total: Int!, succeeded: Int!, failed: Int!,
+        uniqueProfiles: Int!, items: [BatchPlanItem!]!
+    }
 """)
 
+# --- Plan Generation ---
+def build_plan_prompts(weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies):
+    """Returns (bmi, system_prompt, user_prompt) for a plan request."""
+    height_in_meters = height / 100
+    bmi = round(weight / (height_in_meters * height_in_meters), 1)
+    system_prompt = """
+    You are an expert nutritionist and fitness coach specializing in South Indian cuisine. 
+    Your task is to generate a comprehensive 7-day health plan.
+    You MUST return a single, valid JSON object and nothing else. The JSON object must have three top-level keys: "diet", "exercises", and "shoppingList".
+    The structure MUST be as follows:
+    { "diet": [ { "day": "Monday", "daily_calories": integer, "meals": [ { "name": "Breakfast" | "Lunch" | "Snack" | "Dinner", "dish": "Dish Name", "quantity": "Serving size, e.g., '1 cup' or '2 rotis'", "nutrition": { "calories": integer, "protein_g": integer, "carbs_g": integer, "fat_g": integer } } ] } ], "exercises": [ { "day": "Monday", "activity": "Suggested activity, e.g., '30-minute brisk walk'" } ], "shoppingList": [ { "category": "e.g., Vegetables", "items": ["item1", "item2"] } ] }
+    Do not include any text, explanations, or markdown formatting outside of this single JSON object.
+    """
+    allergies_text = f"The user is allergic to the following and these ingredients must be completely avoided: {', '.join(sorted(allergies))}." if allergies else "The user has no listed allergies."
+    user_prompt = f"""
+    Please generate a comprehensive 7-day health plan based on the following user details:
+    - Cuisine Style: Andhra & Telangana
+    - User BMI: {bmi}
+    - Activity Level: '{activityLevel}'
+    - Dietary Preference: '{dietaryPreference}'
+    - Allergies: {allergies_text}
+    - Include a cheat meal this week: {'Yes' if includeCheatMeal else 'No'}
+    CRITICAL INSTRUCTION: All suggested dishes in the diet plan MUST be authentic and traditional dishes from the Andhra or Telangana regions of India. Do not include generic or North Indian dishes.
+    Ensure the plan is balanced, varied, and appropriate for the user's profile.
+    """
+    return bmi, system_prompt, user_prompt
+
+
+def validate_plan(response_data):
+    if 'diet' not in response_data or 'exercises' not in response_data or 'shoppingList' not in response_data:
+        raise KeyError("AI response is missing required keys.")
+
+
+def store_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, bmi, response_data):
+    """Inserts a generated plan into diet_plans and returns the new row as a dict."""
+    response_data = normalize_plan(response_data)
+    diet_plan_json, exercise_plan_json, shopping_list_json = plan_json_values(response_data)
+    with db_pool.connection() as conn:
+        cursor = conn.execute(
+            "INSERT INTO diet_plans (user_id, weight_kg, height_cm, activity_level, dietary_preference, include_cheat_meal, bmi, generated_plan_json, exercise_plan_json, shopping_list_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (userId, weight, height, activityLevel, dietaryPreference, includeCheatMeal, bmi, diet_plan_json, exercise_plan_json, shopping_list_json)
+        )
+        new_plan_id = cursor.lastrowid
+        # The JSON columns hold each section as the Plan type serializes it, for splicing into responses.
+        insert_plan_parts(conn, new_plan_id, response_data)
+        bump_version(conn, userId)
+        conn.commit()
+        new_plan_row = conn.execute("SELECT * FROM diet_plans WHERE id = ?", (new_plan_id,)).fetchone()
+    dish_catalog.notify()
+    plan_dict = dict(new_plan_row)
+    plan_dict['generated_plan'] = response_data
+    return plan_dict
+
+
+# --- LLM Gateway ---
+# All OpenAI traffic goes through llm_gateway.py: one pooled client, RPM/TPM
+# token buckets (per worker), interactive requests ahead of plan generation,
+# jittered retries within a deadline and a circuit breaker.
+LLM_GATEWAY_SETTINGS = {
+    "rpm": int(os.getenv("LLM_RPM_LIMIT", "500")),
+    "tpm": int(os.getenv("LLM_TPM_LIMIT", "200000")),
+    "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+    "max_retries": int(os.getenv("LLM_MAX_RETRIES", "4")),
+    "request_timeout": float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "60")),
+    "interactive_deadline": float(os.getenv("LLM_INTERACTIVE_DEADLINE_SECONDS", "30")),
+    "bulk_deadline": float(os.getenv("LLM_BULK_DEADLINE_SECONDS", "180")),
+    "breaker_failures": int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    "breaker_reset_seconds": float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+}
+# The gateway does its own retries, so the SDK's are turned off.
+llm_gateway = LLMGateway(lambda: openai.OpenAI(api_key=openai.api_key, base_url=openai.base_url, max_retries=0),
+                         observer=observe_llm if INSTRUMENTATION_ENABLED else None, **LLM_GATEWAY_SETTINGS)
+LLM_BUSY_MESSAGE = "The meal planner is busy right now. Please try again in a minute."
+
+
+def chat_messages(system_prompt, user_prompt):
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+
+# --- Request Coalescing ---
+# Identical prompts already in flight share one upstream call (see
+# single_flight.py). "shared" coalesces across gunicorn workers through the
+# llm_inflight table, "process" only within a worker, and "off" disables it.
+# A lease is only taken over once it is older than any call the gateway can
+# still be running (the bulk deadline plus one attempt's timeout), so a live
+# leader is never duplicated by another worker.
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "shared")
+LLM_SINGLE_FLIGHT_LEASE_SECONDS = float(os.getenv(
+    "LLM_SINGLE_FLIGHT_LEASE_SECONDS", str(LLM_GATEWAY_SETTINGS["bulk_deadline"] + LLM_GATEWAY_SETTINGS["request_timeout"])))
+# A leader's error reaches the other workers as the same type, so they map it
+# to LLM_BUSY_MESSAGE too instead of failing with a generic error.
+# openai.RateLimitError can't be rebuilt without its HTTP response, so it
+# arrives as LLMGatewayError, which every resolver treats the same way.
+LLM_FLIGHT_ERRORS = {
+    "LLMGatewayError": LLMGatewayError, "CircuitOpenError": CircuitOpenError, "DeadlineExceededError": DeadlineExceededError,
+    "RateLimitError": LLMGatewayError,
+}
+llm_flight = SingleFlight(db_pool if LLM_SINGLE_FLIGHT == "shared" else None, lease_seconds=LLM_SINGLE_FLIGHT_LEASE_SECONDS, error_types=LLM_FLIGHT_ERRORS)
+
+
+def chat_completion(model, system_prompt, user_prompt, json_mode=False, priority=BULK, deadline=None):
+    """Returns the text of one chat completion; every OpenAI call in this module goes through here."""
+    def call():
+        options = {"response_format": {"type": "json_object"}} if json_mode else {}
+        return llm_gateway.complete(model, chat_messages(system_prompt, user_prompt), priority=priority, deadline=deadline, **options)
+    if LLM_SINGLE_FLIGHT == "off":
+        return call()
+    return llm_flight.do(make_cache_key(model, system_prompt, user_prompt), call)
+
+
+def stream_chat_completion(model, system_prompt, user_prompt):
+    """Yields a JSON-mode completion's text as it streams in; coalesced callers get it in one piece."""
+    def open_stream():
+        return llm_gateway.stream(model, chat_messages(system_prompt, user_prompt), response_format={"type": "json_object"})
+    if LLM_SINGLE_FLIGHT == "off":
+        return open_stream()
+    return llm_flight.stream(make_cache_key(model, system_prompt, user_prompt), open_stream)
+
+
+def complete_json(system_prompt, user_prompt, deadline=None):
+    """Runs one JSON-mode completion with the plan model and returns its text."""
+    return chat_completion(PLAN_MODEL, system_prompt, user_prompt, json_mode=True, deadline=deadline)
+
+
+# "single" asks for the whole week in one completion; "fanout" requests each
+# day and the exercise routine concurrently (see plan_fanout.py).
+PLAN_GENERATION_MODE = os.getenv("PLAN_GENERATION_MODE", "single")
+plan_fanout = FanOutPlanGenerator(
+    complete_json,
+    max_concurrency=int(os.getenv("PLAN_FANOUT_CONCURRENCY", "8")),
+    retries=int(os.getenv("PLAN_FANOUT_RETRIES", "2")),
+)
+
+
+def generate_plan_content(weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies=None):
+    """Returns (bmi, response_data) for a profile from the plan cache or the model, validated but not stored."""
+    bmi, system_prompt, user_prompt = build_plan_prompts(weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies)
+    cache_key = make_cache_key(PLAN_MODEL, system_prompt, user_prompt)
+    content = plan_cache.get(cache_key) if LLM_CACHE_ENABLED else None
+    from_cache = content is not None
+    if not from_cache:
+        # One deadline for the whole plan, shared by every fan-out part and its retries.
+        deadline = llm_gateway.deadline(BULK)
+        if PLAN_GENERATION_MODE == "fanout":
+            content = json.dumps(plan_fanout.generate(bmi, activityLevel, dietaryPreference, allergies, includeCheatMeal, deadline=deadline))
+        else:
+            content = complete_json(system_prompt, user_prompt, deadline=deadline)
+    response_data = json.loads(content)
+    validate_plan(response_data)
+    # Only validated completions are cached; a hit still becomes a new plan row.
+    if LLM_CACHE_ENABLED and not from_cache:
+        plan_cache.put(cache_key, content)
+    return bmi, response_data
+
+
+def generate_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies=None):
+    """
+    Generates a plan with the model (or the plan cache), stores it in diet_plans
+    and returns the new row as a dict. Shared by the generateDietPlan mutation
+    and the background job queue; errors propagate to the caller.
+    """
+    bmi, response_data = generate_plan_content(weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies)
+    return store_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, bmi, response_data)
+
+
+def stream_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies=None):
+    """
+    Streaming variant of generate_diet_plan. Yields ("day", DayPlan) as each
+    day of the completion closes, then ("exercises", [...]), ("shoppingList", [...])
+    and finally ("dietPlan", row) once the plan has been validated and stored.
+    """
+    bmi, system_prompt, user_prompt = build_plan_prompts(weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies)
+    cache_key = make_cache_key(PLAN_MODEL, system_prompt, user_prompt)
+    content = plan_cache.get(cache_key) if LLM_CACHE_ENABLED else None
+    from_cache = content is not None
+    parser = IncrementalPlanParser()
+    if from_cache:
+        yield from parser.feed(content)
+    else:
+        for text in stream_chat_completion(PLAN_MODEL, system_prompt, user_prompt):
+            yield from parser.feed(text)
+        content = parser.text()
+    response_data = json.loads(content)
+    validate_plan(response_data)
+    if LLM_CACHE_ENABLED and not from_cache:
+        plan_cache.put(cache_key, content)
+    yield ("dietPlan", store_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, bmi, response_data))
+
+
+# --- Background Plan Jobs ---
+# requestDietPlan enqueues here so no request thread waits on OpenAI.
+plan_jobs = PlanJobQueue(
+    db_pool,
+    handler=lambda **params: generate_diet_plan(**params)['id'],
+    max_workers=int(os.getenv("PLAN_JOB_WORKERS", "2")),
+)
+
+
+def start_background_work():
+    """
+    Starts this worker's background work once the app is up: called from
+    gunicorn.conf.py's post_worker_init, asgi_server's lifespan and the dev
+    server. Not run at import, so init_db and the benchmarks never start it.
+    """
+    plan_jobs.start()
+    if SWAP_CATALOG_ENABLED:
+        dish_catalog.start(SWAP_CATALOG_REFRESH_SECONDS)
+
+
+# --- Batch Plan Generation ---
+def describe_batch_error(error):
+    """Per-item message for generateDietPlans; details go to the logs, as for generateDietPlan."""
+    if isinstance(error, (LLMGatewayError, openai.RateLimitError)):
+        return LLM_BUSY_MESSAGE
+    print(f"generateDietPlans item failed: {type(error).__name__}: {error}")
+    return "Plan generation failed. Please check the backend logs for details."
+
+
+plan_batch = BatchPlanGenerator(
+    db_pool, generate_plan_content,
+    max_parallel=int(os.getenv("PLAN_BATCH_CONCURRENCY", "4")),
+    describe_error=describe_batch_error,
+)
+PLAN_BATCH_MAX_PROFILES = int(os.getenv("PLAN_BATCH_MAX_PROFILES", "200"))
+
+
 # --- Ariadne Type Definitions ---
 query = QueryType()
 mutation = MutationType()
+plan_job = ObjectType("PlanJob")
+user_dashboard = ObjectType("UserDashboard")
+diet_plan = ObjectType("DietPlan")
+plan_type = ObjectType("Plan")
+day_plan = ObjectType("DayPlan")
 
 # --- Resolvers ---
 @mutation.field("registerUser")
 def resolve_register_user(_, info, username, password):
-    conn = get_db_connection()
-    try:
-        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hash_password(password)))
-        conn.commit()
-        user_data = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
-        return {"success": True, "message": "Registration successful!", "user": dict(user_data)}
-    except sqlite3.IntegrityError:
-        return {"success": False, "message": "Username already exists."}
-    finally:
-        conn.close()
+    with db_pool.connection() as conn:
+        try:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hash_password(password)))
+            conn.commit()
+            user_data = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+            return {"success": True, "message": "Registration successful!", "user": dict(user_data)}
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return {"success": False, "message": "Username already exists."}
 
 @mutation.field("loginUser")
 def resolve_login_user(_, info, username, password):
-    conn = get_db_connection()
-    user_data = conn.execute("SELECT * FROM users WHERE username = ? AND password_hash = ?", (username, hash_password(password))).fetchone()
-    conn.close()
+    with db_pool.connection() as conn:
+        user_data = conn.execute("SELECT * FROM users WHERE username = ? AND password_hash = ?", (username, hash_password(password))).fetchone()
     if user_data:
         return {"success": True, "message": "Login successful!", "user": dict(user_data)}
     return {"success": False, "message": "Invalid username or password."}
 
 @query.field("getUserDashboard")
 def resolve_get_user_dashboard(_, info, userId):
-    conn = get_db_connection()
-    plans_cursor = conn.execute("SELECT * FROM diet_plans WHERE user_id = ? ORDER BY created_at DESC", (userId,))
-    past_plans = []
-    for row in plans_cursor.fetchall():
-        plan_dict = dict(row)
-        plan_dict['generated_plan'] = {
-            'diet': json.loads(plan_dict['generated_plan_json']),
-            'exercises': json.loads(plan_dict['exercise_plan_json']),
-            'shoppingList': json.loads(plan_dict['shopping_list_json'])
-        }
-        past_plans.append(plan_dict)
-    progress_cursor = conn.execute("SELECT weight_kg, log_date FROM user_progress WHERE user_id = ? ORDER BY log_date ASC", (userId,))
-    progress_history = [dict(row) for row in progress_cursor.fetchall()]
-    conn.close()
-    return {"pastPlans": past_plans, "progressHistory": progress_history}
+    # Each section is loaded by its own field resolver, only when selected.
+    return {"user_id": userId}
+
+@user_dashboard.field("pastPlans")
+def resolve_dashboard_past_plans(dashboard, info):
+    with db_pool.connection() as conn:
+        plans_cursor = conn.execute(f"SELECT {', '.join(plan_columns(info))} FROM diet_plans WHERE user_id = ? ORDER BY created_at DESC, id DESC", (dashboard["user_id"],))
+        plans = [dict(row) for row in plans_cursor.fetchall()]
+    request_loaders(info).expect_plans(plans)
+    return plans
+
+@user_dashboard.field("pastPlansConnection")
+def resolve_dashboard_past_plans_connection(dashboard, info, first=10, after=None):
+    first = max(0, min(first, MAX_PAGE_SIZE["plans"]))
+    columns = plan_columns(info, node_selection(info))
+    if "created_at" not in columns:
+        columns.append("created_at")
+    sql = f"SELECT {', '.join(columns)} FROM diet_plans WHERE user_id = ?"
+    params = [dashboard["user_id"]]
+    if after:
+        created_at, plan_id = decode_cursor(after)
+        sql += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+        params += [created_at, created_at, plan_id]
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    with db_pool.connection() as conn:
+        rows = [dict(row) for row in conn.execute(sql, (*params, first + 1)).fetchall()]
+    request_loaders(info).expect_plans(rows[:first])
+    return make_connection(rows, first, lambda plan: (plan["created_at"], plan["id"]))
+
+@user_dashboard.field("progressHistoryConnection")
+def resolve_dashboard_progress_history_connection(dashboard, info, first=100, after=None):
+    first = max(0, min(first, MAX_PAGE_SIZE["progress"]))
+    sql = "SELECT weight_kg, log_date FROM user_progress WHERE user_id = ?"
+    params = [dashboard["user_id"]]
+    if after:
+        (log_date,) = decode_cursor(after)
+        sql += " AND log_date > ?"
+        params.append(log_date)
+    sql += " ORDER BY log_date ASC LIMIT ?"
+    with db_pool.connection() as conn:
+        rows = [dict(row) for row in conn.execute(sql, (*params, first + 1)).fetchall()]
+    return make_connection(rows, first, lambda entry: (entry["log_date"],))
+
+@user_dashboard.field("progressAnalytics")
+def resolve_dashboard_progress_analytics(dashboard, info, targetPoints=120, method="auto", windowDays=7, trendDays=90, goalWeights=None):
+    if method not in ANALYTICS_METHODS:
+        raise GraphQLError(f"method must be one of: {', '.join(ANALYTICS_METHODS)}.")
+    options = {
+        "target_points": max(3, min(targetPoints, MAX_ANALYTICS_POINTS)), "method": method,
+        "window_days": max(1, min(windowDays, 365)), "trend_days": max(2, min(trendDays, 3650)),
+        "goal_weights": list(goalWeights or []),
+    }
+    cache_key = json.dumps([str(dashboard["user_id"]), options])
+    with db_pool.connection() as conn:
+        # Version first: a logWeight landing in between only files fresh data under a stale version, which the next read skips.
+        version = current_version(conn, dashboard["user_id"])
+        analytics = progress_analytics_cache.get(cache_key, version)
+        if analytics is None:
+            analytics = compute_analytics(*load_history(conn, dashboard["user_id"]), **options)
+            progress_analytics_cache.put(cache_key, version, analytics)
+    return analytics
+
+@query.field("getPlan")
+def resolve_get_plan(_, info, id):
+    return request_loaders(info).plans.load(int(id)) if str(id).isdigit() else None
+
+@user_dashboard.field("progressHistory")
+def resolve_dashboard_progress_history(dashboard, info):
+    with db_pool.connection() as conn:
+        progress_cursor = conn.execute("SELECT weight_kg, log_date FROM user_progress WHERE user_id = ? ORDER BY log_date ASC", (dashboard["user_id"],))
+        return [dict(row) for row in progress_cursor.fetchall()]
+
+@diet_plan.field("generated_plan")
+def resolve_diet_plan_generated_plan(plan, info):
+    # Freshly generated plans carry their parts; stored ones load each section on demand.
+    return plan.get("generated_plan") or {"plan_id": plan["id"]}
+
+def resolve_plan_section(plan, info, field):
+    if field in plan:
+        return plan[field]
+    loaders = request_loaders(info)
+    # A full selection is answered with the stored JSON, which is already in the response's shape.
+    if can_splice(info, PLAN_JSON_SHAPES[field]):
+        text = loaders.plan_json[field].load(plan["plan_id"])
+        if text is not None:
+            return splice(info, text)
+    return loaders.sections[field].load(plan["plan_id"])
+
+@plan_type.field("diet")
+def resolve_plan_diet(plan, info):
+    return resolve_plan_section(plan, info, "diet")
+
+@plan_type.field("exercises")
+def resolve_plan_exercises(plan, info):
+    return resolve_plan_section(plan, info, "exercises")
+
+@plan_type.field("shoppingList")
+def resolve_plan_shopping_list(plan, info):
+    return resolve_plan_section(plan, info, "shoppingList")
+
+# Stored days carry the totals rolled up at write time; fresh plans are summed here.
+@day_plan.field("totals")
+def resolve_day_plan_totals(day, info):
+    return day.get("totals") or day_totals(day)
+
+@day_plan.field("calories_consistent")
+def resolve_day_plan_calories_consistent(day, info):
+    return calories_consistent(day["daily_calories"], resolve_day_plan_totals(day, info)["calories"])
+
+@diet_plan.field("weeklyTotals")
+def resolve_diet_plan_weekly_totals(plan, info):
+    return request_loaders(info).weekly_totals.load(plan["id"])
+
+@diet_plan.field("user")
+def resolve_diet_plan_user(plan, info):
+    return request_loaders(info).users.load(plan["user_id"])
 
 @mutation.field("logWeight")
 def resolve_log_weight(_, info, userId, weight, date):
-    conn = get_db_connection()
     try:
-        conn.execute("INSERT OR REPLACE INTO user_progress (user_id, weight_kg, log_date) VALUES (?, ?, ?)", (userId, weight, date))
-        conn.commit()
-        return {"success": True, "message": "Weight logged successfully!"}
-    except Exception as e:
+        date = parse_log_date(date)
+    except ValueError as e:
         return {"success": False, "message": str(e)}
-    finally:
-        conn.close()
+    with db_pool.connection() as conn:
+        try:
+            conn.execute("INSERT OR REPLACE INTO user_progress (user_id, weight_kg, log_date) VALUES (?, ?, ?)", (userId, weight, date))
+            bump_version(conn, userId)
+            conn.commit()
+            return {"success": True, "message": "Weight logged successfully!"}
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": str(e)}
+
+@mutation.field("importWeights")
+def resolve_import_weights(_, info, userId, entries):
+    result = run_progress_import(userId, parse_entries(entries))
+    return {"success": result["success"], "message": result["message"], "imported": result.get("imported", 0), "rejected": result.get("rejected", 0), "errors": result.get("errors", [])}
 
 @mutation.field("generateDietPlan")
 def resolve_generate_diet_plan(_, info, userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies):
     if not openai.api_key:
          return {"success": False, "message": "OpenAI API key is not configured. Please check your .env file."}
     try:
-        height_in_meters = height / 100
-        bmi = round(weight / (height_in_meters * height_in_meters), 1)
-        system_prompt = """
-        You are an expert nutritionist and fitness coach specializing in South Indian cuisine. 
-        Your task is to generate a comprehensive 7-day health plan.
-        You MUST return a single, valid JSON object and nothing else. The JSON object must have three top-level keys: "diet", "exercises", and "shoppingList".
-        The structure MUST be as follows:
-        { "diet": [ { "day": "Monday", "daily_calories": integer, "meals": [ { "name": "Breakfast" | "Lunch" | "Snack" | "Dinner", "dish": "Dish Name", "quantity": "Serving size, e.g., '1 cup' or '2 rotis'", "nutrition": { "calories": integer, "protein_g": integer, "carbs_g": integer, "fat_g": integer } } ] } ], "exercises": [ { "day": "Monday", "activity": "Suggested activity, e.g., '30-minute brisk walk'" } ], "shoppingList": [ { "category": "e.g., Vegetables", "items": ["item1", "item2"] } ] }
-        Do not include any text, explanations, or markdown formatting outside of this single JSON object.
-        """
-        allergies_text = f"The user is allergic to the following and these ingredients must be completely avoided: {', '.join(allergies)}." if allergies else "The user has no listed allergies."
-        user_prompt = f"""
-        Please generate a comprehensive 7-day health plan based on the following user details:
-        - Cuisine Style: Andhra & Telangana
-        - User BMI: {bmi}
-        - Activity Level: '{activityLevel}'
-        - Dietary Preference: '{dietaryPreference}'
-        - Allergies: {allergies_text}
-        - Include a cheat meal this week: {'Yes' if includeCheatMeal else 'No'}
-        CRITICAL INSTRUCTION: All suggested dishes in the diet plan MUST be authentic and traditional dishes from the Andhra or Telangana regions of India. Do not include generic or North Indian dishes.
-        Ensure the plan is balanced, varied, and appropriate for the user's profile.
-        """
-        completion = openai.chat.completions.create(model="gpt-3.5-turbo-1106", response_format={"type": "json_object"}, messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}])
-        response_data = json.loads(completion.choices[0].message.content)
-        if 'diet' not in response_data or 'exercises' not in response_data or 'shoppingList' not in response_data:
-            raise KeyError("AI response is missing required keys.")
-        diet_plan_json = json.dumps(response_data['diet'])
-        exercise_plan_json = json.dumps(response_data['exercises'])
-        shopping_list_json = json.dumps(response_data['shoppingList'])
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO diet_plans (user_id, weight_kg, height_cm, activity_level, dietary_preference, include_cheat_meal, bmi, generated_plan_json, exercise_plan_json, shopping_list_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (userId, weight, height, activityLevel, dietaryPreference, includeCheatMeal, bmi, diet_plan_json, exercise_plan_json, shopping_list_json)
-        )
-        new_plan_id = cursor.lastrowid
-        conn.commit()
-        new_plan_row = conn.execute("SELECT * FROM diet_plans WHERE id = ?", (new_plan_id,)).fetchone()
-        conn.close()
-        plan_dict = dict(new_plan_row)
-        plan_dict['generated_plan'] = response_data
+        plan_dict = generate_diet_plan(userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies)
         return {"success": True, "message": "Comprehensive plan generated!", "dietPlan": plan_dict}
+    except (LLMGatewayError, openai.RateLimitError) as e:
+        print(f"generateDietPlan: LLM unavailable: {e}")
+        return {"success": False, "message": LLM_BUSY_MESSAGE}
     except Exception as e:
         print(f"--- ERROR in generateDietPlan ---")
         print(f"Error Type: {type(e).__name__}")
@@ -235,69 +684,417 @@ def resolve_generate_diet_plan(_, info, userId, weight, height, activityLevel, i
         print(f"---------------------------------")
         return {"success": False, "message": f"A server error occurred. Please check the backend logs for details."}
 
-@mutation.field("swapMeal")
-def resolve_swap_meal(_, info, mealName, dishToSwap, dietaryPreference):
-    if not openai.api_key: return None
-    try:
-        system_prompt = f"""
-        You are an expert nutritionist. Your task is to suggest an alternative for a single meal.
-        You MUST return a single JSON object for the meal, with no other text.
-        The required structure is: 
+@mutation.field("requestDietPlan")
+def resolve_request_diet_plan(_, info, userId, weight, height, activityLevel, includeCheatMeal, dietaryPreference, allergies=None):
+    if not openai.api_key:
+         return {"success": False, "message": "OpenAI API key is not configured. Please check your .env file."}
+    params = {
+        "userId": userId, "weight": weight, "height": height, "activityLevel": activityLevel,
+        "includeCheatMeal": includeCheatMeal, "dietaryPreference": dietaryPreference, "allergies": allergies,
+    }
+    job = plan_jobs.enqueue(userId, params)
+    return {"success": True, "message": "Your plan is being generated.", "job": job}
+
+@mutation.field("generateDietPlans")
+def resolve_generate_diet_plans(_, info, profiles):
+    if not openai.api_key:
+        return {"success": False, "message": "OpenAI API key is not configured. Please check your .env file.", "total": len(profiles), "succeeded": 0, "failed": len(profiles), "uniqueProfiles": 0, "items": []}
+    if len(profiles) > PLAN_BATCH_MAX_PROFILES:
+        return {"success": False, "message": f"A batch can hold at most {PLAN_BATCH_MAX_PROFILES} profiles.", "total": len(profiles), "succeeded": 0, "failed": len(profiles), "uniqueProfiles": 0, "items": []}
+    summary = plan_batch.run(profiles)
+    if summary["succeeded"]:
+        dish_catalog.notify()
+    request_loaders(info).users.expect({item["dietPlan"]["user_id"] for item in summary["items"] if item["dietPlan"]})
+    message = f"{summary['succeeded']} of {summary['total']} plans generated."
+    return {"success": summary["failed"] == 0, "message": message, **summary}
+
+@query.field("getPlanJob")
+def resolve_get_plan_job(_, info, jobId):
+    return plan_jobs.get(jobId)
+
+@plan_job.field("dietPlan")
+def resolve_plan_job_diet_plan(job, info):
+    if not job.get("plan_id"):
+        return None
+    return request_loaders(info).plans.load(job["plan_id"])
+
+def build_swap_prompts(mealName, dishToSwap, dietaryPreference):
+    system_prompt = f"""
+    You are an expert nutritionist. Your task is to suggest {SWAP_BATCH_SIZE} different alternatives for a single meal.
+    You MUST return a single JSON object with one key, "alternatives", with no other text.
+    The required structure is: 
+    {{ "alternatives": [
         {{
             "name": "{mealName}", 
             "dish": "New Dish Name", 
             "quantity": "New quantity", 
             "nutrition": {{ "calories": integer, "protein_g": integer, "carbs_g": integer, "fat_g": integer }}
         }}
-        """
-        user_prompt = f"""
-        Suggest a different but nutritionally similar dish to replace '{dishToSwap}' for '{mealName}'.
-        The new dish must be strictly '{dietaryPreference}'.
-        CRITICAL INSTRUCTION: The new dish MUST be an authentic and traditional dish from the Andhra or Telangana regions of India.
-        """
-        completion = openai.chat.completions.create(
-            model="gpt-3.5-turbo-1106", 
-            response_format={"type": "json_object"}, 
-            messages=[
-                {"role": "system", "content": system_prompt}, 
-                {"role": "user", "content": user_prompt}
-            ]
-        )
-        return json.loads(completion.choices[0].message.content)
+    ] }}
+    """
+    user_prompt = f"""
+    Suggest {SWAP_BATCH_SIZE} different but nutritionally similar dishes to replace '{dishToSwap}' for '{mealName}'.
+    Every new dish must be strictly '{dietaryPreference}'.
+    CRITICAL INSTRUCTION: Every new dish MUST be an authentic and traditional dish from the Andhra or Telangana regions of India.
+    """
+    return system_prompt, user_prompt
+
+def take_swap_candidate(cache_key, content, dishToSwap):
+    """Returns the first usable alternative from a swap completion and caches the rest."""
+    response_data = json.loads(content)
+    # Tolerate a bare meal object in place of the requested list.
+    candidates = response_data.get("alternatives", [response_data])
+    candidates = [meal for meal in candidates if meal.get("dish") and plausible_nutrition(meal.get("nutrition") or {}) and meal["dish"] != dishToSwap]
+    if not candidates:
+        return None
+    swap_cache.put_batch(cache_key, candidates[1:])
+    return candidates[0]
+
+def catalog_swap(cache_key, mealName, dishToSwap, dietaryPreference):
+    """Returns the closest catalogue dish and caches the next ones, or None if the catalogue has no good candidate."""
+    if not SWAP_CATALOG_ENABLED:
+        return None
+    candidates = dish_catalog.similar(dishToSwap, mealName, dietaryPreference, limit=SWAP_BATCH_SIZE)
+    if not candidates:
+        return None
+    swap_cache.put_batch(cache_key, candidates[1:])
+    return candidates[0]
+
+@mutation.field("swapMeal")
+def resolve_swap_meal(_, info, mealName, dishToSwap, dietaryPreference):
+    cache_key = swap_cache.make_key(mealName, dishToSwap, dietaryPreference)
+    cached_meal = swap_cache.next_candidate(cache_key) or catalog_swap(cache_key, mealName, dishToSwap, dietaryPreference)
+    if cached_meal:
+        return cached_meal
+    if not openai.api_key: return None
+    try:
+        system_prompt, user_prompt = build_swap_prompts(mealName, dishToSwap, dietaryPreference)
+        content = chat_completion("gpt-3.5-turbo-1106", system_prompt, user_prompt, json_mode=True, priority=INTERACTIVE)
+        return take_swap_candidate(cache_key, content, dishToSwap)
     except Exception as e:
         print(f"An unexpected error occurred during swap: {e}")
         return None
 
+RECIPE_MODEL = "gpt-3.5-turbo"
+RECIPE_SYSTEM_PROMPT = "You are a chef. Provide a simple, easy-to-follow recipe for the given dish. Return the recipe as a single string."
+
 @mutation.field("getRecipe")
 def resolve_get_recipe(_, info, dishName):
+    cached_recipe = recipe_store.get(dishName)
+    if cached_recipe is not None:
+        return cached_recipe
     if not openai.api_key: return "API key not configured."
     try:
-        system_prompt = "You are a chef. Provide a simple, easy-to-follow recipe for the given dish. Return the recipe as a single string."
-        user_prompt = f"What is the recipe for '{dishName}'?"
-        completion = openai.chat.completions.create(model="gpt-3.5-turbo", messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}])
-        return completion.choices[0].message.content
+        recipe = chat_completion(RECIPE_MODEL, RECIPE_SYSTEM_PROMPT, f"What is the recipe for '{dishName}'?", priority=INTERACTIVE)
+        recipe_store.put(dishName, recipe)
+        return recipe
+    except (LLMGatewayError, openai.RateLimitError) as e:
+        print(f"getRecipe: LLM unavailable: {e}")
+        return LLM_BUSY_MESSAGE
     except Exception as e:
         print(f"An unexpected error during recipe fetch: {e}")
         return "Sorry, I couldn't fetch the recipe at this time."
 
 # --- Flask App Setup ---
 app = Flask(__name__)
-schema = make_executable_schema(type_defs, query, mutation)
+schema = make_executable_schema(type_defs, query, mutation, plan_job, user_dashboard, diet_plan, plan_type, day_plan)
+if INSTRUMENTATION_ENABLED:
+    time_resolvers(schema)
 explorer = ExplorerGraphiQL()
 
+# --- Persisted Queries ---
+# Parsed and validated documents are cached by the sha256 of their text, and
+# clients may send just the hash (see persisted_queries.py). With
+# PERSISTED_QUERIES_ALLOWLIST=1 only queries in the manifest are executed.
+query_documents = DocumentCache(max_entries=int(os.getenv("QUERY_DOCUMENT_CACHE_SIZE", "512")))
+PERSISTED_QUERIES_MANIFEST = os.getenv("PERSISTED_QUERIES_MANIFEST")
+persisted_queries = PersistedQueries(
+    schema, query_documents,
+    manifest=PersistedQueries.load_manifest(PERSISTED_QUERIES_MANIFEST) if PERSISTED_QUERIES_MANIFEST else None,
+    allowlist=os.getenv("PERSISTED_QUERIES_ALLOWLIST", "0") == "1",
+)
+
+# --- Query Cost Limits ---
+# Documents are priced before execution (see query_cost.py): object fields
+# cost 1, lists multiply their items, and the LLM-backed mutations cost the
+# most. Documents over QUERY_COST_MAX or QUERY_DEPTH_MAX are refused, and each
+# user (by userId argument or X-User-Id header, else client address) may spend
+# QUERY_COST_BUDGET_PER_MINUTE. A dashboard answered with a 304 or from the
+# response cache runs nothing, so it is charged only QUERY_COST_CACHED.
+QUERY_COST_ENABLED = os.getenv("QUERY_COST_ENABLED", "1") == "1"
+QUERY_COST_CACHED = int(os.getenv("QUERY_COST_CACHED", "1"))
+QUERY_COST_WEIGHTS = {
+    "Mutation.generateDietPlan": 1000,
+    "Mutation.requestDietPlan": 1000,
+    "Mutation.swapMeal": 200,
+    "Mutation.getRecipe": 200,
+    # Per profile: batches run in the bulk lane and share completions between identical profiles.
+    "Mutation.generateDietPlans": 20,
+    "UserDashboard.progressAnalytics": 20,
+}
+QUERY_COST_LIST_SIZES = {
+    "UserDashboard.pastPlans": MAX_PAGE_SIZE["plans"], "UserDashboard.progressHistory": 365, "ProgressAnalytics.points": 120,
+    "DietPlanConnection.edges": 1, "ProgressEntryConnection.edges": 1, "BatchPlanResponse.items": 1,
+    "Plan.diet": 7, "DayPlan.meals": 5, "Plan.exercises": 7, "Plan.shoppingList": 8,
+}
+query_cost = QueryCostAnalyzer(
+    schema,
+    weights=QUERY_COST_WEIGHTS,
+    list_sizes=QUERY_COST_LIST_SIZES,
+    size_arguments={
+        "UserDashboard.pastPlansConnection": ("first", MAX_PAGE_SIZE["plans"]),
+        "UserDashboard.progressHistoryConnection": ("first", MAX_PAGE_SIZE["progress"]),
+        "Mutation.generateDietPlans": ("profiles", PLAN_BATCH_MAX_PROFILES),
+    },
+    max_cost=int(os.getenv("QUERY_COST_MAX", "5000")),
+    max_depth=int(os.getenv("QUERY_DEPTH_MAX", "10")),
+    budget_per_minute=int(os.getenv("QUERY_COST_BUDGET_PER_MINUTE", "10000")),
+)
+
+def price_query(data, document, user_header, address):
+    """
+    Prices a parsed request without charging it. Returns (report for
+    extensions.cost, budget client), or (None, None) if it is not priced.
+    """
+    if not QUERY_COST_ENABLED or document is None:
+        return None, None
+    variables = data.get("variables") if isinstance(data.get("variables"), dict) else None
+    operation_name = data.get("operationName")
+    client = operation_client(document, variables, operation_name, user_header, address)
+    with span("cost"):
+        return query_cost.price(document, variables, operation_name), client
+
+def charge_query(cost, client, cached=False):
+    """Charges a priced request: QUERY_COST_CACHED if it is answered with a 304 or a cached body, else its full cost."""
+    if cost is not None:
+        query_cost.charge(cost, client, QUERY_COST_CACHED if cached else None)
+
+def report_cost(result, context):
+    if context.get("cost"):
+        result.setdefault("extensions", {})["cost"] = context["cost"]
+
 @app.route("/graphql", methods=["GET"])
 def graphql_playground():
     return explorer.html(None), 200
 
 @app.route("/graphql", methods=["POST"])
 def graphql_server():
+    try:
+        with span("parse"):
+            data, document = persisted_queries.resolve(request.get_json())
+        cost, client = price_query(data, document, request.headers.get(USER_HEADER), request.remote_addr)
+        # The dashboard cache charges its own requests, so a 304 or cached body costs only QUERY_COST_CACHED.
+        cached = cached_dashboard_response(data, document, cost, client) if DASHBOARD_CACHE_ENABLED and document else None
+        if cached is None:
+            charge_query(cost, client)
+    except (PersistedQueryError, QueryCostError) as error:
+        return jsonify({"errors": [error.formatted]}), 200
+    if cached is not None:
+        return cached
+    context = graphql_context(request, cost)
+    success, result = run_graphql(data, document, context)
+    return graphql_response(serialize(result, context), 200 if success else 400)
+
+def graphql_context(request, cost=None):
+    """Context value of one execution: the encoder's spliced JSON, the request's data loaders and its cost report."""
+    context = response_encoder.context(request)
+    context["loaders"] = PlanLoaders(db_pool)
+    context["cost"] = cost
+    return context
+
+def run_graphql(data, document, context):
+    with span("execute"):
+        success, result = graphql_sync(schema, data, context_value=context, debug=app.debug,
+                                       query_document=document, query_validator=query_documents.validate)
+    report_cost(result, context)
+    return success, result
+
+def serialize(result, context):
+    with span("serialize"):
+        return response_encoder.dumps(result, context)
+
+def graphql_response(body, status=200, headers=None):
+    """Sends a serialized GraphQL result, compressed if the client accepts it."""
+    with span("compress"):
+        body, headers = response_encoder.encode(body, request.headers.get("Accept-Encoding"), headers)
+    return Response(body, status=status, mimetype="application/json", headers=headers)
+
+def cached_dashboard_response(data, document, cost=None, client=None):
+    """
+    Serves getUserDashboard-only queries from dashboard_cache: 304 when the
+    client's If-None-Match still matches, the cached body when the user's
+    version is unchanged, otherwise a fresh result that is cached for next time.
+    Charges the request's cost accordingly (see charge_query). Returns None
+    for every other request.
+    """
+    variables = data.get("variables") or {}
+    operation_name = data.get("operationName")
+    if not isinstance(variables, dict):
+        return None
+    user_id = dashboard_user_id(document, variables, operation_name)
+    if user_id is None:
+        return None
+    request_key = make_request_key(document, variables, operation_name)
+    with db_pool.connection() as conn:
+        version = current_version(conn, user_id)
+    etag = make_etag(user_id, version, request_key)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("If-None-Match", ""):
+        charge_query(cost, client, cached=True)
+        dashboard_cache.record_not_modified()
+        return Response(status=304, headers=headers)
+    body = dashboard_cache.get(request_key, version)
+    if body is not None:
+        charge_query(cost, client, cached=True)
+    else:
+        charge_query(cost, client)
+        context = graphql_context(request, cost)
+        success, result = run_graphql(data, document, context)
+        body = serialize(result, context)
+        if not success:
+            return graphql_response(body, 400)
+        if "errors" not in result:
+            dashboard_cache.put(request_key, version, body)
+    return graphql_response(body, headers=headers)
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({"dashboard": dashboard_cache.stats(), "llm": plan_cache.stats(), "query_documents": query_documents.stats(), "llm_single_flight": llm_flight.stats(), "llm_gateway": llm_gateway.stats(), "progress_analytics": progress_analytics_cache.stats(), "query_cost": query_cost.stats(), "dish_catalog": dish_catalog.stats()})
+
+# --- Metrics and Request Tracing ---
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.before_request
+def start_request_trace():
+    if not INSTRUMENTATION_ENABLED:
+        return
+    g.trace, g.trace_token = begin_request(request.method, request.url_rule.rule if request.url_rule else "unmatched")
+    g.profile = request_profiler.start(request.headers.get(RequestProfiler.HEADER))
+
+@app.after_request
+def finish_request_trace(response):
+    """Records the request's latency; for a streamed response, up to its first byte."""
+    trace = g.pop("trace", None)
+    if trace is None:
+        return response
+    seconds = end_request(trace, response.status_code, SLOW_REQUEST_MS)
+    profile = g.pop("profile", None)
+    if profile is not None:
+        response.headers["X-Profile-File"] = request_profiler.finish(profile, f"{trace.method} {trace.route} {seconds * 1000:.0f}ms")
+    return response
+
+@app.teardown_request
+def detach_request_trace(error):
+    token = g.pop("trace_token", None)
+    if token is None:
+        return
+    detach_request(token)
+    # Left over only when an exception escaped without a response (debug mode).
+    trace, profile = g.pop("trace", None), g.pop("profile", None)
+    if trace is not None:
+        end_request(trace, 500, SLOW_REQUEST_MS)
+    if profile is not None:
+        request_profiler.finish(profile, f"{trace.method} {trace.route} failed")
+
+# --- Weight Log Import/Export ---
+PROGRESS_IMPORT_BATCH_SIZE = int(os.getenv("PROGRESS_IMPORT_BATCH_SIZE", "10000"))
+# Uploads are read in full before the import transaction starts, in memory up
+# to this size and in a temporary file beyond it, so a slow client never
+# holds SQLite's write lock.
+PROGRESS_IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+def run_progress_import(user_id, parsed):
+    """Imports parsed weight rows for one user; returns the JSON summary shared by every import path."""
+    with db_pool.connection() as conn:
+        if conn.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone() is None:
+            return {"success": False, "message": "User not found."}
+        try:
+            report = import_progress(conn, user_id, parsed, batch_size=PROGRESS_IMPORT_BATCH_SIZE)
+        except ValueError as e:
+            # A malformed upload (bad header, wrong encoding) rolls back the whole import.
+            return {"success": False, "message": f"Could not read the upload: {e}"}
+    message = f"Imported {report.imported} weight entries" + (f", rejected {report.rejected}." if report.rejected else ".")
+    return {"success": True, "message": message, **report.as_dict()}
+
+def parse_upload(binary_stream, fmt):
+    """Wraps a binary upload stream in the row parser for `fmt`, decoding as it reads."""
+    text = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    return parse_csv(text) if fmt == "csv" else parse_ndjson(text)
+
+@app.route("/progress/import", methods=["POST"])
+def import_progress_upload():
+    """
+    Bulk weight import. Takes ?userId= and either a multipart "file" field or
+    the raw request body, as CSV (date,weight header) or NDJSON; ?format=
+    overrides the detection from the file name or Content-Type.
+    """
+    user_id = request.args.get("userId")
+    upload = request.files.get("file")
+    fmt = request.args.get("format") or detect_format(upload.content_type if upload else request.content_type, upload.filename if upload else None)
+    if not user_id or fmt not in FORMATS:
+        return jsonify({"success": False, "message": "Pass ?userId= and a csv or ndjson upload."}), 400
+    with tempfile.SpooledTemporaryFile(max_size=PROGRESS_IMPORT_SPOOL_BYTES) as body:
+        shutil.copyfileobj(upload.stream if upload else request.stream, body)
+        body.seek(0)
+        result = run_progress_import(user_id, parse_upload(body, fmt))
+    return jsonify(result), 200 if result["success"] else 400
+
+@app.route("/progress/export", methods=["GET"])
+def export_progress_download():
+    """Streams ?userId='s whole weight history as CSV (default) or ?format=ndjson."""
+    user_id = request.args.get("userId")
+    fmt = request.args.get("format", "csv")
+    if not user_id or fmt not in FORMATS:
+        return jsonify({"success": False, "message": "Pass ?userId= and format=csv or ndjson."}), 400
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="weight-history-{user_id}.{fmt}"'}
+    return Response(export_progress(db_pool, user_id, fmt), mimetype=mimetype, headers=headers)
+
+@app.route("/plans/stream", methods=["POST"])
+def stream_plan():
+    """
+    Server-sent events version of generateDietPlan. Takes the same arguments as
+    JSON and emits one "day" event per finished day, then "exercises",
+    "shoppingList" and a final "dietPlan" summary of the stored row.
+    """
+    if not openai.api_key:
+        return jsonify({"success": False, "message": "OpenAI API key is not configured. Please check your .env file."}), 503
     data = request.get_json()
-    success, result = graphql_sync(schema, data, context_value=request, debug=app.debug)
-    status_code = 200 if success else 400
-    return jsonify(result), status_code
+    try:
+        plan_args = (
+            data["userId"], float(data["weight"]), float(data["height"]), data["activityLevel"],
+            bool(data["includeCheatMeal"]), data["dietaryPreference"], data.get("allergies"),
+        )
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"success": False, "message": "Missing or invalid plan arguments."}), 400
+    return Response(stream_with_context(sse_events(plan_args)), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def sse_message(event, payload):
+    """One stream_diet_plan event as a server-sent event; shared with asgi_server.py."""
+    if event == "dietPlan":
+        payload = {key: payload[key] for key in ("id", "created_at", "weight_kg", "bmi", "dietary_preference")}
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def sse_events(plan_args):
+    """Formats stream_diet_plan's events as server-sent events."""
+    try:
+        for event, payload in stream_diet_plan(*plan_args):
+            yield sse_message(event, payload)
+    except (LLMGatewayError, openai.RateLimitError) as e:
+        print(f"plan stream: LLM unavailable: {e}")
+        yield f"event: error\ndata: {json.dumps({'message': LLM_BUSY_MESSAGE})}\n\n"
+    except Exception as e:
+        print(f"--- ERROR in plan stream ---")
+        print(f"Error Type: {type(e).__name__}")
+        print(f"Error Details: {e}")
+        print(f"----------------------------")
+        yield f"event: error\ndata: {json.dumps({'message': 'A server error occurred. Please check the backend logs for details.'})}\n\n"
 
 if __name__ == "__main__":
     # This init_db() call is for local development and will be
     # handled by the startup.sh script in the Docker environment.
     init_db()
+    start_background_work()
     app.run(debug=True, port=5001)
@@ -0,0 +1,133 @@
+# benchmarks/bench_async_mode.py
+# Load test comparing the gunicorn sync deployment with the uvicorn async mode
+# (asgi_server.py). Slow clients keep asking for uncached recipes, each one a
+# call to a local stub LLM with fixed latency, while fast clients log in and
+# log weights. Reports LLM throughput and fast-request p50/p99 per mode.
+#
+# Usage: python benchmarks/bench_async_mode.py [--duration 10] [--llm-latency 1.0]
+#        [--slow-clients 16] [--fast-clients 4] [--sync-workers 2]
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+LOGIN_QUERY = "mutation Login($u: String!, $p: String!) { loginUser(username: $u, password: $p) { success } }"
+REGISTER_QUERY = "mutation Register($u: String!, $p: String!) { registerUser(username: $u, password: $p) { success user { id } } }"
+LOG_WEIGHT_QUERY = "mutation LogWeight($userId: ID!, $weight: Float!, $date: Date!) { logWeight(userId: $userId, weight: $weight, date: $date) { success } }"
+RECIPE_QUERY = "mutation GetRecipe($dish: String!) { getRecipe(dishName: $dish) }"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, env, sync_workers):
+    if mode == "sync":
+        command = ["gunicorn", "--workers", str(sync_workers), "--bind", f"127.0.0.1:{port}", "backend_server:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi_server:app", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/graphql"
+    for _ in range(100):
+        try:
+            requests.post(url, json={"query": "{ __typename }"}, timeout=5)
+            return process, url
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def run_load(url, duration, slow_clients, fast_clients, run_id):
+    session_user = requests.post(url, json={"query": REGISTER_QUERY, "variables": {"u": f"bench-{run_id}", "p": "pw"}}).json()
+    user_id = session_user["data"]["registerUser"]["user"]["id"]
+    deadline = time.perf_counter() + duration
+    fast_latencies, slow_done = [], []
+    lock = threading.Lock()
+
+    def slow_worker(worker):
+        session, count = requests.Session(), 0
+        while time.perf_counter() < deadline:
+            dish = f"Dish {run_id}-{worker}-{count}"
+            session.post(url, json={"query": RECIPE_QUERY, "variables": {"dish": dish}}, timeout=120)
+            count += 1
+        with lock:
+            slow_done.append(count)
+
+    def fast_worker(worker):
+        session, count = requests.Session(), 0
+        while time.perf_counter() < deadline:
+            if count % 2:
+                payload = {"query": LOGIN_QUERY, "variables": {"u": f"bench-{run_id}", "p": "pw"}}
+            else:
+                day = date(2024, 1, 1) + timedelta(days=(worker * 10000 + count) % 3650)
+                payload = {"query": LOG_WEIGHT_QUERY, "variables": {"userId": user_id, "weight": 70.0, "date": str(day)}}
+            started = time.perf_counter()
+            response = session.post(url, json=payload, timeout=120)
+            elapsed = (time.perf_counter() - started) * 1000
+            assert response.status_code == 200, response.text
+            with lock:
+                fast_latencies.append(elapsed)
+            count += 1
+
+    threads = [threading.Thread(target=slow_worker, args=(i,)) for i in range(slow_clients)]
+    threads += [threading.Thread(target=fast_worker, args=(i,)) for i in range(fast_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(slow_done), fast_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync (gunicorn) vs async (uvicorn) serving under slow LLM calls")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--slow-clients", type=int, default=16)
+    parser.add_argument("--fast-clients", type=int, default=4)
+    parser.add_argument("--sync-workers", type=int, default=2)
+    args = parser.parse_args()
+
+    llm = FakeOpenAIServer(latency=args.llm_latency).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ, "DB_PATH": os.path.join(tmp, "bench.db"), "OPENAI_API_KEY": "sk-fake",
+            "OPENAI_BASE_URL": llm.base_url, "LLM_CACHE_ENABLED": "0", "QUERY_COST_ENABLED": "0",
+        }
+        subprocess.run([sys.executable, "-c", "from backend_server import init_db; init_db()"], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        print(f"{'mode':<8} {'LLM calls/s':>12} {'fast req/s':>11} {'fast p50 ms':>12} {'fast p99 ms':>12}")
+        for run_id, mode in enumerate(("sync", "async")):
+            process, url = start_server(mode, free_port(), env, args.sync_workers)
+            try:
+                slow_total, fast = run_load(url, args.duration, args.slow_clients, args.fast_clients, run_id)
+            finally:
+                process.terminate()
+                process.wait()
+            print(f"{mode:<8} {slow_total / args.duration:>12.1f} {len(fast) / args.duration:>11.1f} "
+                  f"{percentile(fast, 0.5):>12.1f} {percentile(fast, 0.99):>12.1f}")
+    llm.stop()
+
+
+if __name__ == "__main__":
+    main()
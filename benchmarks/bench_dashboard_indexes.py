@@ -0,0 +1,78 @@
+# benchmarks/bench_dashboard_indexes.py
+# Measures dashboard query latency on a synthetic database with and without
+# the covering indexes from migration 3.
+#
+# Usage: python benchmarks/bench_dashboard_indexes.py [--users 2000] [--plans 100000] [--requests 300]
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+from migrations import _create_dashboard_indexes  # noqa: E402
+from synthetic_data import generate  # noqa: E402
+
+DASHBOARD_QUERY = """
+    query Dashboard($userId: ID!) {
+        getUserDashboard(userId: $userId) {
+            progressHistoryConnection(first: 100) { edges { node { weight_kg log_date } } }
+            pastPlansConnection(first: 10) { edges { node { id created_at weight_kg bmi dietary_preference } } pageInfo { hasNextPage endCursor } }
+        }
+    }
+"""
+DASHBOARD_INDEXES = ["idx_diet_plans_user_created", "idx_user_progress_user_date_weight", "idx_llm_response_cache_created"]
+
+
+def run(label, user_ids, requests_total):
+    client = backend_server.app.test_client()
+    latencies = []
+    for _ in range(requests_total):
+        started = time.perf_counter()
+        response = client.post("/graphql", json={"query": DASHBOARD_QUERY, "variables": {"userId": random.choice(user_ids)}})
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200 and "errors" not in response.get_json(), response.data
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<18} p50 {statistics.median(latencies):8.2f} ms   p95 {p95:8.2f} ms")
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard latency with and without the covering indexes")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--plans", type=int, default=100000)
+    parser.add_argument("--progress", type=int, default=90)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    backend_server.init_db()
+    with backend_server.db_pool.connection() as conn:
+        generate(conn, args.users, args.plans, args.progress)
+        user_ids = [row["id"] for row in conn.execute("SELECT id FROM users")]
+        for name in DASHBOARD_INDEXES:
+            conn.execute(f"DROP INDEX {name}")
+        conn.execute("ANALYZE")
+        conn.commit()
+    without_indexes = run("without indexes", user_ids, args.requests)
+
+    with backend_server.db_pool.connection() as conn:
+        _create_dashboard_indexes(conn)
+        conn.execute("ANALYZE")
+        conn.commit()
+    # Cached statements were prepared against the old schema; start from fresh connections.
+    backend_server.db_pool.close_all()
+    with_indexes = run("with indexes", user_ids, args.requests)
+    print(f"p50 speedup: {without_indexes / with_indexes:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
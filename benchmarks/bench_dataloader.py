@@ -0,0 +1,104 @@
+# benchmarks/bench_dataloader.py
+# SQL statements and latency of a dashboard query that walks every past plan
+# (diet with meals, exercises, shopping list, weekly totals, user), with the
+# request-scoped loaders from dataloaders.py and without them (each plan's
+# fields loaded on their own). Fails if the batched statement count grows
+# with the number of plans.
+#
+# Usage: python benchmarks/bench_dataloader.py [--plans 5 50] [--repeat 20]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DASHBOARD_CACHE_ENABLED"] = "0"
+os.environ["INSTRUMENTATION_ENABLED"] = "0"
+
+from ariadne import graphql_sync  # noqa: E402
+
+import backend_server  # noqa: E402
+from bench_response_encoding import synthetic_plan  # noqa: E402
+from db import ConnectionPool, PooledConnection  # noqa: E402
+from plan_batch import insert_diet_plans  # noqa: E402
+
+DASHBOARD_QUERY = """
+    query Dashboard($userId: ID!) {
+        getUserDashboard(userId: $userId) {
+            pastPlans {
+                id created_at
+                user { username }
+                generated_plan {
+                    diet { day totals { calories } meals { name dish nutrition { calories } } }
+                    exercises { day activity }
+                    shoppingList { category items }
+                }
+                weeklyTotals { days total { calories } }
+            }
+        }
+    }
+"""
+
+
+class CountingConnection(PooledConnection):
+    """Counts the statements run through the connection's execute shortcut, which is all the resolvers use."""
+
+    statements = 0
+
+    def execute(self, sql, parameters=(), /):
+        CountingConnection.statements += 1
+        return super().execute(sql, parameters)
+
+
+def seed(plans):
+    """A fresh database with one user and `plans` stored plans."""
+    backend_server.db_pool.close_all()
+    backend_server.db_pool = ConnectionPool(os.path.join(TMP_DIR.name, f"bench_{plans}.db"), factory=CountingConnection)
+    backend_server.init_db()
+    profile = {"userId": 1, "weight": 72, "height": 170, "activityLevel": "Moderately Active", "dietaryPreference": "Vegetarian", "includeCheatMeal": False}
+    with backend_server.db_pool.connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('member', 'x')")
+        insert_diet_plans(conn, [(profile, 24.9, synthetic_plan(seed)) for seed in range(plans)])
+        conn.commit()
+
+
+def run(batched):
+    """Executes the dashboard query once; returns (statements, milliseconds, response body)."""
+    context = backend_server.graphql_context(None) if batched else backend_server.response_encoder.context(None)
+    CountingConnection.statements = 0
+    started = time.perf_counter()
+    success, result = graphql_sync(backend_server.schema, {"query": DASHBOARD_QUERY, "variables": {"userId": 1}}, context_value=context)
+    elapsed = (time.perf_counter() - started) * 1000
+    assert success and "errors" not in result, result
+    return CountingConnection.statements, elapsed, backend_server.response_encoder.dumps(result, context)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard SQL statements with and without request-scoped loaders")
+    parser.add_argument("--plans", type=int, nargs="+", default=[5, 50])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'plans':>6} {'loaders':<8} {'statements':>11} {'p50 ms':>9}")
+    batched_counts = set()
+    for plans in args.plans:
+        seed(plans)
+        bodies = {}
+        for batched in (False, True):
+            runs = [run(batched) for _ in range(args.repeat)]
+            statements, bodies[batched] = runs[0][0], runs[0][2]
+            print(f"{plans:>6} {'on' if batched else 'off':<8} {statements:>11} {statistics.median(sample[1] for sample in runs):>9.2f}")
+            if batched:
+                batched_counts.add(statements)
+        assert bodies[True] == bodies[False], "batched and unbatched responses differ"
+
+    assert len(batched_counts) == 1, f"batched statement count grows with the number of plans: {sorted(batched_counts)}"
+    print(f"\nbatched statement count is constant: {batched_counts.pop()} per request")
+
+
+if __name__ == "__main__":
+    main()
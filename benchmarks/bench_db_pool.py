@@ -0,0 +1,117 @@
+# benchmarks/bench_db_pool.py
+# Compares requests/sec for logWeight and getUserDashboard with the pooled,
+# WAL-mode connection layer against the old connect-per-request behaviour.
+#
+# Usage: python benchmarks/bench_db_pool.py [--requests 2000] [--threads 4] [--plans 20]
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+from db import ConnectionPool  # noqa: E402
+
+DASHBOARD_QUERY = """
+    query GetUserDashboard($userId: ID!) {
+        getUserDashboard(userId: $userId) {
+            progressHistory { weight_kg log_date }
+            pastPlans { id created_at weight_kg bmi dietary_preference
+                generated_plan { diet { day daily_calories } exercises { day activity } shoppingList { category items } } }
+        }
+    }
+"""
+LOG_WEIGHT_QUERY = "mutation LogWeight($userId: ID!, $weight: Float!, $date: Date!) { logWeight(userId: $userId, weight: $weight, date: $date) { success message } }"
+
+SAMPLE_DAY = {
+    "day": "Monday", "daily_calories": 1800,
+    "meals": [{"name": "Breakfast", "dish": "Pesarattu", "quantity": "2 pieces",
+               "nutrition": {"calories": 350, "protein_g": 14, "carbs_g": 50, "fat_g": 8}}] * 4,
+}
+
+
+def seed(db_path, plans):
+    """Creates the schema, one user and `plans` diet plans plus 90 days of weights."""
+    backend_server.db_pool = ConnectionPool(db_path)
+    backend_server.init_db()
+    backend_server.db_pool.close_all()
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')")
+    diet = json.dumps([SAMPLE_DAY] * 7)
+    exercises = json.dumps([{"day": "Monday", "activity": "30-minute brisk walk"}] * 7)
+    shopping = json.dumps([{"category": "Vegetables", "items": ["Okra", "Tomato"]}])
+    conn.executemany(
+        "INSERT INTO diet_plans (user_id, weight_kg, height_cm, activity_level, dietary_preference, include_cheat_meal, bmi, generated_plan_json, exercise_plan_json, shopping_list_json) VALUES (1, 70, 175, 'Moderately Active', 'Vegetarian', 0, 22.9, ?, ?, ?)",
+        [(diet, exercises, shopping)] * plans,
+    )
+    start = date(2024, 1, 1)
+    conn.executemany(
+        "INSERT INTO user_progress (user_id, weight_kg, log_date) VALUES (1, ?, ?)",
+        [(70 - i * 0.05, str(start + timedelta(days=i))) for i in range(90)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(pool, label, requests_total, threads):
+    backend_server.db_pool = pool
+    client = backend_server.app.test_client()
+    results = {}
+    for name, query, make_vars in (
+        ("logWeight", LOG_WEIGHT_QUERY, lambda i: {"userId": 1, "weight": 70.0, "date": str(date(2025, 1, 1) + timedelta(days=i % 365))}),
+        ("getUserDashboard", DASHBOARD_QUERY, lambda i: {"userId": 1}),
+    ):
+        per_thread = requests_total // threads
+
+        def worker(offset):
+            for i in range(per_thread):
+                response = client.post("/graphql", json={"query": query, "variables": make_vars(offset + i)})
+                assert response.status_code == 200, response.data
+
+        workers = [threading.Thread(target=worker, args=(t * per_thread,)) for t in range(threads)]
+        started = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - started
+        results[name] = per_thread * threads / elapsed
+        print(f"{label:<28} {name:<18} {results[name]:>9.1f} req/s")
+    pool.close_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite connection pool benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--plans", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        pooled_path = os.path.join(tmp, "pooled.db")
+        seed(legacy_path, args.plans)
+        seed(pooled_path, args.plans)
+        # Put the legacy database back on the default rollback journal.
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.close()
+
+        legacy = run(ConnectionPool(legacy_path, reuse=False, pragmas=()), "connect-per-request", args.requests, args.threads)
+        pooled = run(ConnectionPool(pooled_path), "pooled + WAL", args.requests, args.threads)
+
+    for name in legacy:
+        print(f"{name}: {pooled[name] / legacy[name]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
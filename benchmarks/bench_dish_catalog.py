@@ -0,0 +1,158 @@
+# benchmarks/bench_dish_catalog.py
+# Builds the dish catalogue from a database of stored plans, catches it up
+# after more plans are inserted, and times swap lookups against it, including
+# one made while a background build is still running. Reports
+# how many swaps it answers without the model, and fails if a candidate is
+# the swapped dish, was never served under the requested preference, or is
+# outside the macro tolerance.
+#
+# Usage: python benchmarks/bench_dish_catalog.py [--plans 2000] [--more-plans 200] [--dishes 400] [--swaps 2000]
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+
+import numpy as np  # noqa: E402
+
+import backend_server  # noqa: E402
+from dish_catalog import MIN_MACRO_SLACK, DishCatalog  # noqa: E402
+from fake_openai import DAYS, DISHES, MEALS  # noqa: E402
+from plan_batch import insert_diet_plans  # noqa: E402
+from plan_store import NUTRITION_KEYS  # noqa: E402
+from recipe_store import normalize_dish_name  # noqa: E402
+from synthetic_data import PREFERENCES  # noqa: E402
+
+
+def make_menu(rng, dishes):
+    """`dishes` dishes, each with a typical serving, a meal slot and the preferences it suits."""
+    menu = []
+    for n in range(dishes):
+        calories = rng.uniform(200, 700)
+        protein = calories * rng.uniform(0.03, 0.07)
+        fat = calories * rng.uniform(0.02, 0.04)
+        carbs = (calories - 4 * protein - 9 * fat) / 4
+        menu.append({
+            "dish": f"{DISHES[n % len(DISHES)]} #{n}", "meal": MEALS[n % len(MEALS)],
+            "preferences": set(rng.sample(PREFERENCES, rng.randint(1, 3))),
+            "nutrition": (calories, protein, carbs, fat),
+        })
+    return menu
+
+
+def make_plan(rng, menu, preference):
+    """A week of meals picked from the dishes that suit `preference`, each served with a little variation."""
+    days = []
+    for day in DAYS:
+        meals = []
+        for meal in MEALS:
+            choice = rng.choice([item for item in menu if item["meal"] == meal and preference in item["preferences"]] or menu)
+            scale = rng.uniform(0.95, 1.05)
+            meals.append({
+                "name": meal, "dish": choice["dish"], "quantity": "1 plate",
+                "nutrition": {key: round(value * scale) for key, value in zip(NUTRITION_KEYS, choice["nutrition"])},
+            })
+        days.append({"day": day, "daily_calories": sum(m["nutrition"]["calories"] for m in meals), "meals": meals})
+    return {"diet": days, "exercises": [], "shoppingList": []}
+
+
+def insert_plans(rng, menu, plans):
+    rows = []
+    for _ in range(plans):
+        preference = rng.choice(PREFERENCES)
+        profile = {"userId": 1, "weight": 70, "height": 170, "activityLevel": "Sedentary", "dietaryPreference": preference, "includeCheatMeal": False}
+        rows.append((profile, 24.2, make_plan(rng, menu, preference)))
+    with backend_server.db_pool.connection() as conn:
+        insert_diet_plans(conn, rows)
+        conn.commit()
+
+
+def served_dishes():
+    """Normalized dish -> (preferences of the plans it was served in, mean macros), straight from the tables."""
+    served = {}
+    with backend_server.db_pool.connection() as conn:
+        rows = conn.execute("SELECT plan_meals.dish, diet_plans.dietary_preference FROM plan_meals JOIN diet_plans ON diet_plans.id = plan_meals.plan_id")
+        for row in rows:
+            served.setdefault(normalize_dish_name(row["dish"]), (set(), []))[0].add(row["dietary_preference"])
+        rows = conn.execute("SELECT dish, AVG(calories), AVG(protein_g), AVG(carbs_g), AVG(fat_g) FROM plan_meals GROUP BY dish")
+        for row in rows:
+            served[normalize_dish_name(row[0])][1].extend(row[1:])
+    return {dish: (preferences, np.array(macros, dtype=np.float32)) for dish, (preferences, macros) in served.items()}
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dish catalogue build, incremental refresh and swap lookups")
+    parser.add_argument("--plans", type=int, default=2000)
+    parser.add_argument("--more-plans", type=int, default=200)
+    parser.add_argument("--dishes", type=int, default=400)
+    parser.add_argument("--swaps", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(11)
+
+    backend_server.init_db()
+    with backend_server.db_pool.connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('member', 'x')")
+        conn.commit()
+    menu = make_menu(rng, args.dishes)
+    insert_plans(rng, menu, args.plans)
+
+    catalog = DishCatalog(backend_server.db_pool)
+    read, build_ms = timed(catalog.refresh)
+    print(f"initial build:      {read:>7} meals from {args.plans} plans in {build_ms:8.1f} ms")
+    insert_plans(rng, menu, args.more_plans)
+    read, refresh_ms = timed(catalog.refresh)
+    print(f"incremental update: {read:>7} meals from {args.more_plans} plans in {refresh_ms:8.1f} ms")
+    _, idle_ms = timed(catalog.refresh)
+    print(f"idle catch-up:      {0:>7} meals in {idle_ms:8.3f} ms")
+    print(f"catalogue:          {catalog.stats()['dishes']:>7} dishes")
+
+    served = served_dishes()
+    failures, timings = [], []
+    for _ in range(args.swaps):
+        item = rng.choice(menu)
+        preference = rng.choice(sorted(item["preferences"]))
+        started = time.perf_counter()
+        candidates = catalog.similar(item["dish"], item["meal"], preference)
+        timings.append((time.perf_counter() - started) * 1e6)
+        target = served[normalize_dish_name(item["dish"])][1]
+        # The catalogue keeps its means as float32.
+        slack = np.maximum(target * catalog.tolerance, MIN_MACRO_SLACK) + 0.01
+        for candidate in candidates:
+            preferences, macros = served[normalize_dish_name(candidate["dish"])]
+            if normalize_dish_name(candidate["dish"]) == normalize_dish_name(item["dish"]):
+                failures.append(f"{item['dish']}: swapped for itself")
+            elif preference not in preferences:
+                failures.append(f"{item['dish']}: {candidate['dish']} was never served as {preference}")
+            elif (np.abs(macros - target) > slack).any():
+                failures.append(f"{item['dish']}: {candidate['dish']} is not nutritionally similar")
+
+    stats = catalog.stats()
+    print(f"swap lookups:       p50 {statistics.median(timings):.0f} us, p95 {np.percentile(timings, 95):.0f} us")
+    print(f"answered locally:   {stats['hits']}/{args.swaps} ({100 * stats['hits'] / args.swaps:.0f}%), the rest would go to the model")
+
+    # A worker builds its catalogue on a background thread; lookups meanwhile find nothing instead of waiting.
+    background = DishCatalog(backend_server.db_pool)
+    background.start(interval_seconds=3600)
+    item = menu[0]
+    candidates, lookup_ms = timed(lambda: background.similar(item["dish"], item["meal"], min(item["preferences"])))
+    print(f"lookup during build: {lookup_ms:6.2f} ms, {len(candidates)} candidates (answered by the model)")
+    while not background.ready:
+        time.sleep(0.05)
+    assert not failures, failures[:10]
+
+
+if __name__ == "__main__":
+    main()
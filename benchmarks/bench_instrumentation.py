@@ -0,0 +1,92 @@
+# benchmarks/bench_instrumentation.py
+# Overhead of the always-on instrumentation (timed resolvers, timed SQL
+# connections, request traces) on the heaviest read: an uncached dashboard
+# with every past plan and its per-day totals. Runs the same requests with
+# instrumentation off and on, interleaved, and reports the latency of each.
+#
+# Usage: python benchmarks/bench_instrumentation.py [--plans 40] [--repeat 50]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["DASHBOARD_CACHE_ENABLED"] = "0"
+os.environ["SLOW_REQUEST_MS"] = "60000"
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+from ariadne import make_executable_schema  # noqa: E402
+
+import backend_server  # noqa: E402
+from bench_response_encoding import synthetic_plan  # noqa: E402
+from db import PooledConnection  # noqa: E402
+from instrumentation import InstrumentedConnection  # noqa: E402
+from plan_batch import insert_diet_plans  # noqa: E402
+
+DASHBOARD_QUERY = """
+    query Dashboard($userId: ID!) {
+        getUserDashboard(userId: $userId) {
+            progressHistory { weight_kg log_date }
+            pastPlans {
+                id created_at bmi
+                generated_plan { diet { day daily_calories totals { calories protein_g } calories_consistent meals { name dish } } }
+                weeklyTotals { days total { calories } }
+            }
+        }
+    }
+"""
+
+
+INSTRUMENTED_SCHEMA = backend_server.schema
+PLAIN_SCHEMA = make_executable_schema(
+    backend_server.type_defs, backend_server.query, backend_server.mutation, backend_server.plan_job,
+    backend_server.user_dashboard, backend_server.diet_plan, backend_server.plan_type, backend_server.day_plan,
+)
+
+
+def instrument(enabled):
+    backend_server.INSTRUMENTATION_ENABLED = enabled
+    backend_server.schema = INSTRUMENTED_SCHEMA if enabled else PLAIN_SCHEMA
+    backend_server.db_pool.close_all()
+    backend_server.db_pool.factory = InstrumentedConnection if enabled else PooledConnection
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard latency with instrumentation off and on")
+    parser.add_argument("--plans", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    client.post("/graphql", json={"query": 'mutation { registerUser(username: "member", password: "pw") { success } }'})
+    profile = {"userId": 1, "weight": 72, "height": 170, "activityLevel": "Moderately Active", "dietaryPreference": "Vegetarian", "includeCheatMeal": False}
+    with backend_server.db_pool.connection() as conn:
+        insert_diet_plans(conn, [(profile, 24.9, synthetic_plan(seed)) for seed in range(args.plans)])
+        conn.commit()
+
+    timings = {False: [], True: []}
+    for _ in range(args.repeat):
+        for enabled in (False, True):
+            instrument(enabled)
+            started = time.perf_counter()
+            response = client.post("/graphql", json={"query": DASHBOARD_QUERY, "variables": {"userId": 1}})
+            timings[enabled].append((time.perf_counter() - started) * 1000)
+            assert "errors" not in response.get_json(), response.get_json()
+
+    print(f"{args.plans} plans, {args.repeat} requests each\n")
+    print(f"{'instrumentation':<18} {'p50 ms':>9} {'p95 ms':>9}")
+    for enabled, label in ((False, "off"), (True, "on")):
+        values = sorted(timings[enabled])
+        print(f"{label:<18} {statistics.median(values):>9.2f} {values[int(len(values) * 0.95) - 1]:>9.2f}")
+    overhead = statistics.median(timings[True]) / statistics.median(timings[False]) - 1
+    print(f"\noverhead at p50: {overhead * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/bench_llm_gateway.py
+# Exercises llm_gateway.py against the stub model with its 429 limiter on:
+# a burst through the bare SDK client vs through the gateway, interactive
+# latency behind a bulk backlog with and without priority lanes, a failing
+# upstream tripping the circuit breaker, and a deadline shorter than the model.
+#
+# Usage: python benchmarks/bench_llm_gateway.py [--requests 60] [--rate-limit 10] [--latency 0.2]
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import openai  # noqa: E402
+
+from fake_openai import FakeOpenAIServer  # noqa: E402
+from llm_gateway import BULK, INTERACTIVE, LLMGateway, LLMGatewayError  # noqa: E402
+
+MESSAGES = [{"role": "system", "content": "You are a chef."}, {"role": "user", "content": "What is the recipe for 'Pesarattu'?"}]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def make_gateway(fake, **settings):
+    return LLMGateway(lambda: openai.OpenAI(api_key="sk-fake", base_url=fake.base_url, max_retries=0), **settings)
+
+
+def run_all(calls, threads=20):
+    """Runs the zero-argument callables concurrently; returns (latencies, errors)."""
+    latencies, errors, lock = [], [], threading.Lock()
+
+    def timed(call):
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception as error:
+            with lock:
+                errors.append(type(error).__name__)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, calls))
+    return latencies, errors
+
+
+def burst(args):
+    print(f"{'burst of ' + str(args.requests):<28} {'ok':>5} {'failed':>7} {'429s seen':>10} {'seconds':>8}")
+    for name in ("bare SDK client", "gateway"):
+        fake = FakeOpenAIServer(latency=args.latency, rate_limit=args.rate_limit).start()
+        if name == "gateway":
+            gateway = make_gateway(fake, rpm=args.rate_limit * 60, burst_seconds=1, max_concurrency=args.rate_limit)
+            call = lambda: gateway.complete("gpt-3.5-turbo", MESSAGES, priority=INTERACTIVE)
+        else:
+            client = openai.OpenAI(api_key="sk-fake", base_url=fake.base_url, max_retries=0)
+            call = lambda: client.chat.completions.create(model="gpt-3.5-turbo", messages=MESSAGES)
+        started = time.perf_counter()
+        latencies, errors = run_all([call] * args.requests)
+        print(f"{name:<28} {len(latencies):>5} {len(errors):>7} {fake.rate_limited:>10} {time.perf_counter() - started:>8.2f}")
+        fake.stop()
+
+
+def priority_lanes(args):
+    print(f"\n{'interactive behind bulk':<28} {'interactive p50':>16} {'bulk p50':>9}")
+    for name, interactive_lane in (("one lane", BULK), ("priority lanes", INTERACTIVE)):
+        fake = FakeOpenAIServer(latency=args.latency).start()
+        gateway = make_gateway(fake, max_concurrency=4)
+        lanes = {}
+
+        def call(lane):
+            started = time.perf_counter()
+            gateway.complete("gpt-3.5-turbo", MESSAGES, priority=interactive_lane if lane == "interactive" else BULK)
+            lanes.setdefault(lane, []).append(time.perf_counter() - started)
+
+        # The bulk backlog is queued first; interactive requests arrive just after it.
+        bulk = threading.Thread(target=run_all, args=([lambda: call("bulk")] * 40, 40))
+        bulk.start()
+        time.sleep(0.05)
+        run_all([lambda: call("interactive")] * 8, 8)
+        bulk.join()
+        print(f"{name:<28} {percentile(lanes['interactive'], 0.5):>15.2f}s {percentile(lanes['bulk'], 0.5):>8.2f}s")
+        fake.stop()
+
+
+def breaker(args):
+    fake = FakeOpenAIServer(error_rate=1.0).start()
+    gateway = make_gateway(fake, max_retries=2, backoff_base=0.05, breaker_failures=5, breaker_reset_seconds=30)
+    started = time.perf_counter()
+    latencies, errors = run_all([lambda: gateway.complete("gpt-3.5-turbo", MESSAGES)] * args.requests, threads=4)
+    stats = gateway.stats()
+    print(f"\nfailing upstream: {args.requests} requests, {fake.calls} reached the server, "
+          f"{stats['circuit_rejections']} rejected by the open breaker, {time.perf_counter() - started:.2f}s")
+    fake.stop()
+
+
+def deadline(args):
+    fake = FakeOpenAIServer(latency=3.0).start()
+    gateway = make_gateway(fake, interactive_deadline=1.0)
+    started = time.perf_counter()
+    try:
+        gateway.complete("gpt-3.5-turbo", MESSAGES, priority=INTERACTIVE)
+        outcome = "answered"
+    except (LLMGatewayError, openai.APIConnectionError) as error:
+        outcome = type(error).__name__
+    print(f"1s deadline vs 3s model: {outcome} after {time.perf_counter() - started:.2f}s")
+    fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM gateway under rate limits, backlogs and failures")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--rate-limit", type=int, default=10, help="stub model's requests per second")
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    burst(args)
+    priority_lanes(args)
+    breaker(args)
+    deadline(args)
+
+
+if __name__ == "__main__":
+    main()
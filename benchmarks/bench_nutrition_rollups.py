@@ -0,0 +1,89 @@
+# benchmarks/bench_nutrition_rollups.py
+# Weekly macro totals for every plan of a user with a long history: decoding
+# and walking each plan's generated_plan_json, summing plan_meals in SQL, and
+# reading the plan_totals rollups written with each plan. Also times the
+# rollup backfill over the same plans.
+#
+# Usage: python benchmarks/bench_nutrition_rollups.py [--plans 500] [--repeat 10]
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+
+import backend_server  # noqa: E402
+from bench_response_encoding import synthetic_plan  # noqa: E402
+from migrations import backfill_plan_rollups  # noqa: E402
+from plan_batch import insert_diet_plans  # noqa: E402
+from plan_store import NUTRITION_KEYS  # noqa: E402
+
+
+def from_json(conn):
+    totals = {}
+    for row in conn.execute("SELECT id, generated_plan_json FROM diet_plans WHERE user_id = 1"):
+        days = json.loads(row["generated_plan_json"])
+        totals[row["id"]] = {key: sum(meal["nutrition"][key] for day in days for meal in day["meals"]) for key in NUTRITION_KEYS}
+    return totals
+
+
+def from_meals(conn):
+    rows = conn.execute(
+        "SELECT plan_meals.plan_id, SUM(calories), SUM(protein_g), SUM(carbs_g), SUM(fat_g) FROM diet_plans "
+        "JOIN plan_meals ON plan_meals.plan_id = diet_plans.id WHERE diet_plans.user_id = 1 GROUP BY plan_meals.plan_id"
+    )
+    return {row[0]: dict(zip(NUTRITION_KEYS, row[1:])) for row in rows}
+
+
+def from_rollups(conn):
+    rows = conn.execute(
+        "SELECT plan_id, calories, protein_g, carbs_g, fat_g FROM diet_plans JOIN plan_totals ON plan_totals.plan_id = diet_plans.id "
+        "WHERE diet_plans.user_id = 1"
+    )
+    return {row[0]: dict(zip(NUTRITION_KEYS, row[1:])) for row in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weekly macro totals: JSON walk vs SQL sum vs stored rollups")
+    parser.add_argument("--plans", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    client.post("/graphql", json={"query": 'mutation { registerUser(username: "member", password: "pw") { success } }'})
+    profile = {"userId": 1, "weight": 72, "height": 170, "activityLevel": "Moderately Active", "dietaryPreference": "Vegetarian", "includeCheatMeal": False}
+    with backend_server.db_pool.connection() as conn:
+        insert_diet_plans(conn, [(profile, 24.9, synthetic_plan(seed)) for seed in range(args.plans)])
+        conn.commit()
+
+        print(f"{args.plans} plans\n")
+        print(f"{'weekly totals from':<28} {'p50 ms':>9}")
+        expected = None
+        for label, run in (("generated_plan_json", from_json), ("SUM over plan_meals", from_meals), ("plan_totals", from_rollups)):
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                totals = run(conn)
+                timings.append((time.perf_counter() - started) * 1000)
+            expected = expected or totals
+            assert totals == expected, f"{label} disagrees"
+            print(f"{label:<28} {statistics.median(timings):>9.2f}")
+
+        conn.execute("DELETE FROM plan_totals")
+        conn.execute("UPDATE plan_days SET total_calories = NULL, total_protein_g = NULL, total_carbs_g = NULL, total_fat_g = NULL")
+        conn.commit()
+        started = time.perf_counter()
+        rolled_up = backfill_plan_rollups(conn)
+        print(f"\nbackfill: {rolled_up} plans in {time.perf_counter() - started:.2f}s")
+        assert from_rollups(conn) == expected
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_persisted_queries.py
+# Measures the per-request parse + validate cost of the Streamlit client's
+# queries, before (text parsed and validated every time) and after the
+# persisted query / document cache, plus the request bytes saved by hashes.
+#
+# Usage: python benchmarks/bench_persisted_queries.py [--iterations 2000]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+
+import backend_server  # noqa: E402
+from graphql import parse, validate  # noqa: E402
+from persisted_queries import DocumentCache, PersistedQueries, extract_operations, query_hash  # noqa: E402
+
+STREAMLIT_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app.py")
+
+
+def per_request_us(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse/validate overhead with and without persisted queries")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    schema = backend_server.schema
+    registry = PersistedQueries(schema, DocumentCache())
+    total_before = total_after = 0.0
+    print(f"{'operation':<22} {'before us':>10} {'after us':>10} {'body bytes':>11} {'hash bytes':>11}")
+    for query in extract_operations(STREAMLIT_APP):
+        name = query.split("(")[0].split("{")[0].split()[-1]
+        hashed = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}}
+        registry.resolve({"query": query, **hashed})
+
+        def before():
+            validate(schema, parse(query))
+
+        def after():
+            _, document = registry.resolve(hashed)
+            registry.documents.validate(schema, document)
+
+        before_us = per_request_us(before, args.iterations)
+        after_us = per_request_us(after, args.iterations)
+        total_before += before_us
+        total_after += after_us
+        print(f"{name:<22} {before_us:>10.1f} {after_us:>10.1f} {len(json.dumps({'query': query})):>11} {len(json.dumps(hashed)):>11}")
+    print(f"\nparse + validate overhead: {total_before:.1f} us -> {total_after:.1f} us per round of queries "
+          f"({total_before / total_after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_plan_batch.py
+# Onboards a cohort against the stub model two ways: one generateDietPlan
+# mutation per user, and one generateDietPlans batch. Reports wall time and
+# upstream calls; the cohort repeats a few profiles, as clinic intakes do.
+#
+# Usage: python benchmarks/bench_plan_batch.py [--users 40] [--unique 10] [--latency 0.3] [--parallel 4]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+SINGLE_QUERY = """
+    mutation Plan($userId: ID!, $weight: Float!, $height: Float!, $activityLevel: String!, $includeCheatMeal: Boolean!,
+                  $dietaryPreference: String!, $allergies: [String!]) {
+        generateDietPlan(userId: $userId, weight: $weight, height: $height, activityLevel: $activityLevel,
+                         includeCheatMeal: $includeCheatMeal, dietaryPreference: $dietaryPreference, allergies: $allergies) { success }
+    }
+"""
+BATCH_QUERY = "mutation Plans($profiles: [PlanProfileInput!]!) { generateDietPlans(profiles: $profiles) { succeeded failed uniqueProfiles } }"
+
+
+def cohort(users, unique):
+    return [
+        {"userId": user_id, "weight": 60 + user_id % unique, "height": 170, "activityLevel": "Moderately Active",
+         "includeCheatMeal": False, "dietaryPreference": "Vegetarian", "allergies": []}
+        for user_id in range(1, users + 1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-user mutations vs one generateDietPlans batch")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--unique", type=int, default=10, help="distinct profiles in the cohort")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--parallel", type=int, default=4)
+    args = parser.parse_args()
+
+    llm = FakeOpenAIServer(latency=args.latency).start()
+    llm.install(backend_server.openai)
+    backend_server.init_db()
+    backend_server.plan_batch.max_parallel = args.parallel
+    client = backend_server.app.test_client()
+    for user_id in range(1, args.users + 1):
+        client.post("/graphql", json={"query": 'mutation R($u: String!) { registerUser(username: $u, password: "pw") { success } }',
+                                      "variables": {"u": f"member-{user_id}"}})
+    profiles = cohort(args.users, args.unique)
+
+    print(f"{'mode':<24} {'plans':>6} {'upstream':>9} {'seconds':>8}")
+    calls_before, started = llm.calls, time.perf_counter()
+    stored = sum(client.post("/graphql", json={"query": SINGLE_QUERY, "variables": profile}).get_json()["data"]["generateDietPlan"]["success"]
+                 for profile in profiles)
+    print(f"{'one mutation per user':<24} {stored:>6} {llm.calls - calls_before:>9} {time.perf_counter() - started:>8.2f}")
+
+    calls_before, started = llm.calls, time.perf_counter()
+    result = client.post("/graphql", json={"query": BATCH_QUERY, "variables": {"profiles": profiles}}).get_json()["data"]["generateDietPlans"]
+    print(f"{'generateDietPlans':<24} {result['succeeded']:>6} {llm.calls - calls_before:>9} {time.perf_counter() - started:>8.2f}")
+    llm.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_plan_fanout.py
+# Compares wall-clock time of generateDietPlan with one large completion
+# ("single") against concurrent per-day completions ("fanout"). The fake model
+# charges a fixed per-call latency plus generation time proportional to the
+# length of its answer, which is what makes one big completion slow.
+#
+# Usage: python benchmarks/bench_plan_fanout.py [--runs 3] [--latency 0.3] [--chunk-delay 0.005]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+GENERATE_QUERY = """
+    mutation GeneratePlan($userId: ID!, $weight: Float!, $height: Float!, $activityLevel: String!, $includeCheatMeal: Boolean!, $dietaryPreference: String!, $allergies: [String!]) {
+        generateDietPlan(userId: $userId, weight: $weight, height: $height, activityLevel: $activityLevel, includeCheatMeal: $includeCheatMeal, dietaryPreference: $dietaryPreference, allergies: $allergies) {
+            success message dietPlan { id generated_plan { diet { day meals { dish } } exercises { day } shoppingList { category } } }
+        }
+    }
+"""
+PLAN_ARGS = {
+    "userId": 1, "weight": 70.0, "height": 175.0, "activityLevel": "Moderately Active",
+    "includeCheatMeal": True, "dietaryPreference": "Vegetarian", "allergies": ["Nuts"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan-out plan generation benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.3, help="fixed seconds per upstream call")
+    parser.add_argument("--chunk-delay", type=float, default=0.005, help="seconds per 16 generated characters")
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency, stream_chunk_delay=args.chunk_delay).start()
+    fake.install(backend_server.openai)
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    client.post("/graphql", json={"query": 'mutation { registerUser(username: "bench", password: "x") { success } }'})
+
+    for mode in ("single", "fanout"):
+        backend_server.PLAN_GENERATION_MODE = mode
+        samples = []
+        calls_before = fake.calls
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            response = client.post("/graphql", json={"query": GENERATE_QUERY, "variables": PLAN_ARGS})
+            samples.append(time.perf_counter() - started)
+            result = response.get_json()["data"]["generateDietPlan"]
+            assert result["success"], result["message"]
+            assert len(result["dietPlan"]["generated_plan"]["diet"]) == 7
+        calls = (fake.calls - calls_before) / args.runs
+        print(f"{mode:<8} median {statistics.median(samples) * 1000:>8.0f} ms   upstream calls/plan {calls:.0f}")
+
+    backend_server.db_pool.close_all()
+    fake.stop()
+    TMP_DIR.cleanup()
+
+
+if __name__ == "__main__":
+    main()
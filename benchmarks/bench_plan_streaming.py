@@ -0,0 +1,80 @@
+# benchmarks/bench_plan_streaming.py
+# Measures time until the first meal is visible for the blocking
+# generateDietPlan mutation versus the /plans/stream SSE endpoint, against a
+# fake model that streams its completion a few characters at a time.
+#
+# Usage: python benchmarks/bench_plan_streaming.py [--runs 3] [--chunk-delay 0.005]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+PLAN_ARGS = {
+    "userId": 1, "weight": 70.0, "height": 175.0, "activityLevel": "Moderately Active",
+    "includeCheatMeal": False, "dietaryPreference": "Vegetarian", "allergies": [],
+}
+GENERATE_QUERY = """
+    mutation GeneratePlan($userId: ID!, $weight: Float!, $height: Float!, $activityLevel: String!, $includeCheatMeal: Boolean!, $dietaryPreference: String!, $allergies: [String!]) {
+        generateDietPlan(userId: $userId, weight: $weight, height: $height, activityLevel: $activityLevel, includeCheatMeal: $includeCheatMeal, dietaryPreference: $dietaryPreference, allergies: $allergies) {
+            success dietPlan { id generated_plan { diet { day meals { dish } } } }
+        }
+    }
+"""
+
+
+def time_blocking(client):
+    started = time.perf_counter()
+    response = client.post("/graphql", json={"query": GENERATE_QUERY, "variables": PLAN_ARGS})
+    assert response.get_json()["data"]["generateDietPlan"]["success"], response.data
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+def time_streaming(client):
+    started = time.perf_counter()
+    first_day = None
+    response = client.post("/plans/stream", json=PLAN_ARGS, buffered=False)
+    for chunk in response.response:
+        if first_day is None and b"event: day" in chunk:
+            first_day = time.perf_counter() - started
+        assert b"event: error" not in chunk, chunk
+    return first_day, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming plan generation benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--chunk-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(stream_chunk_delay=args.chunk_delay).start()
+    fake.install(backend_server.openai)
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    client.post("/graphql", json={"query": 'mutation { registerUser(username: "bench", password: "x") { success } }'})
+
+    for label, measure in (("blocking generateDietPlan", time_blocking), ("SSE /plans/stream", time_streaming)):
+        samples = [measure(client) for _ in range(args.runs)]
+        first = statistics.median(sample[0] for sample in samples)
+        total = statistics.median(sample[1] for sample in samples)
+        print(f"{label:<28} first meal visible {first * 1000:>8.0f} ms   complete {total * 1000:>8.0f} ms")
+
+    backend_server.db_pool.close_all()
+    fake.stop()
+    TMP_DIR.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_progress_analytics.py
+# Dashboard chart data for users with years of daily weigh-ins: the full
+# progressHistory list versus progressAnalytics (downsampled series, rolling
+# average, trend), uncached and from the per-user analytics cache. Reports
+# response size and latency per query.
+#
+# Usage: python benchmarks/bench_progress_analytics.py [--days 3650] [--repeat 20]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+# Measure the resolvers, not the whole-response dashboard cache in front of them.
+os.environ["DASHBOARD_CACHE_ENABLED"] = "0"
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+
+HISTORY_QUERY = "query($u: ID!) { getUserDashboard(userId: $u) { progressHistory { weight_kg log_date } } }"
+ANALYTICS_QUERY = """
+    query($u: ID!, $method: String!) { getUserDashboard(userId: $u) { progressAnalytics(method: $method, goalWeights: [70]) {
+        method points { log_date weight_kg rolling_avg_kg } trend { slope_kg_per_week } goals { projected_date }
+    } } }
+"""
+
+
+def history_csv(days):
+    start = date.today() - timedelta(days=days)
+    return "date,weight\n" + "".join(
+        f"{(start + timedelta(days=offset)).isoformat()},{95 - offset * 0.006 + (offset * 7919 % 13) / 10:.1f}\n" for offset in range(days)
+    )
+
+
+def measure(client, label, query, variables, repeat, before=None):
+    timings, size = [], 0
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        response = client.post("/graphql", json={"query": query, "variables": variables})
+        timings.append((time.perf_counter() - started) * 1000)
+        size = len(response.data)
+        assert "errors" not in response.get_json(), response.get_json()
+    print(f"{label:<34} {size / 1024:>9.1f} {statistics.median(timings):>9.2f} {max(timings):>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="progressHistory vs progressAnalytics payload and latency")
+    parser.add_argument("--days", type=int, default=3650, help="daily weigh-ins in the history")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    client.post("/graphql", json={"query": 'mutation { registerUser(username: "member", password: "pw") { success } }'})
+    client.post("/progress/import?userId=1", data=history_csv(args.days).encode(), content_type="text/csv")
+
+    print(f"{args.days} entries\n")
+    print(f"{'query':<34} {'KB':>9} {'p50 ms':>9} {'max ms':>9}")
+    measure(client, "progressHistory (every row)", HISTORY_QUERY, {"u": 1}, args.repeat)
+    clear = backend_server.progress_analytics_cache._entries.clear
+    for method in ("weekly", "lttb"):
+        measure(client, f"progressAnalytics {method}, uncached", ANALYTICS_QUERY, {"u": 1, "method": method}, args.repeat, before=clear)
+        measure(client, f"progressAnalytics {method}, cached", ANALYTICS_QUERY, {"u": 1, "method": method}, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_progress_import.py
+# Rows/sec for weight-log ingestion: one logWeight mutation per row (a sample)
+# versus a bulk /progress/import upload of a generated CSV, then the streaming
+# /progress/export of the same history. With --trace-memory, peak Python
+# memory is measured with tracemalloc (which slows every path down several
+# times) to show the export never materializes the history.
+#
+# Usage: python benchmarks/bench_progress_import.py [--rows 1000000] [--sample 2000] [--trace-memory]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+
+LOG_WEIGHT_QUERY = "mutation LogWeight($userId: ID!, $weight: Float!, $date: Date!) { logWeight(userId: $userId, weight: $weight, date: $date) { success } }"
+# A million distinct days needs a long calendar.
+FIRST_DAY = date(1000, 1, 1)
+
+
+def write_csv(path, rows):
+    with open(path, "w") as handle:
+        handle.write("date,weight\n")
+        for offset in range(rows):
+            handle.write(f"{(FIRST_DAY + timedelta(days=offset)).isoformat()},{70 + offset % 200 / 10:.1f}\n")
+
+
+def measure(label, rows, run, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - started
+    peak = ""
+    if trace_memory:
+        peak = f"{tracemalloc.get_traced_memory()[1] / 1e6:.1f}"
+        tracemalloc.stop()
+    print(f"{label:<28} {rows:>9} {elapsed:>9.2f} {rows / elapsed:>12,.0f} {peak:>10}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk weight-log import/export throughput")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--sample", type=int, default=2000, help="rows sent one logWeight mutation at a time")
+    parser.add_argument("--trace-memory", action="store_true", help="report peak Python memory per path")
+    args = parser.parse_args()
+
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    for name in ("single", "bulk"):
+        client.post("/graphql", json={"query": f'mutation {{ registerUser(username: "{name}", password: "pw") {{ success }} }}'})
+    csv_path = os.path.join(TMP_DIR.name, "history.csv")
+    write_csv(csv_path, args.rows)
+    print(f"CSV: {os.path.getsize(csv_path) / 1e6:.1f} MB\n")
+
+    print(f"{'path':<28} {'rows':>9} {'seconds':>9} {'rows/sec':>12} {'peak MB':>10}")
+
+    def one_by_one():
+        for offset in range(args.sample):
+            variables = {"userId": 1, "weight": 70.0, "date": (FIRST_DAY + timedelta(days=offset)).isoformat()}
+            client.post("/graphql", json={"query": LOG_WEIGHT_QUERY, "variables": variables})
+    measure("logWeight per row", args.sample, one_by_one, args.trace_memory)
+
+    def bulk():
+        with open(csv_path, "rb") as handle:
+            return client.post("/progress/import?userId=2", data=handle, content_type="text/csv").get_json()
+    # The test client buffers the request body, so the import's peak includes the whole file.
+    result = measure("/progress/import (CSV)", args.rows, bulk, args.trace_memory)
+    assert result["imported"] == args.rows, result
+
+    def export():
+        response = client.get("/progress/export?userId=2", buffered=False)
+        lines = sum(chunk.count(b"\n") for chunk in response.response)
+        response.close()
+        return lines
+    lines = measure("/progress/export (CSV)", args.rows, export, args.trace_memory)
+    assert lines == args.rows + 1, lines
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_query_cost.py
+# Prices every operation the Streamlit client sends and a few abusive
+# documents with the server's query cost analyzer, and times the analysis.
+# Fails if a client operation would be refused or an abusive one accepted.
+#
+# Usage: python benchmarks/bench_query_cost.py [--repeat 2000]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+
+from graphql import parse  # noqa: E402
+
+import backend_server  # noqa: E402
+from persisted_queries import extract_operations  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# The largest page the dashboard asks for.
+CLIENT_VARIABLES = {"first": backend_server.MAX_PAGE_SIZE["plans"]}
+
+GENERATE = 'generateDietPlan(userId: 1, weight: 70, height: 170, activityLevel: "Sedentary", includeCheatMeal: false, dietaryPreference: "Vegan", allergies: []) { success }'
+ABUSIVE = {
+    "every meal of every plan": """
+        { getUserDashboard(userId: 1) { pastPlans { id
+            generated_plan { diet { day meals { name dish nutrition { calories protein_g } } totals { calories } } exercises { day } shoppingList { items } }
+            weeklyTotals { total { calories } daily_average { calories } } } } }
+    """,
+    "6 aliased generateDietPlan": "mutation { " + " ".join(f"g{i}: {GENERATE}" for i in range(6)) + " }",
+    "30 aliased getRecipe": "mutation { " + " ".join(f'r{i}: getRecipe(dishName: "dish {i}")' for i in range(30)) + " }",
+}
+
+
+def time_analysis(document, variables, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        backend_server.query_cost.analyze(document, variables)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static query cost of client and abusive documents")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    analyzer = backend_server.query_cost
+    print(f"limits: cost {analyzer.max_cost}, depth {analyzer.max_depth}\n")
+    print(f"{'operation':<30} {'cost':>7} {'depth':>6} {'analysis us':>12}  verdict")
+    failures = []
+    documents = [(True, parse(query).definitions[0].name.value, query) for query in extract_operations(os.path.join(ROOT, "streamlit_app.py"))]
+    documents += [(False, name, query) for name, query in ABUSIVE.items()]
+    for expect_allowed, name, query in documents:
+        document = parse(query)
+        cost, depth = analyzer.analyze(document, CLIENT_VARIABLES)
+        allowed = cost <= analyzer.max_cost and depth <= analyzer.max_depth
+        print(f"{name:<30} {cost:>7} {depth:>6} {time_analysis(document, CLIENT_VARIABLES, args.repeat):>12.1f}  {'allowed' if allowed else 'refused'}")
+        if allowed != expect_allowed:
+            failures.append(name)
+
+    assert not failures, f"unexpected verdicts: {failures}"
+
+
+if __name__ == "__main__":
+    main()
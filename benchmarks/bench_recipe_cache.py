@@ -0,0 +1,63 @@
+# benchmarks/bench_recipe_cache.py
+# Measures how many upstream OpenAI calls getRecipe and swapMeal make once the
+# shared recipe store and swap candidate cache are in front of the model.
+# Before these caches every request was exactly one upstream call.
+#
+# Usage: python benchmarks/bench_recipe_cache.py [--requests 500] [--dishes 40]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+from fake_openai import DISHES, MEALS, FakeOpenAIServer  # noqa: E402
+
+RECIPE_QUERY = "mutation GetRecipe($dish: String!) { getRecipe(dishName: $dish) }"
+SWAP_QUERY = "mutation Swap($m: String!, $d: String!, $p: String!) { swapMeal(mealName: $m, dishToSwap: $d, dietaryPreference: $p) { dish } }"
+
+
+def zipf_choice(items, s=1.1):
+    """Popular dishes are requested far more often than rare ones."""
+    weights = [1 / (rank ** s) for rank in range(1, len(items) + 1)]
+    return random.choices(items, weights=weights)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe/swap cache upstream-call benchmark")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--dishes", type=int, default=40)
+    args = parser.parse_args()
+    random.seed(7)
+
+    fake = FakeOpenAIServer().start()
+    fake.install(backend_server.openai)
+    dishes = [f"{random.choice(DISHES)} #{i}" for i in range(args.dishes)]
+
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+
+    for name, query, make_vars in (
+        ("getRecipe", RECIPE_QUERY, lambda: {"dish": zipf_choice(dishes)}),
+        ("swapMeal", SWAP_QUERY, lambda: {"m": random.choice(MEALS), "d": zipf_choice(dishes), "p": "Vegetarian"}),
+    ):
+        before = fake.calls
+        for _ in range(args.requests):
+            response = client.post("/graphql", json={"query": query, "variables": make_vars()})
+            assert response.status_code == 200, response.data
+        upstream = fake.calls - before
+        print(f"{name:<10} requests={args.requests:<6} upstream calls={upstream:<6} "
+              f"saved={1 - upstream / args.requests:.0%}")
+    backend_server.db_pool.close_all()
+    fake.stop()
+    TMP_DIR.cleanup()
+
+
+if __name__ == "__main__":
+    main()
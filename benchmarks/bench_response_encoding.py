@@ -0,0 +1,122 @@
+# benchmarks/bench_response_encoding.py
+# Payload size and latency of a large dashboard (every past plan with its full
+# generated_plan) as each response-encoding step is switched on: orjson,
+# splicing the stored plan JSON, then gzip and brotli. Every variant is
+# checked to decode to the same document as the baseline.
+#
+# Usage: python benchmarks/bench_response_encoding.py [--plans 40] [--repeat 20]
+
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["DASHBOARD_CACHE_ENABLED"] = "0"
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import backend_server  # noqa: E402
+import response_encoding  # noqa: E402
+from plan_batch import insert_diet_plans  # noqa: E402
+
+DASHBOARD_QUERY = """
+    query Dashboard($userId: ID!) {
+        getUserDashboard(userId: $userId) {
+            pastPlans {
+                id created_at weight_kg bmi dietary_preference
+                generated_plan {
+                    diet { day daily_calories meals { name dish quantity nutrition { calories protein_g carbs_g fat_g } } }
+                    exercises { day activity }
+                    shoppingList { category items }
+                }
+            }
+        }
+    }
+"""
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+MEALS = ("Breakfast", "Lunch", "Snack", "Dinner")
+DISHES = ("Pesarattu with ginger chutney", "Gongura pappu with rice", "Roasted chana", "Pulihora with curd", "Ragi sangati with sambar")
+
+
+def synthetic_plan(seed):
+    return {
+        "diet": [
+            {"day": day, "daily_calories": 1800 + seed % 300, "meals": [
+                {"name": meal, "dish": DISHES[(seed + day_index + meal_index) % len(DISHES)], "quantity": "1 bowl (250g)",
+                 "nutrition": {"calories": 450 + meal_index, "protein_g": 20, "carbs_g": 55, "fat_g": 12}}
+                for meal_index, meal in enumerate(MEALS)
+            ]}
+            for day_index, day in enumerate(DAYS)
+        ],
+        "exercises": [{"day": day, "activity": "30 minutes brisk walking and 15 minutes yoga"} for day in DAYS],
+        "shoppingList": [{"category": category, "items": [f"{category} item {n}" for n in range(6)]} for category in ("Vegetables", "Grains", "Dairy", "Spices")],
+    }
+
+
+def decode(response):
+    body = response.data
+    if response.headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    elif response.headers.get("Content-Encoding") == "br":
+        body = response_encoding.brotli.decompress(body)
+    return json.loads(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard payload size and latency per encoding step")
+    parser.add_argument("--plans", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    if args.repeat < 2:
+        parser.error("--repeat must be at least 2 to report percentiles")
+
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    client.post("/graphql", json={"query": 'mutation { registerUser(username: "member", password: "pw") { success } }'})
+    profile = {"userId": 1, "weight": 72, "height": 170, "activityLevel": "Moderately Active", "dietaryPreference": "Vegetarian", "includeCheatMeal": False}
+    with backend_server.db_pool.connection() as conn:
+        insert_diet_plans(conn, [(profile, 24.9, synthetic_plan(seed)) for seed in range(args.plans)])
+        conn.commit()
+
+    encoder = backend_server.response_encoder
+    installed_orjson = response_encoding.orjson
+    variants = [
+        ("stdlib json", dict(orjson=None, splice=False, compress=False), None),
+        ("orjson", dict(orjson=installed_orjson, splice=False, compress=False), None),
+        ("orjson + splice", dict(orjson=installed_orjson, splice=True, compress=False), None),
+        ("orjson + splice + gzip", dict(orjson=installed_orjson, splice=True, compress=True), "gzip"),
+    ]
+    if response_encoding.brotli is not None:
+        variants.append(("orjson + splice + br", dict(orjson=installed_orjson, splice=True, compress=True), "br"))
+
+    print(f"{args.plans} plans\n")
+    print(f"{'encoding':<26} {'KB':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    baseline = None
+    for label, settings, accept in variants:
+        response_encoding.orjson = settings["orjson"]
+        encoder.splice, encoder.compress = settings["splice"], settings["compress"]
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.post("/graphql", json={"query": DASHBOARD_QUERY, "variables": {"userId": 1}},
+                                   headers={"Accept-Encoding": accept or "identity"})
+            timings.append((time.perf_counter() - started) * 1000)
+        document = decode(response)
+        assert "errors" not in document, document["errors"]
+        if baseline is None:
+            baseline = document
+        assert document == baseline, f"{label} returned a different document"
+        # Both percentiles come from the same cut points, so p95 is never below p50.
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        print(f"{label:<26} {len(response.data) / 1024:>9.1f} {cuts[49]:>9.2f} {cuts[94]:>9.2f}")
+    response_encoding.orjson = installed_orjson
+
+
+if __name__ == "__main__":
+    main()
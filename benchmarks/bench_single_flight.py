@@ -0,0 +1,100 @@
+# benchmarks/bench_single_flight.py
+# Concurrency check for request coalescing: bursts of identical getRecipe and
+# generateDietPlan requests hit a stub model, first from threads of one
+# process, then across gunicorn workers. Reports upstream calls per burst with
+# coalescing off, per process, and shared through SQLite.
+#
+# Usage: python benchmarks/bench_single_flight.py [--burst 20] [--llm-latency 0.5] [--workers 4]
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "bench.db")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["QUERY_COST_ENABLED"] = "0"
+
+import requests  # noqa: E402
+
+import backend_server  # noqa: E402
+from bench_async_mode import free_port, start_server  # noqa: E402
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+RECIPE_QUERY = "mutation GetRecipe($dish: String!) { getRecipe(dishName: $dish) }"
+PLAN_QUERY = """
+    mutation Plan($userId: ID!) {
+        generateDietPlan(userId: $userId, weight: 72, height: 175, activityLevel: "Moderately Active",
+                         includeCheatMeal: false, dietaryPreference: "Vegetarian", allergies: []) { success }
+    }
+"""
+
+
+def burst(send, size):
+    """Fires `size` requests at once and returns the wall time of the burst."""
+    barrier = threading.Barrier(size)
+
+    def worker(index):
+        barrier.wait()
+        send(index)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(size)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def in_process(llm, size):
+    backend_server.init_db()
+    client = backend_server.app.test_client()
+    print(f"{'threads, one process':<24} {'mode':<8} {'requests':>9} {'upstream':>9} {'seconds':>8}")
+    for round_id, mode in enumerate(("off", "process", "shared")):
+        backend_server.LLM_SINGLE_FLIGHT = mode
+        for name, payload in (
+            ("getRecipe", {"query": RECIPE_QUERY, "variables": {"dish": f"Pesarattu {round_id}"}}),
+            ("generateDietPlan", {"query": PLAN_QUERY, "variables": {"userId": 1}}),
+        ):
+            calls_before = llm.calls
+            elapsed = burst(lambda _: client.post("/graphql", json=payload), size)
+            print(f"{name:<24} {mode:<8} {size:>9} {llm.calls - calls_before:>9} {elapsed:>8.2f}")
+
+
+def across_workers(llm, size, workers):
+    print(f"\n{'gunicorn workers':<24} {'mode':<8} {'requests':>9} {'upstream':>9} {'seconds':>8}")
+    for round_id, mode in enumerate(("process", "shared")):
+        env = {**os.environ, "OPENAI_API_KEY": "sk-fake", "OPENAI_BASE_URL": llm.base_url, "LLM_SINGLE_FLIGHT": mode}
+        process, url = start_server("sync", free_port(), env, workers)
+        try:
+            sessions = [requests.Session() for _ in range(size)]
+            payload = {"query": RECIPE_QUERY, "variables": {"dish": f"Gongura Pachadi {round_id}"}}
+            calls_before = llm.calls
+            elapsed = burst(lambda index: sessions[index].post(url, json=payload, timeout=60), size)
+            print(f"{'getRecipe':<24} {mode:<8} {size:>9} {llm.calls - calls_before:>9} {elapsed:>8.2f}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upstream calls for bursts of identical LLM requests")
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    llm = FakeOpenAIServer(latency=args.llm_latency).start()
+    llm.install(backend_server.openai)
+    in_process(llm, args.burst)
+    across_workers(llm, args.burst, args.workers)
+    llm.stop()
+
+
+if __name__ == "__main__":
+    main()
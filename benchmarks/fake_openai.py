@@ -0,0 +1,244 @@
+# benchmarks/fake_openai.py
+# Local stand-in for the OpenAI chat completions API, so benchmarks never
+# call (or pay for) the real service. Point the openai client at it with
+# OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 or FakeOpenAIServer.install().
+#
+# Usage: python benchmarks/fake_openai.py [--port 8089] [--latency 0.5] [--chunk-delay 0.01]
+#        [--rate-limit 10 --rate-window 1.0]
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MEALS = ["Breakfast", "Lunch", "Snack", "Dinner"]
+DISHES = [
+    "Pesarattu", "Idli with Sambar", "Upma", "Gongura Pachadi with Rice", "Pulihora",
+    "Bagara Annam", "Sakinalu", "Punugulu", "Mirchi Bajji", "Tomato Pappu",
+    "Gutti Vankaya Kura", "Dondakaya Fry", "Ragi Sangati", "Sarva Pindi", "Bobbatlu",
+]
+
+
+def fake_meal(name, dish):
+    calories = random.randint(250, 650)
+    return {
+        "name": name, "dish": dish, "quantity": "1 plate",
+        "nutrition": {"calories": calories, "protein_g": calories // 30, "carbs_g": calories // 7, "fat_g": calories // 40},
+    }
+
+
+def fake_day(day):
+    meals = [fake_meal(name, random.choice(DISHES)) for name in MEALS]
+    return {"day": day, "daily_calories": sum(m["nutrition"]["calories"] for m in meals), "meals": meals}
+
+
+def fake_plan():
+    return {
+        "diet": [fake_day(day) for day in DAYS],
+        "exercises": [{"day": day, "activity": "30-minute brisk walk"} for day in DAYS],
+        "shoppingList": [{"category": "Vegetables", "items": ["Gongura", "Brinjal", "Tomato"]},
+                         {"category": "Grains", "items": ["Rice", "Ragi", "Moong dal"]}],
+    }
+
+
+def default_responder(request_body, counter):
+    """Builds a plausible completion based on which resolver's prompt was sent."""
+    system_prompt = request_body["messages"][0]["content"]
+    user_prompt = request_body["messages"][-1]["content"]
+    if '"alternatives"' in system_prompt:
+        match = re.search(r"suggest (\d+) different", system_prompt)
+        count = int(match.group(1)) if match else 1
+        meal_name = re.search(r'"name": "([^"]*)"', system_prompt).group(1)
+        return json.dumps({"alternatives": [fake_meal(meal_name, f"Swap Dish {next(counter)}") for _ in range(count)]})
+    if '"diet"' in system_prompt:
+        return json.dumps(fake_plan())
+    if '"ingredients"' in system_prompt:
+        day = fake_day(re.search(r"meals for (\w+)", user_prompt).group(1))
+        day["ingredients"] = [{"category": "Vegetables", "items": ["Gongura", "Tomato"]}, {"category": "Grains", "items": ["Rice"]}]
+        return json.dumps(day)
+    if '"exercises"' in system_prompt:
+        return json.dumps({"exercises": [{"day": day, "activity": "30-minute brisk walk"} for day in DAYS]})
+    dish = re.search(r"'(.*)'", user_prompt)
+    return f"Recipe for {dish.group(1) if dish else 'the dish'}: soak, grind, season and cook on a hot tawa."
+
+
+def usage(request_body, content):
+    """Token counts at roughly four characters per token."""
+    prompt_tokens = sum(len(m["content"]) // 4 for m in request_body["messages"])
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4, "total_tokens": prompt_tokens + len(content) // 4}
+
+
+class FakeOpenAIServer:
+    """
+    Threaded HTTP server answering POST /v1/chat/completions. Requests with
+    "stream": true get the completion as SSE chunks of `stream_chunk_chars`
+    characters, `stream_chunk_delay` seconds apart, like a model emitting tokens,
+    followed by a usage chunk if stream_options asks for one.
+    With `rate_limit` set, requests beyond that many per sliding `rate_window`
+    seconds get a 429 with Retry-After, like an account at its RPM limit.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, responder=default_responder, host="127.0.0.1", port=0,
+                 stream_chunk_chars=16, stream_chunk_delay=0.0, rate_limit=None, rate_window=1.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._accepted = deque()
+        self.responder = responder
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay = stream_chunk_delay
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _admit(self):
+        """Returns 0 if the request fits the rate limit, else the seconds until it would."""
+        with self._lock:
+            self.calls += 1
+            if self.rate_limit is None:
+                return 0
+            now = time.monotonic()
+            while self._accepted and self._accepted[0] <= now - self.rate_window:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.rate_limit:
+                self.rate_limited += 1
+                return self._accepted[0] + self.rate_window - now
+            self._accepted.append(now)
+            return 0
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, request_body, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                chunk_id = f"chatcmpl-fake-{next(server._counter)}"
+                pieces = [content[i:i + server.stream_chunk_chars] for i in range(0, len(content), server.stream_chunk_chars)]
+                for index, piece in enumerate(pieces + [None]):
+                    chunk = {
+                        "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": request_body.get("model", "fake"),
+                        "choices": [{"index": 0, "delta": {"content": piece} if piece else {},
+                                     "finish_reason": None if piece else "stop"}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    if piece and server.stream_chunk_delay:
+                        time.sleep(server.stream_chunk_delay)
+                if (request_body.get("stream_options") or {}).get("include_usage"):
+                    usage_chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                                   "model": request_body.get("model", "fake"), "choices": [], "usage": usage(request_body, content)}
+                    self.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                request_body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                retry_after = server._admit()
+                if retry_after:
+                    self._send_json(429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                                    "code": "rate_limit_exceeded"}},
+                                    headers={"Retry-After": f"{retry_after:.3f}"})
+                    return
+                with server._lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    self._respond(request_body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _respond(self, request_body):
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.error_rate and random.random() < server.error_rate:
+                    self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+                    return
+                content = server.responder(request_body, server._counter)
+                if request_body.get("stream"):
+                    self._send_stream(request_body, content)
+                    return
+                if server.stream_chunk_delay:
+                    # A non-streamed answer takes as long to generate as a streamed one.
+                    time.sleep(-(-len(content) // server.stream_chunk_chars) * server.stream_chunk_delay)
+                self._send_json(200, {
+                    "id": f"chatcmpl-fake-{next(server._counter)}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request_body.get("model", "fake"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage(request_body, content),
+                })
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def install(self, openai_module):
+        """Points the module-level openai client at this server."""
+        openai_module.api_key = "sk-fake"
+        openai_module.base_url = self.base_url
+        openai_module.max_retries = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests allowed per rate window before 429s")
+    parser.add_argument("--rate-window", type=float, default=1.0, help="sliding window for --rate-limit, in seconds")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(latency=args.latency, error_rate=args.error_rate, port=args.port,
+                              stream_chunk_delay=args.chunk_delay, rate_limit=args.rate_limit, rate_window=args.rate_window)
+    print(f"Fake OpenAI listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
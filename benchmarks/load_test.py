@@ -0,0 +1,436 @@
+# benchmarks/load_test.py
+# Reproducible load test of the whole backend. It:
+#   - seeds a temporary database with synthetic users, plans and weight logs
+#   - starts backend_server.app (gunicorn, or the async mode) against it, with
+#     the openai client pointed at fake_openai.py
+#   - replays a seeded mix of GraphQL operations from concurrent clients
+# It reports, per endpoint, throughput, p50/p95/p99 latency, errors and the
+# peak memory one request allocates, plus the server's resident memory. The
+# results go to a JSON file, and --compare prints the change against an
+# earlier run.
+#
+# Usage: python benchmarks/load_test.py [--mix default] [--clients 16] [--requests 50]
+#        [--mode sync|async] [--workers 2] [--llm-latency 0.5] [--llm-error-rate 0.0]
+#        [--llm-chunk-delay 0.0] [--users 200] [--plans-per-user 5] [--progress 180]
+#        [--seed 42] [--env KEY=VALUE ...] [--output results.json] [--compare baseline.json]
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import requests
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCHMARKS, "..")
+sys.path.insert(0, ROOT)
+
+from bench_async_mode import free_port, percentile, start_server  # noqa: E402
+from fake_openai import DISHES, FakeOpenAIServer, fake_plan  # noqa: E402
+from plan_batch import insert_diet_plans  # noqa: E402
+from query_cost import USER_HEADER  # noqa: E402
+from synthetic_data import ACTIVITY_LEVELS, generate  # noqa: E402
+
+PASSWORD = "load-test"
+PREFERENCES = ["Vegetarian", "Non-Vegetarian"]
+RESULTS_DIR = os.path.join(BENCHMARKS, "results")
+
+LOGIN_QUERY = "mutation Login($u: String!, $p: String!) { loginUser(username: $u, password: $p) { success user { id } } }"
+# What streamlit_app.py's dashboard page asks for.
+DASHBOARD_QUERY = """
+    query GetUserDashboard($userId: ID!, $first: Int!) {
+        getUserDashboard(userId: $userId) {
+            progressAnalytics { total_entries points { log_date weight_kg rolling_avg_kg } trend { slope_kg_per_week } }
+            pastPlansConnection(first: $first) { edges { node { id created_at weight_kg bmi dietary_preference } } pageInfo { hasNextPage } }
+        }
+    }
+"""
+LOG_WEIGHT_QUERY = "mutation LogWeight($userId: ID!, $weight: Float!, $date: Date!) { logWeight(userId: $userId, weight: $weight, date: $date) { success } }"
+GENERATE_QUERY = """
+    mutation Generate($userId: ID!, $weight: Float!, $height: Float!, $activityLevel: String!, $includeCheatMeal: Boolean!, $dietaryPreference: String!) {
+        generateDietPlan(userId: $userId, weight: $weight, height: $height, activityLevel: $activityLevel,
+                         includeCheatMeal: $includeCheatMeal, dietaryPreference: $dietaryPreference, allergies: []) {
+            success dietPlan { id generated_plan { diet { day meals { dish } } } }
+        }
+    }
+"""
+SWAP_QUERY = "mutation Swap($meal: String!, $dish: String!, $pref: String!) { swapMeal(mealName: $meal, dishToSwap: $dish, dietaryPreference: $pref) { dish nutrition { calories } } }"
+RECIPE_QUERY = "mutation Recipe($dish: String!) { getRecipe(dishName: $dish) }"
+
+
+# --- Clients ---
+class HTTPClient:
+    """Talks to the server under test over HTTP, one keep-alive session per load-test client."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def graphql(self, query, variables, user=None):
+        headers = {USER_HEADER: str(user["id"])} if user else None
+        response = self.session.post(f"{self.base_url}/graphql", json={"query": query, "variables": variables}, headers=headers, timeout=300)
+        return response.status_code, response.json() if response.status_code == 200 else None
+
+    def stream_plan(self, variables):
+        with self.session.post(f"{self.base_url}/plans/stream", json=variables, stream=True, timeout=300) as response:
+            events = [line[len("event: "):] for line in response.iter_lines(decode_unicode=True) if line.startswith("event: ")]
+        return response.status_code, events
+
+
+class InProcessClient:
+    """Same interface on Flask's test client, for the per-request memory pass."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def graphql(self, query, variables, user=None):
+        headers = {USER_HEADER: str(user["id"])} if user else None
+        response = self.client.post("/graphql", json={"query": query, "variables": variables}, headers=headers)
+        return response.status_code, response.get_json()
+
+    def stream_plan(self, variables):
+        response = self.client.post("/plans/stream", json=variables)
+        events = [line[len("event: "):] for line in response.get_data(as_text=True).splitlines() if line.startswith("event: ")]
+        return response.status_code, events
+
+
+# --- Endpoints ---
+# Each takes (client, rng, user) and returns whether the request succeeded.
+def _ok(status, body, field, check=lambda value: value is not None):
+    return status == 200 and body is not None and not body.get("errors") and check((body.get("data") or {}).get(field))
+
+
+def _profile(rng, user):
+    weight = round(rng.uniform(50, 110), 1)
+    return {"userId": user["id"], "weight": weight, "height": round(rng.uniform(150, 195), 1), "activityLevel": rng.choice(ACTIVITY_LEVELS),
+            "includeCheatMeal": rng.random() < 0.3, "dietaryPreference": rng.choice(PREFERENCES)}
+
+
+def login_user(client, rng, user):
+    return _ok(*client.graphql(LOGIN_QUERY, {"u": user["username"], "p": PASSWORD}), "loginUser", lambda value: value and value["success"])
+
+
+def get_user_dashboard(client, rng, user):
+    return _ok(*client.graphql(DASHBOARD_QUERY, {"userId": user["id"], "first": 10}), "getUserDashboard")
+
+
+def log_weight(client, rng, user):
+    day = date(2024, 1, 1) + timedelta(days=rng.randrange(730))
+    variables = {"userId": user["id"], "weight": round(rng.uniform(50, 110), 1), "date": day.isoformat()}
+    return _ok(*client.graphql(LOG_WEIGHT_QUERY, variables), "logWeight", lambda value: value and value["success"])
+
+
+def generate_diet_plan(client, rng, user):
+    return _ok(*client.graphql(GENERATE_QUERY, _profile(rng, user)), "generateDietPlan", lambda value: value and value["success"])
+
+
+def swap_meal(client, rng, user):
+    variables = {"meal": rng.choice(["Breakfast", "Lunch", "Snack", "Dinner"]), "dish": rng.choice(DISHES), "pref": rng.choice(PREFERENCES)}
+    return _ok(*client.graphql(SWAP_QUERY, variables, user), "swapMeal")
+
+
+def get_recipe(client, rng, user):
+    # A long tail of dishes, so some answers come from the recipe store and some from the LLM.
+    dish = f"{rng.choice(DISHES)} {rng.randrange(50)}" if rng.random() < 0.5 else rng.choice(DISHES)
+    return _ok(*client.graphql(RECIPE_QUERY, {"dish": dish}, user), "getRecipe")
+
+
+def stream_plan(client, rng, user):
+    status, events = client.stream_plan({**_profile(rng, user), "allergies": []})
+    return status == 200 and "dietPlan" in events
+
+
+ENDPOINTS = {
+    "loginUser": login_user,
+    "getUserDashboard": get_user_dashboard,
+    "logWeight": log_weight,
+    "generateDietPlan": generate_diet_plan,
+    "swapMeal": swap_meal,
+    "getRecipe": get_recipe,
+    "streamPlan": stream_plan,
+}
+
+# Relative weights of each endpoint in a scripted mix.
+MIXES = {
+    "default": {"loginUser": 15, "getUserDashboard": 40, "logWeight": 20, "swapMeal": 10, "getRecipe": 10, "generateDietPlan": 5},
+    "read_heavy": {"loginUser": 10, "getUserDashboard": 80, "logWeight": 10},
+    "write_heavy": {"loginUser": 10, "getUserDashboard": 30, "logWeight": 60},
+    "llm_heavy": {"getUserDashboard": 20, "generateDietPlan": 20, "streamPlan": 10, "swapMeal": 25, "getRecipe": 25},
+}
+
+
+# --- Setup ---
+def seed_database(server, users, plans_per_user, progress_days, seed):
+    """Fills the empty database with synthetic users (all with PASSWORD), plans and weight logs; returns the users."""
+    rng = random.Random(seed)
+    # fake_plan() draws from the module-level generator.
+    random.seed(seed)
+    with server.db_pool.connection() as conn:
+        generate(conn, users=users, plans=0, progress_per_user=progress_days, seed=seed)
+        conn.execute("UPDATE users SET password_hash = ?", (server.hash_password(PASSWORD),))
+        conn.commit()
+        rows = [dict(row) for row in conn.execute("SELECT id, username FROM users ORDER BY id")]
+        batch = []
+        for user in rows:
+            for _ in range(plans_per_user):
+                profile = _profile(rng, user)
+                batch.append((profile, round(profile["weight"] / (profile["height"] / 100) ** 2, 2), fake_plan()))
+            if len(batch) >= 500:
+                insert_diet_plans(conn, batch)
+                batch = []
+        insert_diet_plans(conn, batch)
+        conn.commit()
+    return rows
+
+
+class MemorySampler:
+    """Samples the resident memory of the server process and its children (gunicorn workers) from /proc."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss_mb(self):
+        total = 0
+        for pid in [self.pid] + self._children():
+            try:
+                with open(f"/proc/{pid}/status") as status:
+                    total += next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+            except (OSError, StopIteration):
+                continue
+        return total / 1024
+
+    def _children(self):
+        children = []
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as stat:
+                        if int(stat.read().rsplit(")", 1)[1].split()[1]) == self.pid:
+                            children.append(int(entry))
+                except (OSError, IndexError, ValueError):
+                    continue
+        return children
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append(self.rss_mb())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if os.path.isdir("/proc"):
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            self.samples.append(self.rss_mb())
+        if not self.samples:
+            return None
+        return {"start": round(self.samples[0], 1), "peak": round(max(self.samples), 1), "end": round(self.samples[-1], 1)}
+
+
+# --- Load ---
+def run_load(base_url, users, mix, clients, requests_per_client, seed):
+    """Each client replays its own seeded sequence of operations; returns (latencies and errors per endpoint, wall seconds)."""
+    names, weights = list(mix), list(mix.values())
+    results = {name: {"latencies": [], "errors": 0} for name in names}
+    lock = threading.Lock()
+
+    def client_loop(index):
+        rng = random.Random(seed * 1000 + index)
+        client = HTTPClient(base_url)
+        user = rng.choice(users)
+        for _ in range(requests_per_client):
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = ENDPOINTS[name](client, rng, user)
+            except (requests.exceptions.RequestException, ValueError):
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                results[name]["latencies"].append(elapsed)
+                results[name]["errors"] += not ok
+
+    threads = [threading.Thread(target=client_loop, args=(index,)) for index in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def measure_allocations(server, users, mix, samples, seed):
+    """
+    Median peak bytes traced by tracemalloc while one request of each endpoint
+    is handled in-process. One unmeasured request per endpoint first fills the
+    per-process caches (parsed documents, statements) that every later request reuses.
+    """
+    client = InProcessClient(server.app)
+    rng = random.Random(seed)
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for name in mix:
+            ENDPOINTS[name](client, rng, rng.choice(users))
+            values = []
+            for _ in range(samples):
+                user = rng.choice(users)
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                ENDPOINTS[name](client, rng, user)
+                values.append(tracemalloc.get_traced_memory()[1] - baseline)
+            peaks[name] = round(sorted(values)[len(values) // 2] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def summarize(results, wall_seconds):
+    endpoints = {}
+    for name, result in results.items():
+        latencies = result["latencies"]
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": result["errors"],
+            "throughput_rps": round(len(latencies) / wall_seconds, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "max_ms": round(max(latencies), 2) if latencies else None,
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return endpoints, {
+        "requests": total,
+        "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_rps": round(total / wall_seconds, 2),
+    }
+
+
+# --- Reporting ---
+def print_report(report):
+    print(f"\nmix {report['config']['mix']}, {report['config']['mode']} mode, {report['config']['clients']} clients: "
+          f"{report['totals']['requests']} requests in {report['totals']['wall_seconds']}s "
+          f"({report['totals']['throughput_rps']} req/s, {report['totals']['errors']} errors)\n")
+    print(f"{'endpoint':<18} {'req':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'alloc KB':>9}")
+    for name, endpoint in report["endpoints"].items():
+        alloc = endpoint.get("alloc_peak_kb")
+        print(f"{name:<18} {endpoint['requests']:>6} {endpoint['errors']:>5} {endpoint['throughput_rps']:>8.2f} "
+              f"{endpoint['p50_ms']:>9.1f} {endpoint['p95_ms']:>9.1f} {endpoint['p99_ms']:>9.1f} {alloc if alloc is not None else '-':>9}")
+    if report["server_memory_mb"]:
+        memory = report["server_memory_mb"]
+        print(f"\nserver RSS: {memory['start']} MB at start, {memory['peak']} MB peak, {memory['end']} MB at end")
+    print(f"fake OpenAI: {report['llm']['calls']} calls, {report['llm']['max_in_flight']} at most in flight")
+
+
+def print_comparison(report, baseline):
+    """Relative change of each endpoint's throughput and latency percentiles against `baseline`."""
+    print(f"\ncompared with {baseline['started_at']} ({baseline.get('git_commit') or 'unknown commit'}):\n")
+    print(f"{'endpoint':<18} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, endpoint in report["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            changes.append(f"{(endpoint[key] / before[key] - 1) * 100:+.1f}%" if before[key] else "n/a")
+        print(f"{name:<18} " + " ".join(f"{change:>9}" for change in changes))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend against a fake OpenAI server")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync", help="gunicorn (sync) or uvicorn (asgi_server.py)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers in sync mode")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the fake OpenAI waits before answering")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of fake OpenAI calls answered with HTTP 500")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.0, help="seconds between streamed chunks (and per chunk of unstreamed answers)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--plans-per-user", type=int, default=5)
+    parser.add_argument("--progress", type=int, default=180, help="daily weight entries per user")
+    parser.add_argument("--memory-samples", type=int, default=5, help="in-process requests per endpoint for allocation peaks (0 to skip)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra server environment, e.g. DASHBOARD_CACHE_ENABLED=0")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/load-<mix>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    llm = FakeOpenAIServer(latency=args.llm_latency, error_rate=args.llm_error_rate, stream_chunk_delay=args.llm_chunk_delay).start()
+    tmp = tempfile.TemporaryDirectory()
+    env = {
+        **os.environ, "DB_PATH": os.path.join(tmp.name, "load.db"), "OPENAI_API_KEY": "sk-fake", "OPENAI_BASE_URL": llm.base_url,
+        "SLOW_REQUEST_MS": "60000", **dict(item.split("=", 1) for item in args.env),
+    }
+    os.environ.update(env)
+    # Imported only now, since it configures itself from the environment set up above.
+    import backend_server
+
+    backend_server.init_db()
+    seeding_started = time.perf_counter()
+    users = seed_database(backend_server, args.users, args.plans_per_user, args.progress, args.seed)
+    print(f"Seeded {len(users)} users, {len(users) * args.plans_per_user} plans and {len(users) * args.progress} weights "
+          f"in {time.perf_counter() - seeding_started:.1f}s")
+
+    started_at = datetime.now().isoformat(timespec="seconds")
+    process, url = start_server(args.mode, free_port(), env, args.workers)
+    memory = MemorySampler(process.pid).start()
+    try:
+        results, wall_seconds = run_load(url.rsplit("/graphql", 1)[0], users, MIXES[args.mix], args.clients, args.requests, args.seed)
+    finally:
+        server_memory = memory.stop()
+        process.terminate()
+        process.wait()
+    endpoints, totals = summarize(results, wall_seconds)
+    if args.memory_samples:
+        for name, peak in measure_allocations(backend_server, users, MIXES[args.mix], args.memory_samples, args.seed).items():
+            endpoints[name]["alloc_peak_kb"] = peak
+    llm.stop()
+
+    report = {
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "mix_weights": MIXES[args.mix],
+        "totals": totals,
+        "endpoints": endpoints,
+        "server_memory_mb": server_memory,
+        "llm": {"calls": llm.calls, "max_in_flight": llm.max_in_flight},
+    }
+    print_report(report)
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{args.mix}-{started_at.replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump(report, results_file, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            print_comparison(report, json.load(baseline_file))
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
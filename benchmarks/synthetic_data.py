@@ -0,0 +1,119 @@
+# benchmarks/synthetic_data.py
+# Fills a database with synthetic users, diet plans and weight logs, for
+# benchmarks that need production-sized tables (up to 100k users / 1M plans).
+#
+# Usage: python benchmarks/synthetic_data.py --db /tmp/synthetic.db [--users 1000] [--plans 10000]
+#        [--progress 90] [--blob-bytes 4000] [--seed 42]
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migrations import migrate  # noqa: E402
+
+BATCH_SIZE = 10000
+PREFERENCES = ["Vegetarian", "Non-Vegetarian", "Eggetarian", "Vegan"]
+ACTIVITY_LEVELS = ["Sedentary", "Lightly Active", "Moderately Active", "Very Active"]
+
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _plan_blob(rng, blob_bytes):
+    """A plan JSON document padded to roughly `blob_bytes`, like a real stored plan."""
+    meal = {"name": "Lunch", "dish": "Gongura Pachadi with Rice", "quantity": "1 plate",
+            "nutrition": {"calories": 450, "protein_g": 12, "carbs_g": 70, "fat_g": 12}}
+    days, size = [], 2
+    while size < blob_bytes:
+        day = {"day": "Monday", "daily_calories": rng.randint(1500, 2500), "meals": [meal] * 4}
+        days.append(day)
+        size += len(json.dumps(day)) + 1
+    return json.dumps(days)
+
+
+def generate(conn, users=1000, plans=10000, progress_per_user=90, blob_bytes=4000, seed=42):
+    """
+    Inserts `users` users, `plans` plans spread randomly over them and
+    `progress_per_user` daily weights per user. Rows go in with executemany in
+    batches of BATCH_SIZE, one transaction per batch. Returns the row counts.
+    """
+    rng = random.Random(seed)
+    first_user = (conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0) + 1
+    user_ids = range(first_user, first_user + users)
+    for batch in _batched((user_id, f"synthetic_{user_id}", "x") for user_id in user_ids):
+        conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)", batch)
+        conn.commit()
+
+    blobs = [_plan_blob(rng, blob_bytes) for _ in range(8)]
+    started = datetime(2024, 1, 1)
+
+    def plan_rows():
+        for _ in range(plans):
+            weight = round(rng.uniform(50, 110), 1)
+            height = round(rng.uniform(150, 195), 1)
+            created_at = started + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            yield (rng.choice(user_ids), weight, height, rng.choice(ACTIVITY_LEVELS), rng.choice(PREFERENCES),
+                   rng.random() < 0.3, round(weight / (height / 100) ** 2, 2), rng.choice(blobs), "[]", "[]",
+                   created_at.strftime("%Y-%m-%d %H:%M:%S"))
+
+    for batch in _batched(plan_rows()):
+        conn.executemany(
+            "INSERT INTO diet_plans (user_id, weight_kg, height_cm, activity_level, dietary_preference, include_cheat_meal, bmi, generated_plan_json, exercise_plan_json, shopping_list_json, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+        conn.commit()
+
+    def progress_rows():
+        first_day = date(2024, 1, 1)
+        for user_id in user_ids:
+            weight = rng.uniform(60, 100)
+            for offset in range(progress_per_user):
+                weight += rng.uniform(-0.3, 0.25)
+                yield user_id, round(weight, 1), str(first_day + timedelta(days=offset))
+
+    for batch in _batched(progress_rows()):
+        conn.executemany("INSERT INTO user_progress (user_id, weight_kg, log_date) VALUES (?, ?, ?)", batch)
+        conn.commit()
+    return {"users": users, "plans": plans, "progress": users * progress_per_user}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic diet planner database.")
+    parser.add_argument("--db", required=True, help="path to the SQLite database file (created if missing)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--plans", type=int, default=10000)
+    parser.add_argument("--progress", type=int, default=90, help="weight log entries per user")
+    parser.add_argument("--blob-bytes", type=int, default=4000, help="approximate size of each plan's JSON column")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    migrate(conn)
+    begun = time.perf_counter()
+    counts = generate(conn, args.users, args.plans, args.progress, args.blob_bytes, args.seed)
+    conn.close()
+    print(f"Inserted {counts} into '{args.db}' in {time.perf_counter() - begun:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
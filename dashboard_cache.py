@@ -0,0 +1,116 @@
+# dashboard_cache.py
+# Server-side cache for getUserDashboard responses. Each user has a version
+# counter in the dashboard_versions table, bumped in the same transaction as
+# every write that changes their dashboard, so cached entries and ETags go
+# stale exactly when the data does, in every worker process.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from graphql import FieldNode, OperationDefinitionNode, OperationType, VariableNode, print_ast
+
+DASHBOARD_FIELD = "getUserDashboard"
+
+
+# --- Version Counters ---
+# The SQL is shared with the aiosqlite resolvers in asgi_server.py.
+BUMP_VERSION_SQL = (
+    "INSERT INTO dashboard_versions (user_id, version) VALUES (?, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET version = version + 1"
+)
+CURRENT_VERSION_SQL = "SELECT version FROM dashboard_versions WHERE user_id = ?"
+
+
+def bump_version(conn, user_id):
+    """Marks the user's dashboard as changed. Call inside the writing transaction."""
+    conn.execute(BUMP_VERSION_SQL, (user_id,))
+
+
+def current_version(conn, user_id):
+    row = conn.execute(CURRENT_VERSION_SQL, (user_id,)).fetchone()
+    return row["version"] if row else 0
+
+
+# --- Request Matching ---
+def dashboard_user_id(document, variables, operation_name=None):
+    """
+    Returns the userId if the requested operation is a query made only of
+    getUserDashboard fields for a single user, otherwise None.
+    """
+    operations = [d for d in document.definitions if isinstance(d, OperationDefinitionNode)]
+    if operation_name:
+        operations = [op for op in operations if op.name and op.name.value == operation_name]
+    if len(operations) != 1 or operations[0].operation != OperationType.QUERY:
+        return None
+    user_ids = set()
+    for selection in operations[0].selection_set.selections:
+        if not isinstance(selection, FieldNode) or selection.name.value != DASHBOARD_FIELD:
+            return None
+        for argument in selection.arguments:
+            if argument.name.value == "userId":
+                value = argument.value
+                user_ids.add((variables or {}).get(value.name.value) if isinstance(value, VariableNode) else getattr(value, "value", None))
+    if len(user_ids) != 1 or None in user_ids:
+        return None
+    return str(user_ids.pop())
+
+
+def make_request_key(document, variables, operation_name=None):
+    """Hashes the normalized query text, so whitespace and comments never split the cache."""
+    payload = json.dumps([print_ast(document), variables or {}, operation_name], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def make_etag(user_id, version, request_key):
+    return f'"{user_id}-{version}-{request_key[:16]}"'
+
+
+# --- Response Cache ---
+class DashboardResponseCache:
+    """Bounded LRU of per-user values (serialized dashboard responses, progress analytics), each tagged with the version it was built at."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, request_key, version):
+        with self._lock:
+            entry = self._entries.get(request_key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(request_key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, request_key, version, body):
+        with self._lock:
+            self._entries[request_key] = (version, body)
+            self._entries.move_to_end(request_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.not_modified
+            lookups = served + self.misses
+            return {
+                "hits": self.hits,
+                "not_modified": self.not_modified,
+                "misses": self.misses,
+                "hit_rate": served / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+            }
@@ -1,66 +1,46 @@
 # database_setup.py
-# Run this script once to create your new database structure.
-# Make sure to delete any old 'diet_planner.db' file first.
-
-import sqlite3
-import hashlib # For basic password hashing
-
-# --- Connect to SQLite database ---
-conn = sqlite3.connect('diet_planner.db')
-cursor = conn.cursor()
-
-# --- 1. Create the 'users' table ---
-# This table will store user login information.
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-''')
-print("Table 'users' created successfully.")
-
-# --- 2. Create the 'user_progress' table ---
-# This table will store daily weight entries for each user.
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS user_progress (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        weight_kg REAL NOT NULL,
-        log_date DATE NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-''')
-print("Table 'user_progress' created successfully.")
-
-
-# --- 3. Create the 'diet_plans' table (Updated) ---
-# This table now links each plan to a user.
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS diet_plans (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        weight_kg REAL NOT NULL,
-        height_cm REAL NOT NULL,
-        activity_level TEXT NOT NULL,
-        dietary_preference TEXT NOT NULL,
-        include_cheat_meal BOOLEAN NOT NULL,
-        bmi REAL NOT NULL,
-        generated_plan_json TEXT NOT NULL,
-        exercise_plan_json TEXT, -- New column for exercises
-        shopping_list_json TEXT, -- New column for shopping list
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-''')
-print("Table 'diet_plans' updated successfully.")
-
-
-# --- Commit the changes and close the connection ---
-conn.commit()
-conn.close()
-
-print("\nDatabase 'diet_planner.db' and all tables created successfully.")
-print("You can now run the new backend_server.py.")
+# Run this script to create the database, or to upgrade an existing one, to the
+# latest schema. It applies the same versioned migrations as init_db() in
+# backend_server.py (see migrations.py), so both paths produce the same tables.
+#
+# Usage: python database_setup.py [--db data/diet_planner.db] [--backfill] [--batch-size 500]
+
+import argparse
+import os
+
+from db import ConnectionPool
+from migrations import MIGRATIONS, backfill_plan_rollups, backfill_plan_tables, migrate
+
+DEFAULT_DB_PATH = os.getenv("DB_PATH", os.path.join("data", "diet_planner.db"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or upgrade the diet planner database.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="path to the SQLite database file")
+    parser.add_argument("--backfill", action="store_true",
+                        help="copy any plans still missing from the normalized tables out of their JSON columns, "
+                             "and roll up the macros of any plan without totals")
+    parser.add_argument("--batch-size", type=int, default=500, help="plans per backfill transaction")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    pool = ConnectionPool(args.db)
+    with pool.connection() as conn:
+        applied = migrate(conn)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        print(f"Applied migrations: {applied or 'none'}. Schema version is {version} of {MIGRATIONS[-1][0]}.")
+        if args.backfill:
+            migrated = backfill_plan_tables(conn, batch_size=args.batch_size)
+            print(f"Backfilled {migrated} plans into the normalized plan tables.")
+            rolled_up = backfill_plan_rollups(conn, batch_size=args.batch_size)
+            print(f"Rolled up nutrition totals for {rolled_up} plans.")
+        mismatched = conn.execute("SELECT COUNT(*) FROM plan_totals WHERE mismatched_days > 0").fetchone()[0]
+        if mismatched:
+            print(f"{mismatched} plans have days whose daily_calories disagree with the sum of their meals.")
+    pool.close_all()
+
+    print(f"\nDatabase '{args.db}' is up to date.")
+
+
+if __name__ == "__main__":
+    main()
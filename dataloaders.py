@@ -0,0 +1,95 @@
+# dataloaders.py
+# Request-scoped batch loading for the fields resolved once per parent object:
+# each plan's diet, exercises, shopping list and weekly totals, and each
+# plan's user. graphql_sync resolves a list item's whole subtree before it
+# moves on to the next item, so a loader cannot wait for the siblings' keys to
+# arrive; instead the resolver that returns the list announces them with
+# expect(), and the first load() fetches every announced key with one
+# IN (...) query. Loaded values are memoized for the rest of the request.
+# backend_server puts a PlanLoaders in every execution's context value.
+
+import json
+import threading
+from functools import partial
+
+from plan_store import PLAN_JSON_COLUMNS, batch_load_diet, batch_load_exercises, batch_load_plan_json, batch_load_shopping_list, batch_load_weekly_totals
+
+# Columns of the diet_plans rows loaded by id (getPlan, PlanJob.dietPlan).
+PLAN_COLUMNS = ("id", "user_id", "created_at", "weight_kg", "bmi", "dietary_preference")
+
+
+def batch_load_plans(conn, plan_ids):
+    rows = conn.execute(f"SELECT {', '.join(PLAN_COLUMNS)} FROM diet_plans WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(plan_ids),))
+    return {row["id"]: dict(row) for row in rows}
+
+
+def batch_load_users(conn, user_ids):
+    rows = conn.execute("SELECT id, username FROM users WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(user_ids),))
+    return {row["id"]: dict(row) for row in rows}
+
+
+class DataLoader:
+    """
+    Loads values by key through batch_load(conn, keys), which returns a dict
+    of the keys it found; missing keys load as `default`. Keys must be of the
+    type the batch returns (integer ids, not ID strings). Thread-safe, since
+    the ASGI server resolves sibling fields on several threads.
+    """
+
+    def __init__(self, pool, batch_load, default=None):
+        self.pool = pool
+        self.batch_load = batch_load
+        self.default = default
+        self.batches = 0
+        self._values = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def expect(self, keys):
+        """Queues keys to be fetched along with the next load()."""
+        with self._lock:
+            for key in keys:
+                if key not in self._values:
+                    self._pending[key] = None
+
+    def load(self, key):
+        with self._lock:
+            if key not in self._values:
+                self._pending[key] = None
+                keys = list(self._pending)
+                self._pending.clear()
+                with self.pool.connection() as conn:
+                    found = self.batch_load(conn, keys)
+                self.batches += 1
+                for pending_key in keys:
+                    self._values[pending_key] = found.get(pending_key, self.default)
+            return self._values[key]
+
+
+class PlanLoaders:
+    """The loaders of one request, over the server's connection pool."""
+
+    def __init__(self, pool):
+        self.plans = DataLoader(pool, batch_load_plans)
+        self.users = DataLoader(pool, batch_load_users)
+        self.weekly_totals = DataLoader(pool, batch_load_weekly_totals)
+        # Plan field -> loader of its rows, and of its stored JSON.
+        self.sections = {
+            "diet": DataLoader(pool, batch_load_diet, default=()),
+            "exercises": DataLoader(pool, batch_load_exercises, default=()),
+            "shoppingList": DataLoader(pool, batch_load_shopping_list, default=()),
+        }
+        self.plan_json = {field: DataLoader(pool, partial(batch_load_plan_json, field=field)) for field in PLAN_JSON_COLUMNS}
+
+    def expect_plans(self, plans):
+        """Announces the stored plans a list field returned, so each of their sections and users loads in one query."""
+        plan_ids = [plan["id"] for plan in plans]
+        for loader in (self.weekly_totals, *self.sections.values(), *self.plan_json.values()):
+            loader.expect(plan_ids)
+        self.users.expect({plan["user_id"] for plan in plans if plan.get("user_id") is not None})
+
+    def batches(self):
+        """Queries issued so far by each loader that ran."""
+        loaders = {"plans": self.plans, "users": self.users, "weeklyTotals": self.weekly_totals, **self.sections}
+        loaders.update((f"{field}_json", loader) for field, loader in self.plan_json.items())
+        return {name: loader.batches for name, loader in loaders.items() if loader.batches}
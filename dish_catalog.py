@@ -0,0 +1,216 @@
+# dish_catalog.py
+# A catalogue of every dish already served in a stored plan, for answering
+# swapMeal without the model. Each dish keeps its name, a typical quantity,
+# the dietary preferences and meal slots it was served under, and its mean
+# macros, in NumPy arrays that are scanned as one vectorized nearest-neighbor
+# search over (calories, protein_g, carbs_g, fat_g). A background thread
+# builds the catalogue when the worker starts, then catches up on the
+# plan_meals rows inserted since its last look (by any worker) every few
+# seconds, or as soon as this worker stores a plan. Lookups never touch the
+# database; until the first build finishes they find nothing.
+
+import threading
+
+import numpy as np
+
+from plan_store import NUTRITION_KEYS
+from recipe_store import normalize_dish_name
+
+# Absolute slack per macro for dishes with small values, in NUTRITION_KEYS order.
+MIN_MACRO_SLACK = np.array([60.0, 4.0, 8.0, 4.0], dtype=np.float32)
+# Stated calories must be within this fraction (or kcal) of 4 kcal/g protein and carbs, 9 kcal/g fat.
+ATWATER_TOLERANCE = 0.25
+ATWATER_SLACK_KCAL = 50
+# Tags (preferences, meal slots) are bits of a uint64; later distinct tags are not tracked.
+MAX_TAGS = 64
+
+NEW_MEALS_SQL = (
+    "SELECT plan_meals.id, plan_meals.name, dish, quantity, calories, protein_g, carbs_g, fat_g, diet_plans.dietary_preference "
+    "FROM plan_meals JOIN diet_plans ON diet_plans.id = plan_meals.plan_id WHERE plan_meals.id > ? ORDER BY plan_meals.id"
+)
+
+
+def plausible_nutrition(nutrition):
+    """Whether a meal's stated calories agree with its macros (Atwater factors), which catches made-up numbers."""
+    try:
+        calories = float(nutrition["calories"])
+        estimate = 4 * float(nutrition["protein_g"]) + 4 * float(nutrition["carbs_g"]) + 9 * float(nutrition["fat_g"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return calories > 0 and abs(calories - estimate) <= max(ATWATER_SLACK_KCAL, calories * ATWATER_TOLERANCE)
+
+
+def _tag(value):
+    return (value or "").strip().lower()
+
+
+class DishCatalog:
+    """
+    Dishes by normalized name, with their macros averaged over every serving.
+    `similar()` returns dishes whose every macro is within `tolerance` (or
+    MIN_MACRO_SLACK) of the dish being swapped, nearest first. `_lock` guards
+    the index for lookups and is only held while a parsed batch is applied;
+    `_refresh_lock` serializes the reads from plan_meals.
+    """
+
+    def __init__(self, pool, tolerance=0.2, batch_size=5000):
+        self.pool = pool
+        self.tolerance = tolerance
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.ready = False
+        self._rows = {}
+        self._keys = {}
+        self._names = []
+        self._quantities = []
+        self._tag_bits = {"preference": {}, "meal": {}}
+        self._sums = np.zeros((0, len(NUTRITION_KEYS)), dtype=np.float64)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._preferences = np.zeros(0, dtype=np.uint64)
+        self._meals = np.zeros(0, dtype=np.uint64)
+        self._macros = np.zeros((0, len(NUTRITION_KEYS)), dtype=np.float32)
+        self._last_meal_id = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _bit(self, kind, value):
+        bits = self._tag_bits[kind]
+        if value not in bits and len(bits) < MAX_TAGS:
+            bits[value] = 1 << len(bits)
+        return bits.get(value, 0)
+
+    def _grow(self, size):
+        """Makes room for `size` dishes, doubling the arrays so appends stay amortized O(1)."""
+        capacity = len(self._counts)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 64)
+        extra = capacity - len(self._counts)
+        self._sums = np.concatenate([self._sums, np.zeros((extra, len(NUTRITION_KEYS)))])
+        self._counts = np.concatenate([self._counts, np.zeros(extra, dtype=np.int64)])
+        self._preferences = np.concatenate([self._preferences, np.zeros(extra, dtype=np.uint64)])
+        self._meals = np.concatenate([self._meals, np.zeros(extra, dtype=np.uint64)])
+        self._macros = np.concatenate([self._macros, np.zeros((extra, len(NUTRITION_KEYS)), dtype=np.float32)])
+
+    def _parse(self, rows):
+        """(dish key, row, macros) of each plausible meal in `rows`; done outside `_lock`."""
+        meals = []
+        for row in rows:
+            nutrition = {key: row[key] for key in NUTRITION_KEYS}
+            if not row["dish"] or not plausible_nutrition(nutrition):
+                self.skipped += 1
+                continue
+            dish_key = self._keys.get(row["dish"])
+            if dish_key is None:
+                dish_key = self._keys[row["dish"]] = normalize_dish_name(row["dish"])
+            meals.append((dish_key, row, [float(nutrition[key]) for key in NUTRITION_KEYS]))
+        return meals
+
+    def _add(self, meals):
+        """Adds parsed meals to the index. The caller holds `_lock`."""
+        indices, preferences, slots = [], [], []
+        for dish_key, row, _ in meals:
+            index = self._rows.get(dish_key)
+            if index is None:
+                index = self._rows[dish_key] = len(self._names)
+                self._names.append(row["dish"])
+                self._quantities.append(row["quantity"])
+            indices.append(index)
+            preferences.append(self._bit("preference", _tag(row["dietary_preference"])))
+            slots.append(self._bit("meal", _tag(row["name"])))
+        if not indices:
+            return
+        self._grow(len(self._names))
+        indices = np.array(indices, dtype=np.int64)
+        np.add.at(self._sums, indices, np.array([macros for _, _, macros in meals]))
+        np.add.at(self._counts, indices, 1)
+        np.bitwise_or.at(self._preferences, indices, np.array(preferences, dtype=np.uint64))
+        np.bitwise_or.at(self._meals, indices, np.array(slots, dtype=np.uint64))
+        touched = np.unique(indices)
+        self._macros[touched] = self._sums[touched] / self._counts[touched, None]
+
+    def refresh(self):
+        """Adds the meals stored since the last refresh; returns how many rows were read."""
+        with self._refresh_lock:
+            read = 0
+            with self.pool.connection() as conn:
+                cursor = conn.execute(NEW_MEALS_SQL, (self._last_meal_id,))
+                while rows := cursor.fetchmany(self.batch_size):
+                    meals = self._parse(rows)
+                    with self._lock:
+                        self._add(meals)
+                    self._last_meal_id = rows[-1]["id"]
+                    read += len(rows)
+            self.ready = True
+            return read
+
+    # --- Background Refresh ---
+    def start(self, interval_seconds=30):
+        """Builds the catalogue on a daemon thread, then catches up every `interval_seconds` or when notified."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(interval_seconds,), name="dish-catalog", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Asks the background thread to catch up now; called after this worker stores plans."""
+        self._wake.set()
+
+    def _run(self, interval_seconds):
+        while True:
+            self._wake.clear()
+            try:
+                read = self.refresh()
+            except Exception as e:
+                print(f"Dish catalogue refresh failed: {e}")
+            else:
+                if read >= self.batch_size:
+                    print(f"Dish catalogue: added {read} stored meals, {len(self._names)} dishes.")
+            self._wake.wait(interval_seconds)
+
+    def similar(self, dish, meal_name, dietary_preference, limit=3):
+        """
+        Up to `limit` catalogue meals to swap in for `dish`, as Meal dicts named
+        `meal_name`: served under `dietary_preference` (and under the same meal
+        slot, when that slot is known), excluding `dish` itself. Empty if the
+        dish is unknown, nothing is close enough, or the catalogue is still
+        being built. Reads only the in-memory index.
+        """
+        with self._lock:
+            index = self._rows.get(normalize_dish_name(dish))
+            preference_bit = self._tag_bits["preference"].get(_tag(dietary_preference))
+            if index is None or preference_bit is None:
+                self.misses += 1
+                return []
+            size = len(self._names)
+            macros = self._macros[:size]
+            target = macros[index]
+            offsets = np.abs(macros - target) / np.maximum(target * self.tolerance, MIN_MACRO_SLACK)
+            mask = (offsets.max(axis=1) <= 1.0) & ((self._preferences[:size] & np.uint64(preference_bit)) != 0)
+            meal_bit = self._tag_bits["meal"].get(_tag(meal_name))
+            if meal_bit is not None:
+                mask &= (self._meals[:size] & np.uint64(meal_bit)) != 0
+            mask[index] = False
+            candidates = np.flatnonzero(mask)
+            if not len(candidates):
+                self.misses += 1
+                return []
+            distances = np.square(offsets[candidates]).sum(axis=1)
+            nearest = candidates[np.argsort(distances, kind="stable")[:limit]]
+            self.hits += 1
+            return [
+                {
+                    "name": meal_name, "dish": self._names[i], "quantity": self._quantities[i],
+                    "nutrition": {key: int(round(float(value))) for key, value in zip(NUTRITION_KEYS, macros[i])},
+                }
+                for i in nearest
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {"ready": self.ready, "dishes": len(self._names), "hits": self.hits, "misses": self.misses, "skipped_meals": self.skipped}
@@ -0,0 +1,10 @@
+# gunicorn.conf.py
+# Picked up automatically when gunicorn runs from the project directory
+# (startup.sh). Each worker imports backend_server itself, so the per-worker
+# background work starts once the worker has loaded the app.
+
+
+def post_worker_init(worker):
+    import backend_server
+
+    backend_server.start_background_work()
@@ -0,0 +1,375 @@
+# instrumentation.py
+# Always-on, low-overhead instrumentation for the backend. It records latency
+# histograms for:
+#   - HTTP requests
+#   - GraphQL resolvers
+#   - request phases (parse, execute, serialize, compress)
+#   - SQL statements
+#   - OpenAI calls, with prompt/completion token counters
+# It also prints a per-request breakdown of where the time went for slow
+# requests, serves everything in the Prometheus text format for /metrics,
+# and takes an opt-in cProfile of a single request. As with /cache/stats,
+# every worker process keeps and reports its own numbers.
+
+import bisect
+import contextvars
+import cProfile
+import functools
+import hmac
+import inspect
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from graphql import GraphQLObjectType
+
+from db import PooledConnection
+
+# Upper bounds in seconds, from sub-millisecond SQLite reads to plan generations.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+# --- Metrics ---
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing count per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """Observations bucketed by fixed upper bounds, per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(label_values, list(counts), total, count) for label_values, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {count}"
+
+
+class MetricsRegistry:
+    """The metrics of this process, rendered in the Prometheus text exposition format."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+HTTP_SECONDS = metrics.register(Histogram("http_request_duration_seconds", "Time to produce a response.", ("route", "method", "status")))
+PHASE_SECONDS = metrics.register(Histogram("request_phase_duration_seconds", "Time spent in one phase of a request.", ("phase",)))
+RESOLVER_SECONDS = metrics.register(Histogram("graphql_resolver_duration_seconds", "Time spent in a field's resolver, excluding its children.", ("field",)))
+SQL_SECONDS = metrics.register(Histogram("sql_statement_duration_seconds", "Time to execute a SQL statement, up to its first row.", ("statement",)))
+LLM_SECONDS = metrics.register(Histogram("llm_call_duration_seconds", "Time for one upstream OpenAI call, excluding queueing.", ("model", "lane", "outcome")))
+LLM_TOKENS = metrics.register(Counter("llm_tokens_total", "Tokens reported by OpenAI usage.", ("model", "kind")))
+
+
+# --- Request Traces ---
+class RequestTrace:
+    """Count and total seconds of each kind of work done on behalf of one request."""
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.totals = {}
+        self.tokens = [0, 0]
+        self._lock = threading.Lock()
+
+    def add(self, kind, seconds):
+        with self._lock:
+            entry = self.totals.get(kind)
+            if entry is None:
+                entry = self.totals[kind] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_tokens(self, prompt, completion):
+        with self._lock:
+            self.tokens[0] += prompt
+            self.tokens[1] += completion
+
+    def summary(self):
+        with self._lock:
+            parts = [f"{kind} {count}x {seconds * 1000:.1f} ms" for kind, (count, seconds) in sorted(self.totals.items(), key=lambda item: -item[1][1])]
+            if any(self.tokens):
+                parts.append(f"tokens {self.tokens[0]} prompt / {self.tokens[1]} completion")
+        return ", ".join(parts) or "no instrumented work"
+
+
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+def begin_request(method, route):
+    """Starts tracing a request in the current context; returns the trace and the token for detach_request()."""
+    trace = RequestTrace(method, route)
+    return trace, _current_trace.set(trace)
+
+
+def detach_request(token):
+    """Stops attributing work in the current context to the request begun with `token`."""
+    _current_trace.reset(token)
+
+
+def end_request(trace, status, slow_request_ms=None):
+    """Records the request's latency and prints its breakdown if it was slower than `slow_request_ms`."""
+    seconds = time.perf_counter() - trace.started
+    HTTP_SECONDS.observe(seconds, trace.route, trace.method, str(status))
+    if slow_request_ms is not None and seconds * 1000 >= slow_request_ms:
+        print(f"Slow request: {trace.method} {trace.route} {status} in {seconds * 1000:.1f} ms ({trace.summary()})")
+    return seconds
+
+
+def record(kind, seconds):
+    """Adds work done outside a span() block (SQL, LLM calls) to the current request, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(kind, seconds)
+
+
+@contextmanager
+def span(phase):
+    """Times the enclosed block as `phase` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        PHASE_SECONDS.observe(seconds, phase)
+        record(phase, seconds)
+
+
+# --- GraphQL Resolvers ---
+def _record_resolver(field, seconds):
+    RESOLVER_SECONDS.observe(seconds, field)
+    record("resolvers", seconds)
+
+
+def _timed(resolver, field):
+    if inspect.iscoroutinefunction(resolver):
+        async def resolve_async(obj, info, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await resolver(obj, info, **kwargs)
+            finally:
+                _record_resolver(field, time.perf_counter() - started)
+        return resolve_async
+
+    def resolve(obj, info, **kwargs):
+        started = time.perf_counter()
+        try:
+            return resolver(obj, info, **kwargs)
+        finally:
+            _record_resolver(field, time.perf_counter() - started)
+    return resolve
+
+
+def time_resolvers(schema):
+    """
+    Wraps every resolver bound in `schema` so its calls are timed. Fields left
+    to the default resolver (plain dict lookups, most of any response) are
+    not touched, unlike with GraphQL middleware, which wraps every field.
+    """
+    for type_name, graphql_type in schema.type_map.items():
+        if not isinstance(graphql_type, GraphQLObjectType) or type_name.startswith("__"):
+            continue
+        for field_name, field in graphql_type.fields.items():
+            if field.resolve is not None:
+                field.resolve = _timed(field.resolve, f"{type_name}.{field_name}")
+    return schema
+
+
+# --- SQL ---
+SQL_STATEMENTS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "CREATE", "ALTER", "DROP"}
+
+
+@functools.lru_cache(maxsize=1024)
+def _statement_kind(sql):
+    words = sql.split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in SQL_STATEMENTS else "OTHER"
+
+
+def _record_sql(sql, started):
+    seconds = time.perf_counter() - started
+    SQL_SECONDS.observe(seconds, _statement_kind(sql))
+    record("sql", seconds)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement it executes."""
+
+    def execute(self, sql, parameters=(), /):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_sql(sql, started)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_sql(sql, started)
+
+
+class InstrumentedConnection(PooledConnection):
+    """
+    Pooled connection that times every statement, whether run through the
+    connection's execute shortcuts or one of its cursors (which is how
+    aiosqlite runs them). Rows fetched after the first are not included.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_sql(sql, started)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_sql(sql, started)
+
+    def executescript(self, sql_script, /):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record_sql(sql_script, started)
+
+
+# --- LLM Calls ---
+def observe_llm(model, lane, seconds, outcome, usage):
+    """llm_gateway observer: records one upstream call and the tokens its usage reports."""
+    LLM_SECONDS.observe(seconds, model, lane, outcome)
+    record("llm", seconds)
+    if usage is None:
+        return
+    prompt, completion = getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+    LLM_TOKENS.inc(prompt, model, "prompt")
+    LLM_TOKENS.inc(completion, model, "completion")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(prompt, completion)
+
+
+# --- Profiling ---
+class RequestProfiler:
+    """
+    Profiles single requests with cProfile on demand. A request carrying
+    `X-Profile: <token>` is profiled and its stats dumped to `directory`; the
+    file name is returned in an X-Profile-File response header. Disabled
+    unless a token is configured, and only one request per process is
+    profiled at a time. Only the thread handling the request is profiled.
+    """
+
+    HEADER = "X-Profile"
+
+    def __init__(self, token=None, directory="profiles"):
+        self.token = token
+        self.directory = directory
+        self._busy = threading.Lock()
+
+    def start(self, header_value):
+        """Returns a running profile if the header carries the token, else None."""
+        if not self.token or not header_value or not hmac.compare_digest(header_value.encode(), self.token.encode()):
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread.
+            self._busy.release()
+            return None
+        return profile
+
+    def finish(self, profile, label):
+        """Stops the profile, writes it out and returns the file name."""
+        profile.disable()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')}.prof"
+            profile.dump_stats(os.path.join(self.directory, name))
+            return name
+        finally:
+            self._busy.release()
@@ -0,0 +1,119 @@
+# jobs.py
+# Background job queue for diet plan generation, backed by the plan_jobs table.
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Job states, in the order a job moves through them.
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class PlanJobQueue:
+    """
+    Runs plan generation off the request thread with bounded concurrency.
+
+    Jobs are rows in plan_jobs, so every gunicorn worker can report on any job.
+    A worker claims a job with a conditional UPDATE, which means a job is only
+    ever run once even when several processes resume the same queued rows.
+    """
+
+    def __init__(self, pool, handler, max_workers=2, stale_after_seconds=600):
+        self.pool = pool
+        self.handler = handler
+        self.max_workers = max_workers
+        self.stale_after_seconds = stale_after_seconds
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Builds this process's executor and resumes whatever was left queued
+        (or stuck running) by a dead worker. Called once per worker when the
+        app starts; safe to call again.
+        """
+        self._get_executor()
+
+    def _get_executor(self):
+        # Executors do not survive a fork, so each worker process builds its own.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plan-job")
+                self._pid = os.getpid()
+                resume = True
+            else:
+                resume = False
+        if resume:
+            self._resume_pending()
+        return self._executor
+
+    def _resume_pending(self):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE plan_jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, time.time(), RUNNING, time.time() - self.stale_after_seconds),
+            )
+            conn.commit()
+            job_ids = [row["id"] for row in conn.execute("SELECT id FROM plan_jobs WHERE status = ?", (QUEUED,))]
+        if job_ids:
+            print(f"Resuming {len(job_ids)} pending plan job(s).")
+        for job_id in job_ids:
+            self._executor.submit(self._run, job_id)
+
+    def enqueue(self, user_id, params):
+        """Stores a queued job and schedules it; returns the new job row."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO plan_jobs (id, user_id, status, params_json, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, QUEUED, json.dumps(params), now, now),
+            )
+            conn.commit()
+        self._get_executor().submit(self._run, job_id)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT * FROM plan_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _claim(self, job_id):
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "UPDATE plan_jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED),
+            )
+            conn.commit()
+            if cursor.rowcount == 0:
+                return None
+            return json.loads(conn.execute("SELECT params_json FROM plan_jobs WHERE id = ?", (job_id,)).fetchone()["params_json"])
+
+    def _finish(self, job_id, status, plan_id=None, error=None):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE plan_jobs SET status = ?, plan_id = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, plan_id, error, time.time(), job_id),
+            )
+            conn.commit()
+
+    def _run(self, job_id):
+        params = self._claim(job_id)
+        if params is None:
+            return
+        try:
+            plan_id = self.handler(**params)
+        except Exception as e:
+            print(f"--- ERROR in plan job {job_id} ---")
+            print(f"Error Type: {type(e).__name__}")
+            print(f"Error Details: {e}")
+            self._finish(job_id, FAILED, error="A server error occurred. Please check the backend logs for details.")
+        else:
+            self._finish(job_id, SUCCEEDED, plan_id=plan_id)
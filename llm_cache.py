@@ -0,0 +1,157 @@
+# llm_cache.py
+# Content-addressed cache for OpenAI completions, keyed on the normalized prompts.
+
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(model, *prompts):
+    """
+    Hashes the model name and prompts after collapsing whitespace, so that
+    indentation differences in the prompt templates never split the cache.
+    """
+    normalized = [re.sub(r"\s+", " ", part).strip() for part in (model, *prompts)]
+    return hashlib.sha256("\x1f".join(normalized).encode()).hexdigest()
+
+
+# --- Cache Tiers ---
+# A tier stores up to `variants` responses per key and returns all live ones.
+# A key's responses expire together, when its oldest stored response does.
+class MemoryTier:
+    """Bounded in-process LRU tier."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, ttl_seconds):
+        entry = self._entries.get(key)
+        if entry is None:
+            return []
+        stored_at, responses = entry
+        if time.time() - stored_at > ttl_seconds:
+            del self._entries[key]
+            return []
+        self._entries.move_to_end(key)
+        return responses
+
+    def put(self, key, responses, stored_at=None):
+        """Stores the responses as of `stored_at` (default now), so promoted entries keep their original deadline."""
+        self._entries[key] = (time.time() if stored_at is None else stored_at, list(responses))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class SQLiteTier:
+    """Persistent tier backed by the llm_response_cache table, shared by all workers."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def get(self, key, ttl_seconds):
+        """Returns (live responses, created_at of the oldest one)."""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT response, created_at FROM llm_response_cache WHERE cache_key = ? AND created_at >= ? ORDER BY id",
+                (key, time.time() - ttl_seconds),
+            ).fetchall()
+        return [row["response"] for row in rows], min((row["created_at"] for row in rows), default=None)
+
+    def add(self, key, response, keep):
+        """
+        Stores a new variant and trims the key down to its `keep` newest
+        variants; returns (variants, created_at of the oldest one).
+        """
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO llm_response_cache (cache_key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM llm_response_cache WHERE cache_key = ? AND id NOT IN "
+                "(SELECT id FROM llm_response_cache WHERE cache_key = ? ORDER BY id DESC LIMIT ?)",
+                (key, key, keep),
+            )
+            conn.commit()
+            rows = conn.execute("SELECT response, created_at FROM llm_response_cache WHERE cache_key = ? ORDER BY id", (key,)).fetchall()
+        return [row["response"] for row in rows], min((row["created_at"] for row in rows), default=None)
+
+    def purge_expired(self, ttl_seconds):
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (time.time() - ttl_seconds,))
+            conn.commit()
+
+
+# --- Two-Tier Cache ---
+class LLMResponseCache:
+    """
+    Looks up the memory tier, then the SQLite tier. A key only counts as a hit
+    once `variants` distinct responses are stored for it; until then callers go
+    upstream and add another variant, and hits pick one of them at random.
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, memory_tier, sqlite_tier=None, ttl_seconds=7 * 24 * 3600, variants=1):
+        self.memory = memory_tier
+        self.sqlite = sqlite_tier
+        self.ttl_seconds = ttl_seconds
+        self.variants = max(1, variants)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.memory_hits = 0
+        self.sqlite_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            responses = self.memory.get(key, self.ttl_seconds)
+            if len(responses) >= self.variants:
+                self.memory_hits += 1
+                return random.choice(responses)
+        if self.sqlite is not None:
+            responses, created_at = self.sqlite.get(key, self.ttl_seconds)
+            if len(responses) >= self.variants:
+                with self._lock:
+                    self.memory.put(key, responses, stored_at=created_at)
+                    self.sqlite_hits += 1
+                return random.choice(responses)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, response):
+        created_at = None
+        if self.sqlite is not None:
+            responses, created_at = self.sqlite.add(key, response, self.variants)
+        else:
+            with self._lock:
+                responses = (self.memory.get(key, self.ttl_seconds) + [response])[-self.variants:]
+        with self._lock:
+            self.memory.put(key, responses, stored_at=created_at)
+            self._puts += 1
+            purge = self.sqlite is not None and self._puts % self.PURGE_EVERY == 0
+        if purge:
+            self.sqlite.purge_expired(self.ttl_seconds)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.sqlite_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "sqlite_hits": self.sqlite_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.sqlite_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_evictions": self.memory.evictions,
+            }
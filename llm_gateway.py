@@ -0,0 +1,440 @@
+# llm_gateway.py
+# Single way out to the OpenAI API. Every completion goes through one pooled
+# client per worker and waits its turn in a scheduler that keeps requests and
+# tokens per minute under the account's limits, serves interactive lanes
+# before bulk ones, retries transient failures with jittered backoff within
+# the caller's deadline, and fails fast while a circuit breaker is open.
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import openai
+
+# Priority lanes, lowest value served first.
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Completion size assumed for a model until its first response reports usage.
+DEFAULT_COMPLETION_TOKENS = 512
+
+
+class LLMGatewayError(Exception):
+    """The gateway gave up on a request without a usable answer from the model."""
+
+
+class CircuitOpenError(LLMGatewayError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class DeadlineExceededError(LLMGatewayError):
+    """The request's deadline passed while it was queued or backing off."""
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute / 60` units per second up to `burst_seconds` worth
+    of capacity. The caller holds the lock; amounts larger than the capacity
+    are clamped so a single huge request can still go through.
+    """
+
+    def __init__(self, per_minute, burst_seconds=10):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken; 0 if it can be taken now."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Returns (positive) or charges (negative) units once the real cost is known."""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_seconds`, then lets a single probe through: its success closes the
+    breaker and its failure opens it again. A probe that never reports back
+    (it timed out in the queue, say) is replaced after another `reset_seconds`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() < self._opened_at + self.reset_seconds:
+                    return False
+                self.state = "half_open"
+                self._probe_started = None
+            now = time.monotonic()
+            if self._probe_started is not None and now < self._probe_started + self.reset_seconds:
+                return False
+            self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_started = None
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """
+    Rate-limited, prioritized and retrying front for `client_factory()`, an
+    openai.OpenAI client created on first use and reused for every call, so
+    connections stay pooled. Limits apply per process; with several workers,
+    divide the account's limits between them. `observer`, if given, is called
+    after every upstream attempt as observer(model, lane, seconds, outcome,
+    usage), where outcome is "ok" or the exception's class name.
+    """
+
+    POLL_SECONDS = 0.01
+
+    def __init__(self, client_factory, rpm=500, tpm=200000, max_concurrency=16, max_retries=4,
+                 request_timeout=60, interactive_deadline=30, bulk_deadline=180,
+                 breaker_failures=5, breaker_reset_seconds=30, burst_seconds=10,
+                 backoff_base=0.5, backoff_max=20, observer=None):
+        self.client_factory = client_factory
+        self.observer = observer
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.request_timeout = request_timeout
+        self.deadlines = {INTERACTIVE: interactive_deadline, BULK: bulk_deadline}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_seconds)
+        self._requests = TokenBucket(rpm, burst_seconds)
+        self._tokens = TokenBucket(tpm, burst_seconds)
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._queue = []
+        self._cancelled = set()
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._completion_tokens = {}
+        self._client = None
+        self.counters = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "deadline_exceeded": 0, "circuit_rejections": 0}
+        self.queued = {INTERACTIVE: 0, BULK: 0}
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    def deadline(self, priority):
+        """Absolute (monotonic) deadline for a request started now in `priority`'s lane."""
+        return time.monotonic() + self.deadlines[priority]
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _observe(self, model, priority, started, outcome, usage=None):
+        if self.observer is not None:
+            self.observer(model, LANE_NAMES[priority], time.perf_counter() - started, outcome, usage)
+
+    # --- Admission ---
+    def _estimate_tokens(self, model, messages):
+        prompt = sum(len(message["content"]) for message in messages) // 4
+        return prompt + self._completion_tokens.get(model, DEFAULT_COMPLETION_TOKENS)
+
+    def _learn(self, model, completion):
+        usage = getattr(completion, "usage", None)
+        if usage is None:
+            return None
+        previous = self._completion_tokens.get(model, DEFAULT_COMPLETION_TOKENS)
+        self._completion_tokens[model] = int(0.8 * previous + 0.2 * usage.completion_tokens)
+        return usage.total_tokens
+
+    def _enqueue(self, priority):
+        with self._lock:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._queue, ticket)
+            self.queued[priority] += 1
+            return ticket
+
+    def _cancel(self, ticket):
+        """Drops a ticket that gave up waiting. The caller holds the lock."""
+        self._cancelled.add(ticket)
+        self.queued[ticket[0]] -= 1
+        self._ready.notify_all()
+
+    def _try_admit(self, ticket, tokens):
+        """
+        Admits the ticket if it is first in line, a slot is free and both buckets
+        allow it; otherwise returns the seconds to wait, or None to wait for a
+        release. The caller holds the lock.
+        """
+        while self._queue and self._queue[0] in self._cancelled:
+            self._cancelled.discard(heapq.heappop(self._queue))
+        if self._queue[0] != ticket or self._in_flight >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        wait = max(self._cooldown_until - now, self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        heapq.heappop(self._queue)
+        self.queued[ticket[0]] -= 1
+        self._requests.take(1)
+        self._tokens.take(tokens)
+        self._in_flight += 1
+        self.counters["requests"] += 1
+        # The next ticket in line may be admissible right away.
+        self._ready.notify_all()
+        return 0
+
+    def _acquire(self, priority, tokens, deadline):
+        ticket = self._enqueue(priority)
+        with self._ready:
+            while True:
+                wait = self._try_admit(ticket, tokens)
+                if wait == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._cancel(ticket)
+                    self.counters["deadline_exceeded"] += 1
+                    raise DeadlineExceededError("Deadline passed while waiting for an LLM slot.")
+                self._ready.wait(remaining if wait is None else min(wait, remaining))
+
+    def _release(self, reserved_tokens, used_tokens):
+        with self._ready:
+            self._in_flight -= 1
+            self._tokens.adjust(reserved_tokens - (used_tokens if used_tokens is not None else reserved_tokens))
+            self._ready.notify_all()
+
+    # --- Failure Handling ---
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            self._count("circuit_rejections")
+            raise CircuitOpenError("The LLM circuit breaker is open.")
+
+    def _attempt_timeout(self, deadline):
+        return max(0.1, min(self.request_timeout, deadline - time.monotonic()))
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Returns how long to back off before retrying `error`, or re-raises it."""
+        retry_after = 0.0
+        if isinstance(error, openai.RateLimitError):
+            self._count("rate_limited")
+            # Not an outage: the service answered, it just wants us to slow down.
+            self.breaker.record_success()
+            if getattr(error, "code", None) == "insufficient_quota":
+                raise error
+            try:
+                retry_after = float(error.response.headers.get("retry-after", 0))
+            except (TypeError, ValueError):
+                retry_after = 0.0
+            with self._lock:
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + retry_after)
+        elif isinstance(error, openai.APIConnectionError) or (isinstance(error, openai.APIStatusError) and error.status_code >= 500):
+            self._count("failures")
+            self.breaker.record_failure()
+        else:
+            if isinstance(error, openai.APIStatusError):
+                self.breaker.record_success()
+            raise error
+        if attempt >= self.max_retries:
+            raise error
+        # Full jitter, but never sooner than the server asked for.
+        delay = max(retry_after, random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+        if time.monotonic() + delay >= deadline:
+            self._count("deadline_exceeded")
+            raise DeadlineExceededError(f"Deadline leaves no time to retry after: {error}") from error
+        self._count("retries")
+        return delay
+
+    # --- Calls ---
+    def complete(self, model, messages, priority=BULK, deadline=None, **options):
+        """Returns the text of one chat completion."""
+        deadline = deadline or self.deadline(priority)
+        tokens = self._estimate_tokens(model, messages)
+        for attempt in itertools.count():
+            self._check_breaker()
+            self._acquire(priority, tokens, deadline)
+            used = None
+            started = time.perf_counter()
+            try:
+                completion = self.client().chat.completions.create(
+                    model=model, messages=messages, timeout=self._attempt_timeout(deadline), **options)
+                used = self._learn(model, completion)
+            except Exception as error:
+                self._observe(model, priority, started, type(error).__name__)
+                delay = self._retry_delay(error, attempt, deadline)
+            else:
+                self._observe(model, priority, started, "ok", getattr(completion, "usage", None))
+                self.breaker.record_success()
+                return completion.choices[0].message.content
+            finally:
+                self._release(tokens, used)
+            time.sleep(delay)
+
+    def stream(self, model, messages, priority=BULK, deadline=None, **options):
+        """
+        Yields the text of a streamed completion; only opening the stream is
+        retried. Usage is requested in the stream's final chunk.
+        """
+        deadline = deadline or self.deadline(priority)
+        tokens = self._estimate_tokens(model, messages)
+        options.setdefault("stream_options", {"include_usage": True})
+        for attempt in itertools.count():
+            self._check_breaker()
+            self._acquire(priority, tokens, deadline)
+            started = time.perf_counter()
+            try:
+                stream = self.client().chat.completions.create(
+                    model=model, messages=messages, stream=True, timeout=self._attempt_timeout(deadline), **options)
+            except Exception as error:
+                self._release(tokens, None)
+                self._observe(model, priority, started, type(error).__name__)
+                time.sleep(self._retry_delay(error, attempt, deadline))
+                continue
+            outcome, usage = "ok", None
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                self.breaker.record_success()
+            except BaseException as error:
+                # Includes GeneratorExit when the consumer stops reading.
+                outcome = type(error).__name__
+                raise
+            finally:
+                stream.close()
+                self._release(tokens, usage.total_tokens if usage is not None else None)
+                self._observe(model, priority, started, outcome, usage)
+            return
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "in_flight": self._in_flight,
+                "queued": {LANE_NAMES[lane]: count for lane, count in self.queued.items()},
+                "breaker": self.breaker.state,
+                "breaker_trips": self.breaker.trips,
+                "request_budget": round(self._requests.tokens, 1),
+                "token_budget": round(self._tokens.tokens),
+            }
+
+
+class AsyncLLMGateway(LLMGateway):
+    """Event-loop version for asgi_server.py; `client_factory()` returns an openai.AsyncOpenAI client."""
+
+    async def _acquire(self, priority, tokens, deadline):
+        ticket = self._enqueue(priority)
+        while True:
+            with self._lock:
+                wait = self._try_admit(ticket, tokens)
+                if wait == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._cancel(ticket)
+                    self.counters["deadline_exceeded"] += 1
+                    raise DeadlineExceededError("Deadline passed while waiting for an LLM slot.")
+            try:
+                # Nothing to wait on across threads here, so poll for slot releases.
+                await asyncio.sleep(min(wait or self.POLL_SECONDS, remaining))
+            except asyncio.CancelledError:
+                with self._lock:
+                    self._cancel(ticket)
+                raise
+
+    async def complete(self, model, messages, priority=BULK, deadline=None, **options):
+        deadline = deadline or self.deadline(priority)
+        tokens = self._estimate_tokens(model, messages)
+        for attempt in itertools.count():
+            self._check_breaker()
+            await self._acquire(priority, tokens, deadline)
+            used = None
+            started = time.perf_counter()
+            try:
+                completion = await self.client().chat.completions.create(
+                    model=model, messages=messages, timeout=self._attempt_timeout(deadline), **options)
+                used = self._learn(model, completion)
+            except Exception as error:
+                self._observe(model, priority, started, type(error).__name__)
+                delay = self._retry_delay(error, attempt, deadline)
+            else:
+                self._observe(model, priority, started, "ok", getattr(completion, "usage", None))
+                self.breaker.record_success()
+                return completion.choices[0].message.content
+            finally:
+                self._release(tokens, used)
+            await asyncio.sleep(delay)
+
+    async def stream(self, model, messages, priority=BULK, deadline=None, **options):
+        """Async generator version of LLMGateway.stream."""
+        deadline = deadline or self.deadline(priority)
+        tokens = self._estimate_tokens(model, messages)
+        options.setdefault("stream_options", {"include_usage": True})
+        for attempt in itertools.count():
+            self._check_breaker()
+            await self._acquire(priority, tokens, deadline)
+            started = time.perf_counter()
+            try:
+                stream = await self.client().chat.completions.create(
+                    model=model, messages=messages, stream=True, timeout=self._attempt_timeout(deadline), **options)
+            except Exception as error:
+                self._release(tokens, None)
+                self._observe(model, priority, started, type(error).__name__)
+                await asyncio.sleep(self._retry_delay(error, attempt, deadline))
+                continue
+            outcome, usage = "ok", None
+            try:
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                self.breaker.record_success()
+            except BaseException as error:
+                # Includes GeneratorExit when the consumer stops reading.
+                outcome = type(error).__name__
+                raise
+            finally:
+                await stream.close()
+                self._release(tokens, usage.total_tokens if usage is not None else None)
+                self._observe(model, priority, started, outcome, usage)
+            return
@@ -0,0 +1,342 @@
+# migrations.py
+# Versioned schema migrations, tracked with SQLite's PRAGMA user_version.
+# init_db() and database_setup.py both run migrate(), so every database
+# converges on the same schema whichever way it was created. Data backfills
+# run after the schema steps and are resumable; database_setup.py --backfill
+# reruns them.
+
+import json
+
+from plan_store import PLAN_JSON_COLUMNS, insert_plan_parts, load_diet, load_exercises, load_shopping_list, normalize_plan, plan_json_values, rollup_plans
+
+
+# --- Migration 1: Base Schema ---
+def _create_base_schema(conn):
+    """Tables that predate versioning; IF NOT EXISTS keeps this safe on old databases."""
+    cursor = conn.cursor()
+    # Create 'users' table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Create 'user_progress' table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            weight_kg REAL NOT NULL,
+            log_date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id, log_date)
+        )
+    ''')
+    # Create 'diet_plans' table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS diet_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            weight_kg REAL NOT NULL,
+            height_cm REAL NOT NULL,
+            activity_level TEXT NOT NULL,
+            dietary_preference TEXT NOT NULL,
+            include_cheat_meal BOOLEAN NOT NULL,
+            bmi REAL NOT NULL,
+            generated_plan_json TEXT NOT NULL,
+            exercise_plan_json TEXT,
+            shopping_list_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    # Create 'llm_response_cache' table (persistent tier of llm_cache.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cache_key TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_key ON llm_response_cache (cache_key, created_at)")
+    # Create 'recipes' table, keyed on the normalized dish name (see recipe_store.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipes (
+            dish_key TEXT PRIMARY KEY,
+            dish_name TEXT NOT NULL,
+            recipe TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Create 'plan_jobs' table (background generation queue, see jobs.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            params_json TEXT NOT NULL,
+            plan_id INTEGER,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (plan_id) REFERENCES diet_plans (id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_plan_jobs_status ON plan_jobs (status)")
+    # Databases created by the old database_setup.py have no UNIQUE(user_id, log_date),
+    # which logWeight's INSERT OR REPLACE relies on. Keep the latest entry per day and add it.
+    has_unique = any(
+        index["unique"] and [col["name"] for col in conn.execute(f"PRAGMA index_info('{index['name']}')")] == ["user_id", "log_date"]
+        for index in conn.execute("PRAGMA index_list('user_progress')").fetchall()
+    )
+    if not has_unique:
+        cursor.execute("DELETE FROM user_progress WHERE id NOT IN (SELECT MAX(id) FROM user_progress GROUP BY user_id, log_date)")
+        cursor.execute("CREATE UNIQUE INDEX idx_user_progress_user_date ON user_progress (user_id, log_date)")
+
+
+# --- Migration 2: Normalized Plan Tables ---
+def _create_plan_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_days (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_id INTEGER NOT NULL,
+            day_index INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            daily_calories INTEGER NOT NULL,
+            FOREIGN KEY (plan_id) REFERENCES diet_plans (id),
+            UNIQUE(plan_id, day_index)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_meals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            day_id INTEGER NOT NULL,
+            plan_id INTEGER NOT NULL,
+            meal_index INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            dish TEXT NOT NULL,
+            quantity TEXT NOT NULL,
+            calories INTEGER NOT NULL,
+            protein_g INTEGER NOT NULL,
+            carbs_g INTEGER NOT NULL,
+            fat_g INTEGER NOT NULL,
+            FOREIGN KEY (day_id) REFERENCES plan_days (id),
+            FOREIGN KEY (plan_id) REFERENCES diet_plans (id),
+            UNIQUE(day_id, meal_index)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_plan_meals_plan ON plan_meals (plan_id, day_id, meal_index)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_plan_meals_dish ON plan_meals (dish)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_exercises (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            activity TEXT NOT NULL,
+            FOREIGN KEY (plan_id) REFERENCES diet_plans (id),
+            UNIQUE(plan_id, position)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_shopping_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_id INTEGER NOT NULL,
+            category_index INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            item_index INTEGER NOT NULL,
+            item TEXT NOT NULL,
+            FOREIGN KEY (plan_id) REFERENCES diet_plans (id),
+            UNIQUE(plan_id, category_index, item_index)
+        )
+    ''')
+    conn.commit()
+
+
+def backfill_plan_tables(conn, batch_size=500):
+    """
+    Copies plans that have no plan_days rows yet out of the JSON columns.
+    Plans are read with keyset pagination, one batch in memory at a time, and
+    each batch is committed on its own, so an interrupted run simply resumes.
+    """
+    last_id = 0
+    migrated = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, generated_plan_json, exercise_plan_json, shopping_list_json FROM diet_plans "
+            "WHERE id > ? AND NOT EXISTS (SELECT 1 FROM plan_days WHERE plan_days.plan_id = diet_plans.id) "
+            "ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return migrated
+        for row in rows:
+            plan = {
+                "diet": json.loads(row["generated_plan_json"] or "[]"),
+                "exercises": json.loads(row["exercise_plan_json"] or "[]"),
+                "shoppingList": json.loads(row["shopping_list_json"] or "[]"),
+            }
+            insert_plan_parts(conn, row["id"], plan)
+        conn.commit()
+        last_id = rows[-1]["id"]
+        migrated += len(rows)
+
+
+# --- Migration 3: Dashboard Indexes ---
+def _create_dashboard_indexes(conn):
+    """
+    Covering indexes for the dashboard's hot paths, so listing a user's plans
+    never touches the large JSON columns and progress reads never touch the table.
+    Checked by query_audit.py.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_diet_plans_user_created "
+        "ON diet_plans (user_id, created_at DESC, id DESC, weight_kg, bmi, dietary_preference)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_progress_user_date_weight ON user_progress (user_id, log_date, weight_kg)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_created ON llm_response_cache (created_at)")
+    conn.commit()
+
+
+# --- Migration 4: Dashboard Versions ---
+def _create_dashboard_versions(conn):
+    """Per-user change counter behind the dashboard response cache (see dashboard_cache.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    conn.commit()
+
+
+# --- Migration 5: In-Flight LLM Calls ---
+def _create_llm_inflight(conn):
+    """Cross-worker leases and results for coalesced OpenAI calls (see single_flight.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_inflight (
+            cache_key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            result TEXT,
+            error TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_inflight_finished ON llm_inflight (finished_at)")
+    conn.commit()
+
+
+# --- Migration 6: Serialized Plan Sections ---
+def _normalize_plan_json(conn, batch_size=500):
+    """
+    Rewrites the diet_plans JSON columns from the normalized tables, in the
+    exact shape the Plan type serializes to, so resolvers can splice them into
+    responses. Batched by id like backfill_plan_tables; rerunning is harmless.
+    """
+    assignments = ", ".join(f"{column} = ?" for column in PLAN_JSON_COLUMNS.values())
+    last_id = 0
+    while True:
+        plan_ids = [row[0] for row in conn.execute("SELECT id FROM diet_plans WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))]
+        if not plan_ids:
+            break
+        conn.executemany(f"UPDATE diet_plans SET {assignments} WHERE id = ?", [
+            (*plan_json_values(normalize_plan({
+                "diet": load_diet(conn, plan_id), "exercises": load_exercises(conn, plan_id), "shoppingList": load_shopping_list(conn, plan_id),
+            })), plan_id)
+            for plan_id in plan_ids
+        ])
+        conn.commit()
+        last_id = plan_ids[-1]
+
+
+# --- Migration 7: Nutrition Rollups ---
+def _create_nutrition_rollups(conn):
+    """Per-day macro sums on plan_days and per-plan totals in plan_totals, written with each plan (see plan_store.py)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(plan_days)")}
+    for column in ("total_calories", "total_protein_g", "total_carbs_g", "total_fat_g"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE plan_days ADD COLUMN {column} INTEGER")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS plan_totals (
+            plan_id INTEGER PRIMARY KEY,
+            days INTEGER NOT NULL,
+            calories INTEGER NOT NULL,
+            protein_g INTEGER NOT NULL,
+            carbs_g INTEGER NOT NULL,
+            fat_g INTEGER NOT NULL,
+            mismatched_days INTEGER NOT NULL,
+            FOREIGN KEY (plan_id) REFERENCES diet_plans (id)
+        )
+    ''')
+    conn.commit()
+
+
+def backfill_plan_rollups(conn, batch_size=500):
+    """
+    Rolls up plans that have no plan_totals row yet, summing their meals in
+    SQL. Batched by id and committed per batch, so an interrupted run resumes.
+    """
+    last_id = 0
+    rolled_up = 0
+    while True:
+        plan_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM diet_plans WHERE id > ? AND NOT EXISTS (SELECT 1 FROM plan_totals WHERE plan_totals.plan_id = diet_plans.id) "
+            "ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        )]
+        if not plan_ids:
+            return rolled_up
+        rollup_plans(conn, plan_ids)
+        conn.commit()
+        last_id = plan_ids[-1]
+        rolled_up += len(plan_ids)
+
+
+# --- Migration 8: In-Flight Error Types ---
+def _add_llm_inflight_error_type(conn):
+    """The class name of a failed leader's error, so other workers can raise the same type (see single_flight.py)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(llm_inflight)")}
+    if "error_type" not in columns:
+        conn.execute("ALTER TABLE llm_inflight ADD COLUMN error_type TEXT")
+    conn.commit()
+
+
+# --- Migration Runner ---
+# (version, schema step, data backfill). Schema steps are idempotent. The
+# backfills go through plan_store, which always targets the latest schema, so
+# they run only after every pending schema step.
+MIGRATIONS = [
+    (1, _create_base_schema, None),
+    (2, _create_plan_tables, backfill_plan_tables),
+    (3, _create_dashboard_indexes, None),
+    (4, _create_dashboard_versions, None),
+    (5, _create_llm_inflight, None),
+    (6, None, _normalize_plan_json),
+    (7, _create_nutrition_rollups, backfill_plan_rollups),
+    (8, _add_llm_inflight_error_type, None),
+]
+
+
+def migrate(conn):
+    """Applies every migration newer than the database's user_version, in order."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = [migration for migration in MIGRATIONS if migration[0] > current]
+    for version, step, _ in pending:
+        if step:
+            step(conn)
+    for version, _, backfill in pending:
+        if backfill:
+            backfill(conn)
+    if pending:
+        conn.execute(f"PRAGMA user_version = {pending[-1][0]}")
+        conn.commit()
+    return [version for version, _, _ in pending]
@@ -0,0 +1,183 @@
+# persisted_queries.py
+# Automatic persisted queries (APQ) and a cache of parsed, validated documents
+# for the /graphql endpoint. Clients send the sha256 of their query in
+# extensions.persistedQuery and only fall back to the full text when the
+# server does not know the hash yet. In allowlist mode only the queries in a
+# prebuilt manifest are accepted.
+#
+# Build a manifest from the Streamlit client's queries:
+#   python persisted_queries.py streamlit_app.py --output persisted_queries.json
+
+import argparse
+import ast
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from graphql import GraphQLError, OperationDefinitionNode, parse, specified_rules, validate
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class PersistedQueryError(GraphQLError):
+    """An APQ protocol error; `code` is the extensions.code clients react to."""
+
+    def __init__(self, message, code):
+        super().__init__(message, extensions={"code": code})
+        self.code = code
+
+
+# --- Document Cache ---
+class DocumentCache:
+    """
+    Bounded LRU of sha256(query) -> (query text, DocumentNode). Documents are
+    only stored once they have passed validation, so `validate` can skip them.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._validated = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, query, document):
+        with self._lock:
+            self._entries[key] = (query, document)
+            self._entries.move_to_end(key)
+            self._validated.add(id(document))
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._validated.discard(id(evicted))
+                self.evictions += 1
+
+    def validate(self, schema, document, rules=None, max_errors=None, **kwargs):
+        """query_validator for graphql_sync: cached documents were validated when stored."""
+        with self._lock:
+            if id(document) in self._validated:
+                return []
+        return validate(schema, document, rules=rules or specified_rules, max_errors=max_errors, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+            }
+
+
+# --- Persisted Query Registry ---
+class PersistedQueries:
+    """
+    Turns a request body into (data with the query text, DocumentNode).
+    Unknown hashes raise PERSISTED_QUERY_NOT_FOUND so the client retries with
+    the full text; in allowlist mode anything outside the manifest is refused.
+    """
+
+    def __init__(self, schema, documents, manifest=None, allowlist=False):
+        self.schema = schema
+        self.documents = documents
+        self.allowlist = allowlist
+        self._manifest = dict(manifest or {})
+
+    @classmethod
+    def load_manifest(cls, path):
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+        for key, query in manifest.items():
+            if query_hash(query) != key:
+                raise ValueError(f"Manifest entry {key} does not match the sha256 of its query.")
+        return manifest
+
+    def resolve(self, data):
+        if not isinstance(data, dict):
+            return data, None
+        persisted = (data.get("extensions") or {}).get("persistedQuery") or {}
+        query = data.get("query")
+        key = persisted.get("sha256Hash")
+        if query is not None:
+            if not isinstance(query, str):
+                return data, None
+            if key is not None and query_hash(query) != key:
+                raise PersistedQueryError("provided sha does not match query", "INTERNAL_SERVER_ERROR")
+            key = key or query_hash(query)
+        elif key is None:
+            return data, None
+
+        cached = self.documents.get(key)
+        if cached is None:
+            query = self._known_query(key, query)
+            try:
+                document = parse(query)
+            except GraphQLError:
+                return {**data, "query": query}, None
+            errors = validate(self.schema, document)
+            if errors:
+                # Invalid documents are not cached; graphql_sync reports the errors.
+                return {**data, "query": query}, document
+            self.documents.put(key, query, document)
+            cached = (query, document)
+        return {**data, "query": cached[0]}, cached[1]
+
+    def _known_query(self, key, query):
+        if key in self._manifest:
+            return self._manifest[key]
+        if self.allowlist:
+            raise PersistedQueryError("Query is not in the persisted query allowlist.", "PERSISTED_QUERY_NOT_ALLOWED")
+        if query is None:
+            raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+        return query
+
+
+# --- Manifest Builder ---
+def extract_operations(path):
+    """Yields every string literal in a Python module that parses as a GraphQL operation."""
+    with open(path) as source:
+        tree = ast.parse(source.read(), filename=path)
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Constant) and isinstance(node.value, str)):
+            continue
+        text = node.value.strip()
+        if not text.startswith(("query", "mutation")):
+            continue
+        try:
+            document = parse(node.value)
+        except GraphQLError:
+            continue
+        if any(isinstance(definition, OperationDefinitionNode) for definition in document.definitions):
+            yield node.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a persisted query manifest from client source files.")
+    parser.add_argument("sources", nargs="+", help="Python files containing GraphQL query strings")
+    parser.add_argument("--output", default="persisted_queries.json")
+    args = parser.parse_args()
+
+    manifest = {query_hash(query): query for path in args.sources for query in extract_operations(path)}
+    with open(args.output, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    print(f"Wrote {len(manifest)} queries to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
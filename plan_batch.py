@@ -0,0 +1,164 @@
+# plan_batch.py
+# Generates diet plans for a whole cohort at once (clinic or gym onboarding).
+# Profiles that would produce the same prompt are generated once, unique
+# profiles run with bounded parallelism, and every resulting plan is written
+# in a single transaction. Used by the generateDietPlans mutation, and from
+# the command line with a JSON list of generateDietPlan arguments:
+#
+# Usage: python plan_batch.py profiles.json [--parallel 4] [--db data/diet_planner.db]
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dashboard_cache import BUMP_VERSION_SQL
+from plan_store import insert_plan_parts, normalize_plan, plan_json_values
+
+PROFILE_FIELDS = ("weight", "height", "activityLevel", "includeCheatMeal", "dietaryPreference", "allergies")
+
+INSERT_PLAN_SQL = (
+    "INSERT INTO diet_plans (user_id, weight_kg, height_cm, activity_level, dietary_preference, include_cheat_meal, bmi, "
+    "generated_plan_json, exercise_plan_json, shopping_list_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def profile_key(profile):
+    """Profiles with equal keys build identical prompts (allergies are sorted into the prompt)."""
+    return (
+        float(profile["weight"]), float(profile["height"]), profile["activityLevel"], bool(profile["includeCheatMeal"]),
+        profile["dietaryPreference"], tuple(sorted(profile.get("allergies") or [])),
+    )
+
+
+def parse_user_id(value):
+    """The integer id in a userId argument (GraphQL IDs arrive as strings), or None if it is not one."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def insert_diet_plans(conn, plans):
+    """
+    Inserts (profile, bmi, response_data) triples into diet_plans and the
+    normalized tables with executemany, inside the caller's transaction, and
+    returns the new plan ids in order. The ids are contiguous because the
+    transaction holds SQLite's write lock from the first INSERT.
+    """
+    if not plans:
+        return []
+    conn.executemany(INSERT_PLAN_SQL, [
+        (profile["userId"], profile["weight"], profile["height"], profile["activityLevel"], profile["dietaryPreference"],
+         profile["includeCheatMeal"], bmi, *plan_json_values(normalize_plan(data)))
+        for profile, bmi, data in plans
+    ])
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    plan_ids = list(range(last_id - len(plans) + 1, last_id + 1))
+    for plan_id, (_, _, data) in zip(plan_ids, plans):
+        insert_plan_parts(conn, plan_id, data)
+    conn.executemany(BUMP_VERSION_SQL, [(user_id,) for user_id in sorted({int(profile["userId"]) for profile, _, _ in plans})])
+    return plan_ids
+
+
+class BatchPlanGenerator:
+    """
+    Runs `generate(**profile_fields) -> (bmi, response_data)` once per unique
+    profile on at most `max_parallel` threads, then stores every successful
+    plan in one transaction. Failures are reported per item through
+    `describe_error(exception)` and never fail the rest of the batch.
+    """
+
+    def __init__(self, pool, generate, max_parallel=4, describe_error=None):
+        self.pool = pool
+        self.generate = generate
+        self.max_parallel = max_parallel
+        self.describe_error = describe_error or (lambda error: f"{type(error).__name__}: {error}")
+
+    def run(self, profiles, on_progress=None):
+        """
+        Returns a summary dict with one item per profile, in input order.
+        `on_progress(done, total)` is called as each unique profile finishes.
+        """
+        items = [{"index": index, "userId": profile.get("userId"), "success": False, "error": None, "dietPlan": None}
+                 for index, profile in enumerate(profiles)]
+        user_ids = [parse_user_id(profile.get("userId")) for profile in profiles]
+        with self.pool.connection() as conn:
+            # One JSON parameter instead of a placeholder per user keeps clear of SQLite's variable limit.
+            rows = conn.execute("SELECT id FROM users WHERE id IN (SELECT value FROM json_each(?))",
+                                (json.dumps(sorted({user_id for user_id in user_ids if user_id is not None})),))
+            known = {row["id"] for row in rows}
+
+        groups = {}
+        for index, profile in enumerate(profiles):
+            # A malformed id fails only its own item, like an id with no user.
+            if user_ids[index] not in known:
+                items[index]["error"] = "Unknown user."
+                continue
+            groups.setdefault(profile_key(profile), []).append(index)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="plan-batch") as executor:
+            futures = {
+                executor.submit(self.generate, **{field: profiles[indices[0]].get(field) for field in PROFILE_FIELDS}): key
+                for key, indices in groups.items()
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as error:
+                    message = self.describe_error(error)
+                    for index in groups[key]:
+                        items[index]["error"] = message
+                if on_progress:
+                    on_progress(done, len(futures))
+
+        stored = sorted(index for key, indices in groups.items() if key in results for index in indices)
+        plans = [(profiles[index], *results[profile_key(profiles[index])]) for index in stored]
+        with self.pool.connection() as conn:
+            plan_ids = insert_diet_plans(conn, plans)
+            conn.commit()
+            rows = conn.execute("SELECT * FROM diet_plans WHERE id BETWEEN ? AND ?", (plan_ids[0], plan_ids[-1])).fetchall() if plan_ids else []
+        rows_by_id = {row["id"]: dict(row) for row in rows}
+        for index, plan_id, (_, _, data) in zip(stored, plan_ids, plans):
+            items[index]["success"] = True
+            items[index]["dietPlan"] = {**rows_by_id[plan_id], "generated_plan": normalize_plan(data)}
+
+        succeeded = len(stored)
+        return {
+            "total": len(profiles),
+            "succeeded": succeeded,
+            "failed": len(profiles) - succeeded,
+            "uniqueProfiles": len(groups),
+            "items": items,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate diet plans for a list of user profiles.")
+    parser.add_argument("profiles", help="JSON file with a list of generateDietPlan argument objects ('-' for stdin)")
+    parser.add_argument("--parallel", type=int, default=4, help="unique profiles generated at once")
+    parser.add_argument("--db", help="database path (defaults to DB_PATH)")
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["DB_PATH"] = args.db
+    # Imported here so --db is in place before the server module reads DB_PATH.
+    import backend_server
+
+    with (sys.stdin if args.profiles == "-" else open(args.profiles)) as handle:
+        profiles = json.load(handle)
+    backend_server.init_db()
+    batch = BatchPlanGenerator(backend_server.db_pool, backend_server.generate_plan_content, max_parallel=args.parallel)
+    summary = batch.run(profiles, on_progress=lambda done, total: print(f"Generated {done}/{total} unique profiles", file=sys.stderr))
+    for item in summary["items"]:
+        outcome = f"plan {item['dietPlan']['id']}" if item["success"] else f"failed: {item['error']}"
+        print(f"#{item['index']} user {item['userId']}: {outcome}")
+    print(f"{summary['succeeded']} of {summary['total']} plans stored ({summary['uniqueProfiles']} unique profiles).")
+    sys.exit(0 if summary["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
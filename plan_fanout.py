@@ -0,0 +1,119 @@
+# plan_fanout.py
+# Builds a 7-day plan from concurrent per-day and exercise completions instead
+# of one large completion, then merges the parts into the usual plan shape.
+
+import contextvars
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+CHEAT_MEAL_DAY = "Saturday"
+
+DAY_SYSTEM_PROMPT = """
+You are an expert nutritionist specializing in South Indian cuisine. Your task is to plan the meals for ONE day.
+You MUST return a single, valid JSON object and nothing else, with this structure:
+{ "day": "Day name", "daily_calories": integer, "meals": [ { "name": "Breakfast" | "Lunch" | "Snack" | "Dinner", "dish": "Dish Name", "quantity": "Serving size, e.g., '1 cup' or '2 rotis'", "nutrition": { "calories": integer, "protein_g": integer, "carbs_g": integer, "fat_g": integer } } ], "ingredients": [ { "category": "e.g., Vegetables", "items": ["item1", "item2"] } ] }
+"ingredients" lists everything needed to cook that day's meals.
+Do not include any text, explanations, or markdown formatting outside of this single JSON object.
+"""
+
+EXERCISE_SYSTEM_PROMPT = """
+You are an expert fitness coach. Your task is to plan a 7-day exercise routine.
+You MUST return a single, valid JSON object and nothing else, with this structure:
+{ "exercises": [ { "day": "Monday", "activity": "Suggested activity, e.g., '30-minute brisk walk'" } ] }
+"""
+
+
+class PlanPartError(Exception):
+    """Raised when a partial completion is missing required fields."""
+
+
+def _validate_day(day_data, day_name):
+    meals = day_data.get("meals")
+    if not isinstance(meals, list) or not meals:
+        raise PlanPartError(f"{day_name}: response has no meals.")
+    for meal in meals:
+        nutrition = meal.get("nutrition") or {}
+        if not meal.get("dish") or not meal.get("name") or not all(k in nutrition for k in ("calories", "protein_g", "carbs_g", "fat_g")):
+            raise PlanPartError(f"{day_name}: meal is missing required fields.")
+    day_data["day"] = day_name
+    # The model's own total is often off; the meals are the source of truth.
+    day_data["daily_calories"] = sum(int(meal["nutrition"]["calories"]) for meal in meals)
+    return day_data
+
+
+def _merge_shopping_lists(ingredient_lists):
+    """Merges per-day ingredient lists into one shoppingList, deduplicated per category."""
+    merged = {}
+    for ingredients in ingredient_lists:
+        for entry in ingredients or []:
+            category = entry.get("category", "Other").strip().title()
+            items = merged.setdefault(category, {})
+            for item in entry.get("items", []):
+                items.setdefault(item.strip().lower(), item.strip())
+    return [{"category": category, "items": list(items.values())} for category, items in merged.items()]
+
+
+class FanOutPlanGenerator:
+    """
+    Requests each day and the exercise routine concurrently through
+    `complete(system_prompt, user_prompt, deadline) -> str`, retrying parts
+    that fail validation with jittered exponential backoff until the shared
+    deadline. The shopping list is merged locally from the per-day ingredients,
+    so it adds no extra round trip.
+    """
+
+    def __init__(self, complete, max_concurrency=4, retries=2, backoff_seconds=0.5):
+        self.complete = complete
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        # Shared by all requests in the process, so the cap bounds total upstream calls.
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="plan-fanout")
+
+    def _call_with_retries(self, system_prompt, user_prompt, parse, deadline):
+        for attempt in range(self.retries + 1):
+            try:
+                return parse(json.loads(self.complete(system_prompt, user_prompt, deadline)))
+            except Exception:
+                delay = self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if attempt == self.retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                    raise
+                time.sleep(delay)
+
+    def generate(self, bmi, activity_level, dietary_preference, allergies, include_cheat_meal, deadline=None):
+        allergies_text = f"The user is allergic to the following and these ingredients must be completely avoided: {', '.join(sorted(allergies))}." if allergies else "The user has no listed allergies."
+        profile = f"""
+        - Cuisine Style: Andhra & Telangana
+        - User BMI: {bmi}
+        - Activity Level: '{activity_level}'
+        - Dietary Preference: '{dietary_preference}'
+        - Allergies: {allergies_text}
+        """
+        # Each call runs in a copy of the caller's context, so its time is
+        # attributed to the request that asked for the plan (see instrumentation.py).
+        day_futures = []
+        for day_name in DAYS:
+            cheat_meal = "Make one of today's meals a cheat meal." if include_cheat_meal and day_name == CHEAT_MEAL_DAY else "Do not include a cheat meal."
+            user_prompt = f"""
+            Plan the meals for {day_name} of a 7-day health plan for this user:
+            {profile}
+            {cheat_meal}
+            CRITICAL INSTRUCTION: All dishes MUST be authentic and traditional dishes from the Andhra or Telangana regions of India. Do not include generic or North Indian dishes.
+            Choose dishes typical for a {day_name} so the week stays varied.
+            """
+            day_futures.append(self._executor.submit(
+                contextvars.copy_context().run, self._call_with_retries, DAY_SYSTEM_PROMPT, user_prompt,
+                lambda data, day_name=day_name: _validate_day(data, day_name), deadline,
+            ))
+        exercise_prompt = f"Plan a 7-day exercise routine (Monday to Sunday) for this user:\n{profile}"
+        exercise_future = self._executor.submit(
+            contextvars.copy_context().run, self._call_with_retries, EXERCISE_SYSTEM_PROMPT, exercise_prompt,
+            lambda data: data["exercises"], deadline,
+        )
+
+        days = [future.result() for future in day_futures]
+        exercises = exercise_future.result()
+        shopping_list = _merge_shopping_lists(day.pop("ingredients", None) for day in days)
+        return {"diet": days, "exercises": exercises, "shoppingList": shopping_list}
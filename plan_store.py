@@ -0,0 +1,284 @@
+# plan_store.py
+# Reads and writes the normalized plan tables (plan_days, plan_meals,
+# plan_exercises, plan_shopping_items) that back DietPlan.generated_plan,
+# and the diet_plans JSON columns, which hold each section serialized exactly
+# as the Plan type would serialize it (see response_encoding.py). Macro
+# rollups are computed once at write time: per day in plan_days and per plan
+# in plan_totals.
+
+import json
+
+NUTRITION_KEYS = ("calories", "protein_g", "carbs_g", "fat_g")
+# Plan field -> diet_plans column holding its serialized JSON.
+PLAN_JSON_COLUMNS = {"diet": "generated_plan_json", "exercises": "exercise_plan_json", "shoppingList": "shopping_list_json"}
+# The fields each stored section contains, nested for object fields; only a
+# selection of exactly these fields can be answered with the stored JSON.
+PLAN_JSON_SHAPES = {
+    "diet": {"day": None, "daily_calories": None, "meals": {"name": None, "dish": None, "quantity": None, "nutrition": dict.fromkeys(NUTRITION_KEYS)}},
+    "exercises": {"day": None, "activity": None},
+    "shoppingList": {"category": None, "items": None},
+}
+
+# A day's stated daily_calories counts as consistent with its meals within
+# this many kcal or this fraction of the meals' sum, whichever is larger.
+CALORIE_TOLERANCE_KCAL = 25
+CALORIE_TOLERANCE_RATIO = 0.05
+
+# --- Nutrition Rollups ---
+# Sums each listed plan's meals into its plan_days rows (used by the backfill).
+ROLLUP_DAYS_SQL = (
+    "UPDATE plan_days SET (total_calories, total_protein_g, total_carbs_g, total_fat_g) = ("
+    "SELECT COALESCE(SUM(calories), 0), COALESCE(SUM(protein_g), 0), COALESCE(SUM(carbs_g), 0), COALESCE(SUM(fat_g), 0) "
+    "FROM plan_meals WHERE plan_meals.day_id = plan_days.id) "
+    "WHERE plan_id IN (SELECT value FROM json_each(?))"
+)
+# Rebuilds plan_totals for each listed plan from its day rollups; plans without days get a zero row.
+ROLLUP_PLANS_SQL = (
+    "INSERT OR REPLACE INTO plan_totals (plan_id, days, calories, protein_g, carbs_g, fat_g, mismatched_days) "
+    "SELECT diet_plans.id, COUNT(plan_days.id), COALESCE(SUM(total_calories), 0), COALESCE(SUM(total_protein_g), 0), "
+    "COALESCE(SUM(total_carbs_g), 0), COALESCE(SUM(total_fat_g), 0), "
+    "COALESCE(SUM(ABS(daily_calories - total_calories) > MAX(?, total_calories * ?)), 0) "
+    "FROM diet_plans LEFT JOIN plan_days ON plan_days.plan_id = diet_plans.id "
+    "WHERE diet_plans.id IN (SELECT value FROM json_each(?)) GROUP BY diet_plans.id"
+)
+PLAN_TOTALS_SQL = "SELECT days, calories, protein_g, carbs_g, fat_g, mismatched_days FROM plan_totals WHERE plan_id = ?"
+
+
+def _as_int(value):
+    """Models sometimes return '350' or 350.0 for integer fields."""
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _as_str(value):
+    return "" if value is None else str(value)
+
+
+def normalize_plan(plan):
+    """
+    Returns the plan's diet, exercises and shoppingList with the keys, key
+    order and value types of the Plan GraphQL type, whatever the model sent.
+    """
+    return {
+        "diet": [
+            {
+                "day": _as_str(day.get("day")),
+                "daily_calories": _as_int(day.get("daily_calories")),
+                "meals": [
+                    {
+                        "name": _as_str(meal.get("name")), "dish": _as_str(meal.get("dish")), "quantity": _as_str(meal.get("quantity")),
+                        "nutrition": {key: _as_int((meal.get("nutrition") or {}).get(key)) for key in NUTRITION_KEYS},
+                    }
+                    for meal in day.get("meals") or []
+                ],
+            }
+            for day in plan.get("diet") or []
+        ],
+        "exercises": [{"day": _as_str(exercise.get("day")), "activity": _as_str(exercise.get("activity"))} for exercise in plan.get("exercises") or []],
+        "shoppingList": [
+            {"category": _as_str(entry.get("category")), "items": [_as_str(item) for item in entry.get("items") or []]}
+            for entry in plan.get("shoppingList") or []
+        ],
+    }
+
+
+def day_totals(day):
+    """Sums a normalized day's meal macros."""
+    return {key: sum(meal["nutrition"][key] for meal in day["meals"]) for key in NUTRITION_KEYS}
+
+
+def calories_consistent(daily_calories, meal_calories):
+    """Whether a day's stated calories agree with the sum of its meals (see CALORIE_TOLERANCE_*)."""
+    return abs(daily_calories - meal_calories) <= max(CALORIE_TOLERANCE_KCAL, meal_calories * CALORIE_TOLERANCE_RATIO)
+
+
+def weekly_totals(totals, days, mismatched_days):
+    """The WeeklyTotals shape from a plan's summed macros."""
+    return {
+        "days": days,
+        "total": totals,
+        "daily_average": {key: round(totals[key] / days) if days else 0 for key in NUTRITION_KEYS},
+        "mismatched_days": mismatched_days,
+    }
+
+
+def rollup_plans(conn, plan_ids):
+    """Recomputes the day and plan rollups of existing plans from their meals, inside the caller's transaction."""
+    ids = json.dumps(list(plan_ids))
+    conn.execute(ROLLUP_DAYS_SQL, (ids,))
+    conn.execute(ROLLUP_PLANS_SQL, (CALORIE_TOLERANCE_KCAL, CALORIE_TOLERANCE_RATIO, ids))
+
+
+def plan_json_values(plan):
+    """Serialized diet, exercises and shoppingList of a normalized plan, in PLAN_JSON_COLUMNS order."""
+    return tuple(json.dumps(plan[field], separators=(",", ":"), ensure_ascii=False) for field in PLAN_JSON_COLUMNS)
+
+
+def insert_plan_parts(conn, plan_id, plan):
+    """Inserts the diet, exercises and shoppingList of `plan` for an existing diet_plans row."""
+    plan = normalize_plan(plan)
+    for day_index, day in enumerate(plan["diet"]):
+        cursor = conn.execute(
+            "INSERT INTO plan_days (plan_id, day_index, day, daily_calories, total_calories, total_protein_g, total_carbs_g, total_fat_g) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (plan_id, day_index, day["day"], day["daily_calories"], *day_totals(day).values()),
+        )
+        day_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO plan_meals (day_id, plan_id, meal_index, name, dish, quantity, calories, protein_g, carbs_g, fat_g) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (day_id, plan_id, meal_index, meal["name"], meal["dish"], meal["quantity"], *(meal["nutrition"][key] for key in NUTRITION_KEYS))
+                for meal_index, meal in enumerate(day["meals"])
+            ],
+        )
+    conn.executemany(
+        "INSERT INTO plan_exercises (plan_id, position, day, activity) VALUES (?, ?, ?, ?)",
+        [(plan_id, position, exercise["day"], exercise["activity"]) for position, exercise in enumerate(plan["exercises"])],
+    )
+    conn.executemany(
+        "INSERT INTO plan_shopping_items (plan_id, category_index, category, item_index, item) VALUES (?, ?, ?, ?, ?)",
+        [(plan_id, category_index, entry["category"], item_index, item)
+         for category_index, entry in enumerate(plan["shoppingList"])
+         for item_index, item in enumerate(entry["items"])],
+    )
+    conn.execute(ROLLUP_PLANS_SQL, (CALORIE_TOLERANCE_KCAL, CALORIE_TOLERANCE_RATIO, json.dumps([plan_id])))
+
+
+def load_plan_json(conn, plan_id, field):
+    """The stored JSON text of one Plan section, or None if the plan does not exist."""
+    row = conn.execute(f"SELECT {PLAN_JSON_COLUMNS[field]} FROM diet_plans WHERE id = ?", (plan_id,)).fetchone()
+    return row[0] if row else None
+
+
+def _day(row):
+    day = {"day": row["day"], "daily_calories": row["daily_calories"], "meals": []}
+    if row["total_calories"] is not None:
+        day["totals"] = {key: row[f"total_{key}"] for key in NUTRITION_KEYS}
+    return day
+
+
+def _meal(row):
+    return {
+        "name": row["name"], "dish": row["dish"], "quantity": row["quantity"],
+        "nutrition": {"calories": row["calories"], "protein_g": row["protein_g"], "carbs_g": row["carbs_g"], "fat_g": row["fat_g"]},
+    }
+
+
+def load_diet(conn, plan_id):
+    """Returns the plan's days with their meals, in the DayPlan shape, with stored totals where rolled up."""
+    days = {}
+    day_rows = conn.execute(
+        "SELECT id, day, daily_calories, total_calories, total_protein_g, total_carbs_g, total_fat_g FROM plan_days WHERE plan_id = ? ORDER BY day_index",
+        (plan_id,),
+    )
+    for row in day_rows:
+        days[row["id"]] = _day(row)
+    meal_rows = conn.execute(
+        "SELECT day_id, name, dish, quantity, calories, protein_g, carbs_g, fat_g FROM plan_meals WHERE plan_id = ? ORDER BY day_id, meal_index",
+        (plan_id,),
+    )
+    for row in meal_rows:
+        days[row["day_id"]]["meals"].append(_meal(row))
+    return list(days.values())
+
+
+def load_exercises(conn, plan_id):
+    rows = conn.execute("SELECT day, activity FROM plan_exercises WHERE plan_id = ? ORDER BY position", (plan_id,))
+    return [dict(row) for row in rows]
+
+
+def load_shopping_list(conn, plan_id):
+    categories = {}
+    rows = conn.execute(
+        "SELECT category_index, category, item FROM plan_shopping_items WHERE plan_id = ? ORDER BY category_index, item_index",
+        (plan_id,),
+    )
+    for row in rows:
+        categories.setdefault(row["category_index"], {"category": row["category"], "items": []})["items"].append(row["item"])
+    return list(categories.values())
+
+
+def load_weekly_totals(conn, plan_id):
+    """The plan's WeeklyTotals from plan_totals, or summed from its days if it has not been rolled up yet."""
+    row = conn.execute(PLAN_TOTALS_SQL, (plan_id,)).fetchone()
+    if row is not None:
+        return weekly_totals({key: row[key] for key in NUTRITION_KEYS}, row["days"], row["mismatched_days"])
+    diet = [{**day, "totals": day.get("totals") or day_totals(day)} for day in load_diet(conn, plan_id)]
+    if not diet and conn.execute("SELECT 1 FROM diet_plans WHERE id = ?", (plan_id,)).fetchone() is None:
+        return None
+    return diet_weekly_totals(diet)
+
+
+def diet_weekly_totals(diet):
+    """WeeklyTotals computed from days that carry their totals (a freshly generated plan, or the fallback above)."""
+    totals = {key: sum(day["totals"][key] for day in diet) for key in NUTRITION_KEYS}
+    mismatched = sum(not calories_consistent(day["daily_calories"], day["totals"]["calories"]) for day in diet)
+    return weekly_totals(totals, len(diet), mismatched)
+
+
+# --- Batched Loads ---
+# One query per table for many plans at once, keyed by plan id; plans with no
+# rows are left out. Used by the request-scoped loaders in dataloaders.py.
+def batch_load_plan_json(conn, plan_ids, field):
+    rows = conn.execute(f"SELECT id, {PLAN_JSON_COLUMNS[field]} FROM diet_plans WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(plan_ids),))
+    return {row[0]: row[1] for row in rows}
+
+
+def batch_load_diet(conn, plan_ids):
+    ids = json.dumps(plan_ids)
+    diets, days = {}, {}
+    day_rows = conn.execute(
+        "SELECT plan_id, id, day, daily_calories, total_calories, total_protein_g, total_carbs_g, total_fat_g FROM plan_days "
+        "WHERE plan_id IN (SELECT value FROM json_each(?)) ORDER BY plan_id, day_index",
+        (ids,),
+    )
+    for row in day_rows:
+        days[row["id"]] = _day(row)
+        diets.setdefault(row["plan_id"], []).append(days[row["id"]])
+    meal_rows = conn.execute(
+        "SELECT day_id, name, dish, quantity, calories, protein_g, carbs_g, fat_g FROM plan_meals "
+        "WHERE plan_id IN (SELECT value FROM json_each(?)) ORDER BY plan_id, day_id, meal_index",
+        (ids,),
+    )
+    for row in meal_rows:
+        days[row["day_id"]]["meals"].append(_meal(row))
+    return diets
+
+
+def batch_load_exercises(conn, plan_ids):
+    exercises = {}
+    rows = conn.execute(
+        "SELECT plan_id, day, activity FROM plan_exercises WHERE plan_id IN (SELECT value FROM json_each(?)) ORDER BY plan_id, position",
+        (json.dumps(plan_ids),),
+    )
+    for row in rows:
+        exercises.setdefault(row["plan_id"], []).append({"day": row["day"], "activity": row["activity"]})
+    return exercises
+
+
+def batch_load_shopping_list(conn, plan_ids):
+    categories = {}
+    rows = conn.execute(
+        "SELECT plan_id, category_index, category, item FROM plan_shopping_items "
+        "WHERE plan_id IN (SELECT value FROM json_each(?)) ORDER BY plan_id, category_index, item_index",
+        (json.dumps(plan_ids),),
+    )
+    for row in rows:
+        plan = categories.setdefault(row["plan_id"], {})
+        plan.setdefault(row["category_index"], {"category": row["category"], "items": []})["items"].append(row["item"])
+    return {plan_id: list(plan.values()) for plan_id, plan in categories.items()}
+
+
+def batch_load_weekly_totals(conn, plan_ids):
+    """WeeklyTotals from plan_totals; the few plans not rolled up yet go through load_weekly_totals one by one."""
+    rows = conn.execute(
+        "SELECT plan_id, days, calories, protein_g, carbs_g, fat_g, mismatched_days FROM plan_totals WHERE plan_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(plan_ids),),
+    )
+    totals = {row["plan_id"]: weekly_totals({key: row[key] for key in NUTRITION_KEYS}, row["days"], row["mismatched_days"]) for row in rows}
+    for plan_id in plan_ids:
+        if plan_id not in totals:
+            totals[plan_id] = load_weekly_totals(conn, plan_id)
+    return {plan_id: value for plan_id, value in totals.items() if value is not None}
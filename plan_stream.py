@@ -0,0 +1,68 @@
+# plan_stream.py
+# Incremental parser that turns a streamed plan completion into per-section events.
+
+import json
+
+
+class IncrementalPlanParser:
+    """
+    Consumes the JSON text of a plan completion chunk by chunk.
+
+    feed() returns the events completed by that chunk, in order:
+      ("day", {...})            as soon as each object in "diet" is closed
+      ("exercises", [...])      once the whole "exercises" array is closed
+      ("shoppingList", [...])   once the whole "shoppingList" array is closed
+    Only brace depth and string state are tracked, so each character is looked
+    at once and nothing is re-parsed until a complete value is available.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._last_key = None
+        self._section = None
+        self._value_start = None
+
+    def feed(self, chunk):
+        events = []
+        self._text += chunk
+        text = self._text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = json.loads(text[self._string_start:i + 1])
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    # A top-level value is opening; remember which key it belongs to.
+                    self._section = self._last_key
+                    self._value_start = i
+                elif self._depth == 3 and self._section == "diet" and char == "{":
+                    self._value_start = i
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._section == "diet" and char == "}":
+                    events.append(("day", json.loads(text[self._value_start:i + 1])))
+                elif self._depth == 1 and self._section in ("exercises", "shoppingList"):
+                    events.append((self._section, json.loads(text[self._value_start:i + 1])))
+        self._pos = len(text)
+        return events
+
+    def text(self):
+        """The full completion received so far."""
+        return self._text
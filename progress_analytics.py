@@ -0,0 +1,154 @@
+# progress_analytics.py
+# Server-side analytics for a user's weight log, so the dashboard receives a
+# chart-sized series instead of every user_progress row. Computed with NumPy
+# from one covering-index read: a downsampled series (largest-triangle-three-
+# buckets or ISO-week means, picked by a target point count), a calendar-day
+# rolling average, a least-squares trend and projected goal dates.
+
+from datetime import date, timedelta
+
+import numpy as np
+
+METHODS = ("auto", "raw", "weekly", "lttb")
+# Projections further out than this are reported as unreachable.
+MAX_PROJECTION_DAYS = 3650
+
+HISTORY_SQL = "SELECT log_date, weight_kg FROM user_progress WHERE user_id = ? ORDER BY log_date"
+
+
+def _parse_day(value):
+    """Days since 1970-01-01 of a stored log_date, accepting unpadded dates ("2024-1-9"); None if unreadable."""
+    try:
+        day = date.fromisoformat(value)
+    except (TypeError, ValueError):
+        try:
+            day = date(*(int(part) for part in str(value).split("-")))
+        except (TypeError, ValueError):
+            return None
+    return (day - date(1970, 1, 1)).days
+
+
+def load_history(conn, user_id):
+    """
+    Returns (days since 1970-01-01, weights) as NumPy arrays, oldest first.
+    Rows logged before dates were validated may not be zero-padded ISO; those
+    are normalised (and re-sorted) or, if unreadable, skipped.
+    """
+    rows = conn.execute(HISTORY_SQL, (user_id,)).fetchall()
+    try:
+        days = np.array([row[0] for row in rows], dtype="datetime64[D]").astype(np.int64)
+    except ValueError:
+        parsed = [(day, row[1]) for row in rows if (day := _parse_day(row[0])) is not None]
+        parsed.sort(key=lambda entry: entry[0])
+        days = np.fromiter((day for day, _ in parsed), dtype=np.int64, count=len(parsed))
+        rows = [(None, weight) for _, weight in parsed]
+    weights = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return days, weights
+
+
+def _to_date(day):
+    return (date(1970, 1, 1) + timedelta(days=int(day))).isoformat()
+
+
+def rolling_mean(days, weights, window_days):
+    """Mean of each entry and every entry in the `window_days` calendar days ending on it."""
+    sums = np.concatenate(([0.0], np.cumsum(weights)))
+    ends = np.arange(1, len(days) + 1)
+    starts = np.searchsorted(days, days - window_days + 1, side="left")
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def lttb_indices(days, weights, target):
+    """
+    Indices of the points kept by largest-triangle-three-buckets: the first and
+    last point, plus the point of each bucket that spans the largest triangle
+    with the previously kept point and the mean of the next bucket.
+    """
+    n = len(days)
+    if target >= n or target < 3:
+        return np.arange(n)
+    x, y = days.astype(np.float64), weights
+    edges = np.linspace(1, n - 1, target - 1).astype(np.int64)
+    indices = np.empty(target, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    kept = 0
+    for bucket in range(target - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[kept] - next_x) * (y[start:end] - y[kept]) - (x[kept] - x[start:end]) * (next_y - y[kept]))
+        kept = start + int(np.argmax(areas))
+        indices[bucket + 1] = kept
+    return indices
+
+
+def weekly_buckets(days, weights, rolling):
+    """Mean weight per ISO week (dated on its Monday), with the rolling average as of the week's last entry."""
+    # 1970-01-01 was a Thursday, so (day + 3) % 7 counts days since Monday.
+    mondays = days - (days + 3) % 7
+    starts = np.flatnonzero(np.concatenate(([True], mondays[1:] != mondays[:-1])))
+    counts = np.diff(np.concatenate((starts, [len(days)])))
+    means = np.add.reduceat(weights, starts) / counts
+    return mondays[starts], means, rolling[starts + counts - 1]
+
+
+def fit_trend(days, weights, trend_days):
+    """Least-squares line through the last `trend_days` days of entries, or None with too little data."""
+    recent = days >= days[-1] - trend_days + 1
+    x, y = days[recent].astype(np.float64), weights[recent]
+    if len(x) < 2 or x[0] == x[-1]:
+        return None
+    slope, intercept = np.polyfit(x - x[-1], y, 1)
+    residual = y - (slope * (x - x[-1]) + intercept)
+    spread = np.sum((y - y.mean()) ** 2)
+    return {
+        "slope_per_day": float(slope),
+        "slope_kg_per_week": round(float(slope) * 7, 3),
+        "r_squared": round(float(1 - np.sum(residual ** 2) / spread) if spread else 1.0, 4),
+        "fitted_from": _to_date(x[0]),
+        "fitted_to": _to_date(x[-1]),
+        "current_kg": round(float(intercept), 2),
+    }
+
+
+def project_goal(trend, last_day, goal_kg):
+    """Date the trend line reaches `goal_kg`, or None if it is heading the other way or too slowly."""
+    projection = {"goal_kg": goal_kg, "projected_date": None, "days_from_last_log": None}
+    if trend is None:
+        return projection
+    gap = goal_kg - trend["current_kg"]
+    if abs(gap) < 0.05:
+        days = 0
+    elif trend["slope_per_day"] == 0 or gap / trend["slope_per_day"] < 0:
+        return projection
+    else:
+        days = int(np.ceil(gap / trend["slope_per_day"]))
+    if days > MAX_PROJECTION_DAYS:
+        return projection
+    projection.update(projected_date=_to_date(last_day + days), days_from_last_log=days)
+    return projection
+
+
+def compute_analytics(days, weights, target_points=120, method="auto", window_days=7, trend_days=90, goal_weights=None):
+    """Builds the ProgressAnalytics payload from load_history's arrays."""
+    result = {"total_entries": len(days), "method": "raw", "points": [], "trend": None, "goals": []}
+    if not len(days):
+        result["goals"] = [project_goal(None, 0, goal) for goal in goal_weights or []]
+        return result
+    rolling = rolling_mean(days, weights, window_days)
+    if method == "auto":
+        weeks = len(np.unique(days - (days + 3) % 7))
+        method = "raw" if len(days) <= target_points else "weekly" if weeks <= target_points else "lttb"
+    if method == "weekly":
+        point_days, point_weights, point_rolling = weekly_buckets(days, weights, rolling)
+    else:
+        keep = lttb_indices(days, weights, target_points) if method == "lttb" else np.arange(len(days))
+        point_days, point_weights, point_rolling = days[keep], weights[keep], rolling[keep]
+    result["method"] = method
+    result["points"] = [
+        {"log_date": _to_date(day), "weight_kg": round(float(weight), 2), "rolling_avg_kg": round(float(average), 2)}
+        for day, weight, average in zip(point_days, point_weights, point_rolling)
+    ]
+    result["trend"] = fit_trend(days, weights, trend_days)
+    result["goals"] = [project_goal(result["trend"], days[-1], goal) for goal in goal_weights or []]
+    return result
@@ -0,0 +1,174 @@
+# progress_io.py
+# Bulk import and streaming export of weight logs (user_progress). Imports are
+# parsed row by row from CSV or NDJSON, validated, and written with batched
+# executemany INSERT OR REPLACE in one transaction, so a years-long history
+# costs one commit instead of one mutation per day. Exports page through the
+# covering (user_id, log_date, weight_kg) index and never hold the whole
+# history in memory.
+
+import csv
+import io
+import itertools
+import json
+from datetime import date
+
+from dashboard_cache import bump_version
+
+FORMATS = ("csv", "ndjson")
+MIN_WEIGHT_KG = 20.0
+MAX_WEIGHT_KG = 500.0
+# Only the first few problems are reported back; the counts cover every row.
+MAX_REPORTED_ERRORS = 100
+
+UPSERT_PROGRESS_SQL = "INSERT OR REPLACE INTO user_progress (user_id, weight_kg, log_date) VALUES (?, ?, ?)"
+EXPORT_PAGE_SQL = "SELECT log_date, weight_kg FROM user_progress WHERE user_id = ? AND log_date > ? ORDER BY log_date LIMIT ?"
+
+DATE_COLUMNS = ("date", "log_date")
+WEIGHT_COLUMNS = ("weight", "weight_kg")
+
+
+class ImportFormatError(ValueError):
+    """The upload is not CSV/NDJSON in a shape we can read at all (as opposed to a bad row)."""
+
+
+def detect_format(content_type, filename=None):
+    """Picks csv or ndjson from the upload's file name or Content-Type; CSV unless told otherwise."""
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+def parse_csv(stream):
+    """Yields (line_number, date, weight) from a CSV text stream with a date and a weight column."""
+    reader = csv.reader(stream)
+    header = [column.strip().lower() for column in next(reader, [])]
+    try:
+        date_index = next(header.index(name) for name in DATE_COLUMNS if name in header)
+        weight_index = next(header.index(name) for name in WEIGHT_COLUMNS if name in header)
+    except StopIteration:
+        raise ImportFormatError("CSV header must name a date column and a weight column.") from None
+    min_length = max(date_index, weight_index) + 1
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < min_length:
+            yield reader.line_num, None, None
+            continue
+        yield reader.line_num, row[date_index], row[weight_index]
+
+
+def parse_ndjson(stream):
+    """Yields (line_number, date, weight) from newline-delimited JSON objects."""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            yield line_number, None, None
+            continue
+        if not isinstance(entry, dict):
+            yield line_number, None, None
+            continue
+        yield line_number, next((entry[k] for k in DATE_COLUMNS if k in entry), None), next((entry[k] for k in WEIGHT_COLUMNS if k in entry), None)
+
+
+def parse_entries(entries):
+    """Yields (position, date, weight) from a list of {date, weight} dicts, as the mutation passes them."""
+    for position, entry in enumerate(entries, 1):
+        yield position, entry.get("date"), entry.get("weight")
+
+
+def parse_log_date(log_date):
+    """Returns the date as zero-padded YYYY-MM-DD, as log_date is stored and sorted, or raises ValueError."""
+    try:
+        return date.fromisoformat(str(log_date).strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"invalid date {log_date!r}, expected YYYY-MM-DD") from None
+
+
+def validate_entry(log_date, weight):
+    """Returns (weight_kg, iso_date) or raises ValueError with a readable reason."""
+    log_date = parse_log_date(log_date)
+    try:
+        weight = float(weight)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid weight {weight!r}") from None
+    if not MIN_WEIGHT_KG <= weight <= MAX_WEIGHT_KG:
+        raise ValueError(f"weight {weight} is outside {MIN_WEIGHT_KG:g}-{MAX_WEIGHT_KG:g} kg")
+    return weight, log_date
+
+
+class ImportReport:
+    """Counts imported and rejected rows while the input is consumed."""
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def valid_rows(self, user_id, parsed):
+        """Filters parsed rows down to upsert parameters, recording every rejection."""
+        for line_number, log_date, weight in parsed:
+            try:
+                if log_date is None and weight is None:
+                    raise ValueError("unreadable row")
+                weight_kg, iso_date = validate_entry(log_date, weight)
+            except ValueError as error:
+                self.rejected += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append(f"line {line_number}: {error}")
+                continue
+            self.imported += 1
+            yield user_id, weight_kg, iso_date
+
+    def as_dict(self):
+        return {"imported": self.imported, "rejected": self.rejected, "errors": self.errors}
+
+
+def import_progress(conn, user_id, parsed, batch_size=10000):
+    """
+    Upserts every valid row of `parsed` for the user in one transaction and
+    returns the ImportReport. Rows are consumed lazily in executemany batches,
+    so the input is never materialized; later rows win for a repeated date.
+    """
+    report = ImportReport()
+    rows = report.valid_rows(user_id, parsed)
+    try:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            conn.executemany(UPSERT_PROGRESS_SQL, batch)
+        if report.imported:
+            bump_version(conn, user_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return report
+
+
+def export_progress(pool, user_id, fmt="csv", page_size=5000):
+    """
+    Yields the user's weight history as CSV or NDJSON text, one page at a
+    time. Each page is its own short read, keyed on the last date sent, so a
+    slow client never keeps a read transaction open.
+    """
+    if fmt == "csv":
+        yield "date,weight_kg\n"
+    last_date = ""
+    while True:
+        with pool.connection() as conn:
+            rows = conn.execute(EXPORT_PAGE_SQL, (user_id, last_date, page_size)).fetchall()
+        if not rows:
+            return
+        buffer = io.StringIO()
+        if fmt == "csv":
+            csv.writer(buffer, lineterminator="\n").writerows((row["log_date"], row["weight_kg"]) for row in rows)
+        else:
+            buffer.writelines(json.dumps({"date": row["log_date"], "weight_kg": row["weight_kg"]}) + "\n" for row in rows)
+        yield buffer.getvalue()
+        last_date = rows[-1]["log_date"]
@@ -0,0 +1,101 @@
+# query_audit.py
+# Runs EXPLAIN QUERY PLAN for every SQL statement the backend issues at request
+# time and fails if any of them scans a whole table or index.
+#
+# Usage: python query_audit.py [--verbose]
+
+import argparse
+import ast
+import os
+import re
+import sqlite3
+import sys
+
+from migrations import migrate
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Modules whose SQL runs on request paths. migrations.py is left out on
+# purpose: its one-off backfill and clean-up statements may scan.
+AUDITED_MODULES = ["asgi_server.py", "backend_server.py", "dashboard_cache.py", "dataloaders.py", "dish_catalog.py", "jobs.py", "llm_cache.py", "plan_batch.py", "plan_store.py", "progress_analytics.py", "progress_io.py", "recipe_store.py", "single_flight.py"]
+
+# Statements assembled at runtime from several pieces, as the resolvers build them.
+DYNAMIC_STATEMENTS = [
+    "SELECT id, created_at FROM diet_plans WHERE user_id = ? AND (created_at < ? OR (created_at = ? AND id < ?)) ORDER BY created_at DESC, id DESC LIMIT ?",
+    "SELECT id, created_at FROM diet_plans WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+    "SELECT weight_kg, log_date FROM user_progress WHERE user_id = ? AND log_date > ? ORDER BY log_date ASC LIMIT ?",
+]
+
+SQL_START = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+# Any SCAN reads the whole table or index, so every one fails the audit except
+# a covering-index scan of a table listed here as deliberately small.
+FULL_SCAN = re.compile(r"^SCAN (\w+)( USING COVERING INDEX)?")
+SMALL_TABLES = set()
+TEMP_SORT = "USE TEMP B-TREE"
+
+
+def _render(node):
+    """Turns a string or f-string node into SQL text; interpolated parts become '*'."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        return "".join(part.value if isinstance(part, ast.Constant) else "*" for part in node.values)
+    return None
+
+
+def collect_statements(paths):
+    """Yields (location, sql) for every SQL string literal in the given modules."""
+    for path in paths:
+        with open(path) as source:
+            tree = ast.parse(source.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.JoinedStr):
+                # Constant parts of an f-string are visited on their own too; skip them.
+                for part in node.values:
+                    part._inside_fstring = True
+            sql = _render(node)
+            if sql and SQL_START.match(sql) and not getattr(node, "_inside_fstring", False):
+                yield f"{os.path.basename(path)}:{node.lineno}", " ".join(sql.split())
+
+
+def audit(conn, statements, verbose=False):
+    """
+    Returns the statements whose query plan contains a full table or index scan.
+    Temporary sort B-trees are printed as warnings but do not fail the audit.
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    failures = []
+    for location, sql in statements:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count("?"))]
+        scans = [
+            detail for detail in plan
+            if (match := FULL_SCAN.match(detail)) and match.group(1) in tables and not (match.group(2) and match.group(1) in SMALL_TABLES)
+        ]
+        if scans:
+            failures.append((location, sql, scans))
+        sorts = any(detail.startswith(TEMP_SORT) for detail in plan)
+        if verbose or scans or sorts:
+            status = "FULL SCAN" if scans else "warn sort" if sorts else "ok"
+            print(f"{status:<9} {location:<24} {sql}")
+            for detail in plan:
+                print(f"{'':<34} {detail}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if any backend SQL statement does a full table scan.")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every statement")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    migrate(conn)
+    statements = list(collect_statements(os.path.join(ROOT, module) for module in AUDITED_MODULES))
+    statements += [(f"dynamic[{i}]", sql) for i, sql in enumerate(DYNAMIC_STATEMENTS)]
+    failures = audit(conn, statements, verbose=args.verbose)
+    print(f"\n{len(statements)} statements audited, {len(failures)} with full scans.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
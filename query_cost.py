@@ -0,0 +1,210 @@
+# query_cost.py
+# Static cost analysis of GraphQL documents, run after parsing and before
+# execution. Every field that returns an object costs 1 unless it has its own
+# weight (the LLM-backed mutations cost the most); a list multiplies the cost
+# of its items by its page argument, the length of a list argument, or an
+# assumed size. Documents over the per-request cost or depth limit are
+# rejected, and each client draws its costs from a per-minute budget.
+#
+# The check is not a validation rule: cached documents skip validation (see
+# persisted_queries.DocumentCache), and the cost depends on the variables.
+
+import threading
+import time
+from collections import OrderedDict
+
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, GraphQLList, GraphQLNonNull, InlineFragmentNode,
+    OperationDefinitionNode, VariableNode, get_named_type, is_composite_type, type_from_ast, value_from_ast,
+)
+
+from llm_gateway import TokenBucket
+
+# Names the user an operation without a userId argument (swapMeal, getRecipe) acts for.
+USER_HEADER = "X-User-Id"
+
+
+class QueryCostError(GraphQLError):
+    """A document refused before execution; `code` is QUERY_TOO_COMPLEX or THROTTLED."""
+
+    def __init__(self, message, code, **details):
+        super().__init__(message, extensions={"code": code, **details})
+        self.code = code
+
+
+def _is_list(field_type):
+    return isinstance(field_type.of_type if isinstance(field_type, GraphQLNonNull) else field_type, GraphQLList)
+
+
+def _select_operation(document, operation_name):
+    operations = [d for d in document.definitions if isinstance(d, OperationDefinitionNode)]
+    if operation_name:
+        operations = [op for op in operations if op.name and op.name.value == operation_name]
+    return operations[0] if len(operations) == 1 else None
+
+
+class QueryCostAnalyzer:
+    """
+    Prices documents against `schema`. `weights` maps "Type.field" to the cost
+    of one value of that field; `list_sizes` maps list fields to their assumed
+    length; `size_arguments` maps fields to (argument, cap), whose value (or
+    length, for a list argument) multiplies the field's cost, capped as the
+    resolver caps it. Other lists count as `default_list_size` items.
+    """
+
+    def __init__(self, schema, weights=None, list_sizes=None, size_arguments=None, default_list_size=10,
+                 max_cost=5000, max_depth=10, budget_per_minute=10000, max_clients=10000):
+        self.schema = schema
+        self.weights = dict(weights or {})
+        self.list_sizes = dict(list_sizes or {})
+        self.size_arguments = dict(size_arguments or {})
+        self.default_list_size = default_list_size
+        self.max_cost = max_cost
+        self.max_depth = max_depth
+        self.budget_per_minute = budget_per_minute
+        self.max_clients = max_clients
+        self._budgets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.throttled = 0
+
+    def analyze(self, document, variables=None, operation_name=None):
+        """Returns (cost, depth) of the operation that would run; (0, 0) if none would."""
+        operation = _select_operation(document, operation_name)
+        root = self.schema.get_root_type(operation.operation) if operation else None
+        if root is None:
+            return 0, 0
+        fragments = {d.name.value: d for d in document.definitions if isinstance(d, FragmentDefinitionNode)}
+        return self._selection_cost(root, operation.selection_set, self._variables(operation, variables or {}), fragments, 1, frozenset())
+
+    def _variables(self, operation, variables):
+        """The request's variables with the operation's declared defaults filled in."""
+        values = dict(variables)
+        for definition in operation.variable_definitions or ():
+            name = definition.variable.name.value
+            variable_type = type_from_ast(self.schema, definition.type)
+            if values.get(name) is None and definition.default_value is not None and variable_type is not None:
+                values[name] = value_from_ast(definition.default_value, variable_type)
+        return values
+
+    def _selection_cost(self, parent_type, selection_set, variables, fragments, depth, spread):
+        cost, max_depth = 0, 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self._field_cost(parent_type, selection, variables, fragments, depth, spread)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = self.schema.get_type(selection.type_condition.name.value) if selection.type_condition else parent_type
+                if not is_composite_type(fragment_type):
+                    continue
+                field_cost, field_depth = self._selection_cost(fragment_type, selection.selection_set, variables, fragments, depth, spread)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = fragments.get(name)
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value) if fragment else None
+                if name in spread or not is_composite_type(fragment_type):
+                    continue
+                field_cost, field_depth = self._selection_cost(fragment_type, fragment.selection_set, variables, fragments, depth, spread | {name})
+            else:
+                continue
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def _field_cost(self, parent_type, node, variables, fragments, depth, spread):
+        name = node.name.value
+        fields = getattr(parent_type, "fields", {})
+        # Introspection is free and does not count towards the depth.
+        if name.startswith("__") or name not in fields:
+            return 0, 0
+        field = fields[name]
+        key = f"{parent_type.name}.{name}"
+        named_type = get_named_type(field.type)
+        cost = self.weights.get(key, 1 if is_composite_type(named_type) else 0)
+        child_depth = depth
+        if node.selection_set and is_composite_type(named_type):
+            child_cost, child_depth = self._selection_cost(named_type, node.selection_set, variables, fragments, depth + 1, spread)
+            cost += child_cost
+        return cost * self._size(key, field, node, variables), max(depth, child_depth)
+
+    def _size(self, key, field, node, variables):
+        if key in self.size_arguments:
+            argument, cap = self.size_arguments[key]
+            value_node = next((arg.value for arg in node.arguments or () if arg.name.value == argument), None)
+            value = field.args[argument].default_value if value_node is None else value_from_ast(value_node, field.args[argument].type, variables)
+            if isinstance(value, (list, tuple)):
+                value = len(value)
+            return max(0, min(value, cap)) if isinstance(value, int) else 1
+        if _is_list(field.type):
+            return self.list_sizes.get(key, self.default_list_size)
+        return 1
+
+    def _budget(self, client):
+        bucket = self._budgets.get(client)
+        if bucket is None:
+            bucket = self._budgets[client] = TokenBucket(self.budget_per_minute, burst_seconds=60)
+            while len(self._budgets) > self.max_clients:
+                self._budgets.popitem(last=False)
+        self._budgets.move_to_end(client)
+        return bucket
+
+    def price(self, document, variables=None, operation_name=None):
+        """
+        Returns the cost report for extensions.cost without charging anyone;
+        raises QueryCostError if the document is over the cost or depth limit.
+        """
+        cost, depth = self.analyze(document, variables, operation_name)
+        report = {"requested": cost, "depth": depth, "maximum": self.max_cost}
+        if cost > self.max_cost or depth > self.max_depth:
+            with self._lock:
+                self.rejected += 1
+            limit = f"cost {cost} exceeds the limit of {self.max_cost}" if cost > self.max_cost else f"depth {depth} exceeds the limit of {self.max_depth}"
+            raise QueryCostError(f"Query is too complex: {limit}.", "QUERY_TOO_COMPLEX", cost=report)
+        return report
+
+    def charge(self, report, client, cost=None):
+        """
+        Draws `cost` (by default the report's full cost) from `client`'s
+        budget; raises QueryCostError if the budget cannot cover it yet.
+        """
+        cost = report["requested"] if cost is None else min(cost, report["requested"])
+        if client is None or not cost:
+            return
+        with self._lock:
+            bucket = self._budget(client)
+            wait = bucket.wait_time(cost, time.monotonic())
+            if wait:
+                self.throttled += 1
+                raise QueryCostError(
+                    "Query cost budget exhausted; retry later.", "THROTTLED",
+                    cost={**report, "remaining": int(bucket.tokens), "retryAfter": round(wait, 1)},
+                )
+            bucket.take(cost)
+
+    def check(self, document, variables=None, operation_name=None, client=None):
+        """Prices the document and charges its full cost to `client`; returns the cost report."""
+        report = self.price(document, variables, operation_name)
+        self.charge(report, client)
+        return report
+
+    def stats(self):
+        with self._lock:
+            return {"rejected": self.rejected, "throttled": self.throttled, "clients": len(self._budgets)}
+
+
+def operation_client(document, variables=None, operation_name=None, user_header=None, address=None):
+    """
+    The budget key of a request: the userId of the first root field with a
+    userId argument, else the USER_HEADER value, else the client's address.
+    There is no authentication, so this is only as trustworthy as the client.
+    """
+    operation = _select_operation(document, operation_name)
+    for selection in operation.selection_set.selections if operation else ():
+        if not isinstance(selection, FieldNode):
+            continue
+        for argument in selection.arguments or ():
+            if argument.name.value == "userId":
+                value = argument.value
+                user_id = (variables or {}).get(value.name.value) if isinstance(value, VariableNode) else getattr(value, "value", None)
+                if user_id is not None:
+                    return f"user:{user_id}"
+    return f"user:{user_header}" if user_header else f"address:{address}"
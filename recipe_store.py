@@ -0,0 +1,78 @@
+# recipe_store.py
+# Shared, user-independent storage for getRecipe answers and swapMeal candidates.
+
+import re
+import threading
+from collections import OrderedDict
+
+
+def normalize_dish_name(dish_name):
+    """'  Gongura  Pachadi!' and 'gongura pachadi' map to the same key."""
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", dish_name.lower())).strip()
+
+
+# --- Persistent Recipe Store ---
+class RecipeStore:
+    """Read-through store over the recipes table, filled on the first request for a dish."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dish_name):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT recipe FROM recipes WHERE dish_key = ?", (normalize_dish_name(dish_name),)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row["recipe"]
+
+    def put(self, dish_name, recipe):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO recipes (dish_key, dish_name, recipe) VALUES (?, ?, ?)",
+                (normalize_dish_name(dish_name), dish_name, recipe),
+            )
+            conn.commit()
+
+
+# --- Swap Candidate Cache ---
+class SwapCandidateCache:
+    """
+    Bounded in-memory cache of swap alternatives per (mealName, dishToSwap,
+    dietaryPreference). Each call hands out the next unserved candidate, so
+    repeated swaps get different dishes; None means the batch is used up and
+    the caller should ask the model for a fresh one.
+    """
+
+    def __init__(self, max_keys=1024):
+        self.max_keys = max_keys
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(meal_name, dish_to_swap, dietary_preference):
+        return (meal_name.strip().lower(), normalize_dish_name(dish_to_swap), dietary_preference.strip().lower())
+
+    def next_candidate(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.pop(0)
+
+    def put_batch(self, key, candidates):
+        with self._lock:
+            self._entries[key] = list(candidates)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
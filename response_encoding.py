@@ -0,0 +1,151 @@
+# response_encoding.py
+# Turns GraphQL results into response bodies. Results are serialized with
+# orjson when it is installed (stdlib json otherwise); JSON that is already
+# stored serialized (the plan sections in diet_plans) is spliced in by
+# resolvers instead of being parsed and encoded again; bodies above a size
+# threshold are compressed with brotli or gzip, as the client's
+# Accept-Encoding allows.
+
+import gzip
+import json
+import re
+import uuid
+
+from graphql import FieldNode
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# --- Splicing Stored JSON ---
+def selects_shape(selection_set, shape):
+    """
+    True if the selection asks for exactly the fields of `shape` (a dict of
+    field name -> nested shape, or None for leaves), in order and with no
+    aliases, arguments, directives or fragments: the only selection whose
+    response is exactly the stored serialization.
+    """
+    if shape is None:
+        return selection_set is None
+    if selection_set is None or len(selection_set.selections) != len(shape):
+        return False
+    for selection, (name, field_shape) in zip(selection_set.selections, shape.items()):
+        if not isinstance(selection, FieldNode) or selection.alias or selection.arguments or selection.directives:
+            return False
+        if selection.name.value != name or not selects_shape(selection.selection_set, field_shape):
+            return False
+    return True
+
+
+def can_splice(info, shape):
+    """Whether the field being resolved, stored with the given shape, may be answered with splice()."""
+    context = info.context
+    return (
+        isinstance(context, dict) and "raw_json" in context and len(info.field_nodes) == 1
+        and selects_shape(info.field_nodes[0].selection_set, shape)
+    )
+
+
+def splice(info, text, stand_in=None):
+    """
+    Records `text` (serialized JSON) as this field's value in the response and
+    returns a stand-in for GraphQL to complete instead: an empty list unless
+    given. Only call when can_splice() is true.
+    """
+    info.context["raw_json"][tuple(info.path.as_list())] = text
+    return [] if stand_in is None else stand_in
+
+
+def _place_markers(data, raw_json, token):
+    """Swaps each spliced field's stand-in for a marker string; returns the texts in marker order."""
+    texts = []
+    for path, text in raw_json.items():
+        parent = data
+        for key in path[:-1]:
+            parent = parent[key] if parent is not None else None
+        # A field error can null a parent after the resolver ran.
+        if parent is None:
+            continue
+        parent[path[-1]] = f"{token}{len(texts)}"
+        texts.append(text.encode())
+    return texts
+
+
+# --- Response Encoder ---
+class ResponseEncoder:
+    """
+    Serializes and compresses GraphQL results. One instance per server, set up
+    from the environment; `context(request)` builds each execution's context
+    value, which collects the raw JSON spliced in by resolvers.
+    """
+
+    def __init__(self, compress=True, min_bytes=1024, gzip_level=6, brotli_quality=4, splice=True):
+        self.compress = compress
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.splice = splice
+
+    def context(self, request):
+        context = {"request": request}
+        if self.splice:
+            context["raw_json"] = {}
+        return context
+
+    def dumps(self, result, context=None):
+        """Serializes a result to UTF-8 bytes, splicing in the context's raw JSON."""
+        raw_json = (context or {}).get("raw_json")
+        texts = []
+        if raw_json and result.get("data"):
+            token = f"__raw_json_{uuid.uuid4().hex}_"
+            texts = _place_markers(result["data"], raw_json, token)
+        body = orjson.dumps(result) if orjson is not None else json.dumps(result, separators=(",", ":"), ensure_ascii=False).encode()
+        if texts:
+            body = re.sub(rb'"' + token.encode() + rb'(\d+)"', lambda match: texts[int(match.group(1))], body)
+        return body
+
+    def negotiate(self, accept_encoding):
+        """Picks br or gzip from an Accept-Encoding header, or None for identity."""
+        accepted = {}
+        for part in (accept_encoding or "").lower().split(","):
+            coding, _, params = part.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[coding.strip()] = quality
+        for coding in ("br", "gzip"):
+            if coding == "br" and brotli is None:
+                continue
+            if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+                return coding
+        return None
+
+    def encode(self, body, accept_encoding, headers=None):
+        """
+        Returns (body, headers) for the wire: compressed when the body is at
+        least min_bytes and the client accepts br or gzip. A strong ETag in
+        `headers` is weakened, since it now names one encoding of the body.
+        """
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept-Encoding"
+        coding = self.negotiate(accept_encoding) if self.compress and len(body) >= self.min_bytes else None
+        if coding is None:
+            return body, headers
+        if coding == "br":
+            body = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            body = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        headers["Content-Encoding"] = coding
+        if headers.get("ETag", "").startswith('"'):
+            headers["ETag"] = "W/" + headers["ETag"]
+        return body, headers
@@ -0,0 +1,375 @@
+# single_flight.py
+# Request coalescing for OpenAI calls: while a completion for a prompt is in
+# flight, identical prompts wait for it instead of making their own upstream
+# request. Threads of one worker share a call through an Event; workers share
+# it through a lease row in the llm_inflight table, where the leader writes
+# the result (or its error's type and message) for the other workers to pick
+# up. AsyncSingleFlight does the same for asgi_server.py, running the lease
+# queries on worker threads.
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+
+class SingleFlightError(Exception):
+    """The leading call failed in another worker with an error of an unregistered type; carries its message."""
+
+
+class _LeaderCancelled(SingleFlightError):
+    """The leading call's request was cancelled before it finished."""
+
+
+# Outcomes of polling another worker's lease that are not its result.
+_PENDING = object()
+_ABANDONED = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def resolve(self, result):
+        self.result = result
+        self.done.set()
+
+    def reject(self, error):
+        self.error = error
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key. With a connection pool the
+    leader of each worker also takes a lease in llm_inflight, so only one
+    worker calls upstream; the others poll until the leader records a result.
+    Leases older than `lease_seconds` are taken over, so a crashed worker
+    never blocks a prompt for long; it must be longer than the longest
+    upstream call, or a live leader's call is made a second time.
+
+    `error_types` maps exception class names to factories taking the message.
+    A leader's error is recorded under the name of its nearest registered
+    class, and the other workers raise that type again; any other error
+    reaches them as SingleFlightError.
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, pool=None, lease_seconds=120, poll_interval=0.05, error_types=None):
+        self.pool = pool
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.error_types = dict(error_types or {})
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._finished = 0
+        self.upstream_calls = 0
+        self.coalesced_local = 0
+        self.coalesced_remote = 0
+        self.lease_takeovers = 0
+
+    def _join(self, key):
+        """Returns (call, is_leader) for this worker."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced_local += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def _leave(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, fn):
+        """Returns fn(), or the result of an identical call already in flight. fn must return a string."""
+        call, leader = self._join(key)
+        if not leader:
+            return call.wait()
+        try:
+            result = self._lead(key, fn)
+        except BaseException as error:
+            call.reject(error)
+            raise
+        else:
+            call.resolve(result)
+            return result
+        finally:
+            self._leave(key)
+
+    def stream(self, key, open_stream):
+        """
+        Streaming variant of `do`: the leader yields each chunk of open_stream()
+        as it arrives; coalesced callers get the complete text as one chunk.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            yield call.wait()
+            return
+        try:
+            if self._acquire_lease(key):
+                with self._lock:
+                    self.upstream_calls += 1
+                chunks = []
+                try:
+                    for chunk in open_stream():
+                        chunks.append(chunk)
+                        yield chunk
+                except BaseException as error:
+                    self._release_lease(key, error=error)
+                    raise
+                result = "".join(chunks)
+                self._release_lease(key, result=result)
+            else:
+                result = self._wait_remote(key, lambda: "".join(open_stream()))
+                yield result
+        except BaseException as error:
+            # Includes GeneratorExit when the client disconnects mid-stream.
+            call.reject(error if isinstance(error, Exception) else SingleFlightError("stream was closed"))
+            raise
+        else:
+            call.resolve(result)
+        finally:
+            self._leave(key)
+
+    def _lead(self, key, fn):
+        if not self._acquire_lease(key):
+            return self._wait_remote(key, fn)
+        return self._call_upstream(key, fn)
+
+    def _call_upstream(self, key, fn):
+        with self._lock:
+            self.upstream_calls += 1
+        try:
+            result = fn()
+        except Exception as error:
+            self._release_lease(key, error=error)
+            raise
+        self._release_lease(key, result=result)
+        return result
+
+    # --- Cross-Worker Leases ---
+    def _acquire_lease(self, key):
+        if self.pool is None:
+            return True
+        now = time.time()
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO llm_inflight (cache_key, owner, started_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(cache_key) DO UPDATE SET owner = excluded.owner, started_at = excluded.started_at, "
+                "finished_at = NULL, result = NULL, error = NULL, error_type = NULL "
+                "WHERE llm_inflight.finished_at IS NOT NULL OR llm_inflight.started_at < ?",
+                (key, self._owner, now, now - self.lease_seconds),
+            )
+            conn.commit()
+        return cursor.rowcount == 1
+
+    def _release_lease(self, key, result=None, error=None):
+        if self.pool is None:
+            return
+        error_type = message = None
+        if isinstance(error, (GeneratorExit, asyncio.CancelledError, _LeaderCancelled)):
+            # The client went away; the other workers take the lease over.
+            error_type, message = _LeaderCancelled.__name__, "leader was cancelled"
+        elif error is not None:
+            registered = (cls.__name__ for cls in type(error).__mro__ if cls.__name__ in self.error_types)
+            error_type, message = next(registered, type(error).__name__), str(error)
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE llm_inflight SET finished_at = ?, result = ?, error = ?, error_type = ? WHERE cache_key = ? AND owner = ?",
+                (time.time(), result, message, error_type, key, self._owner),
+            )
+            conn.commit()
+        with self._lock:
+            self._finished += 1
+            purge = self._finished % self.PURGE_EVERY == 0
+        if purge:
+            with self.pool.connection() as conn:
+                conn.execute("DELETE FROM llm_inflight WHERE finished_at < ?", (time.time() - self.lease_seconds,))
+                conn.commit()
+
+    def _poll_lease(self, key):
+        """
+        Checks another worker's lease once: returns its result, raises its
+        error, or returns _PENDING while it runs and _ABANDONED once it is
+        stale, gone, or its leader was cancelled.
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT started_at, finished_at, result, error, error_type FROM llm_inflight WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return _ABANDONED
+        if row["finished_at"] is None:
+            return _ABANDONED if row["started_at"] < time.time() - self.lease_seconds else _PENDING
+        if row["error_type"] == _LeaderCancelled.__name__:
+            return _ABANDONED
+        if row["error"] is not None:
+            factory = self.error_types.get(row["error_type"])
+            raise factory(row["error"]) if factory else SingleFlightError(f"{row['error_type']}: {row['error']}")
+        with self._lock:
+            self.coalesced_remote += 1
+        return row["result"]
+
+    def _wait_remote(self, key, fn):
+        """Polls another worker's lease until it has a result, taking it over if it is abandoned."""
+        while True:
+            time.sleep(self.poll_interval)
+            outcome = self._poll_lease(key)
+            if outcome is _PENDING:
+                continue
+            if outcome is not _ABANDONED:
+                return outcome
+            if self._acquire_lease(key):
+                with self._lock:
+                    self.lease_takeovers += 1
+                return self._call_upstream(key, fn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "upstream_calls": self.upstream_calls,
+                "coalesced_local": self.coalesced_local,
+                "coalesced_remote": self.coalesced_remote,
+                "lease_takeovers": self.lease_takeovers,
+                "in_flight": len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop version of SingleFlight for asgi_server.py. Callers in one
+    worker share a future; with a connection pool the leader also takes the
+    llm_inflight lease, through the same queries as SingleFlight run on
+    worker threads, so identical prompts are coalesced across workers too.
+    """
+
+    def __init__(self, pool=None, lease_seconds=120, poll_interval=0.05, error_types=None):
+        self._leases = SingleFlight(pool, lease_seconds, poll_interval, error_types)
+        self._calls = {}
+        self.upstream_calls = 0
+        self.coalesced_local = 0
+
+    async def do(self, key, fn):
+        """Awaits fn(), or the identical call already in flight. fn returns an awaitable."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced_local += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # The leader's client went away; the first follower to resume runs fn() itself.
+                return await self.do(key, fn)
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._lead(key, fn)
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Marks the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    async def stream(self, key, open_stream):
+        """
+        Streaming variant of `do`: the leader yields each chunk of open_stream()
+        (an async iterator) as it arrives; coalesced callers get the complete
+        text as one chunk.
+        """
+        async def collect():
+            return "".join([chunk async for chunk in open_stream()])
+
+        if key in self._calls:
+            yield await self.do(key, collect)
+            return
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            if self._leases.pool is None or await asyncio.to_thread(self._leases._acquire_lease, key):
+                self.upstream_calls += 1
+                chunks = []
+                try:
+                    async for chunk in open_stream():
+                        chunks.append(chunk)
+                        yield chunk
+                except BaseException as error:
+                    await self._release_lease(key, error=error)
+                    raise
+                result = "".join(chunks)
+                await self._release_lease(key, result=result)
+            else:
+                result = await self._wait_remote(key, collect)
+                yield result
+        except BaseException as error:
+            # GeneratorExit or CancelledError when the client disconnects; followers then retry.
+            future.set_exception(error if isinstance(error, Exception) else _LeaderCancelled())
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[key]
+
+    async def _lead(self, key, fn):
+        if self._leases.pool is not None and not await asyncio.to_thread(self._leases._acquire_lease, key):
+            return await self._wait_remote(key, fn)
+        return await self._call_upstream(key, fn)
+
+    async def _call_upstream(self, key, fn):
+        self.upstream_calls += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            await self._release_lease(key, error=_LeaderCancelled())
+            raise
+        except Exception as error:
+            await self._release_lease(key, error=error)
+            raise
+        await self._release_lease(key, result=result)
+        return result
+
+    async def _release_lease(self, key, result=None, error=None):
+        if self._leases.pool is not None:
+            await asyncio.to_thread(self._leases._release_lease, key, result, error)
+
+    async def _wait_remote(self, key, fn):
+        while True:
+            await asyncio.sleep(self._leases.poll_interval)
+            outcome = await asyncio.to_thread(self._leases._poll_lease, key)
+            if outcome is _PENDING:
+                continue
+            if outcome is not _ABANDONED:
+                return outcome
+            if await asyncio.to_thread(self._leases._acquire_lease, key):
+                with self._leases._lock:
+                    self._leases.lease_takeovers += 1
+                return await self._call_upstream(key, fn)
+
+    def stats(self):
+        leases = self._leases.stats()
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced_local": self.coalesced_local,
+            "coalesced_remote": leases["coalesced_remote"],
+            "lease_takeovers": leases["lease_takeovers"],
+            "in_flight": len(self._calls),
+        }
@@ -7,7 +7,12 @@
 echo "Initializing database..."
 python -c 'from backend_server import init_db; init_db()'
 
-# Start the Gunicorn server to serve the application
-# Use the PORT environment variable provided by Render, defaulting to 5001 for local dev
+# Start the server. Use the PORT environment variable provided by Render, defaulting to 5001 for local dev.
+# SERVER_MODE=async serves the same schema from asgi_server.py under uvicorn, so
+# slow OpenAI calls no longer tie up a worker; the default is Gunicorn with sync workers.
+if [ "${SERVER_MODE:-sync}" = "async" ]; then
+    echo "Starting Uvicorn (async mode) on port ${PORT:-5001}..."
+    exec uvicorn asgi_server:app --host 0.0.0.0 --port ${PORT:-5001} --workers ${WEB_CONCURRENCY:-1}
+fi
 echo "Starting Gunicorn server on port ${PORT:-5001}..."
 exec gunicorn --bind 0.0.0.0:${PORT:-5001} backend_server:app
@@ -4,11 +4,28 @@
 import streamlit as st
 import requests
 import json
+import hashlib
 import pandas as pd
+import time
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
 
 # --- Configuration ---
 GRAPHQL_API_URL = "https://your-live-backend-url.com/graphql"
+PLAN_JOB_POLL_SECONDS = 2
+PLANS_PAGE_SIZE = 10
+# New plans go through the background job queue (requestDietPlan, then polling).
+# Set to True to stream them day by day over SSE instead; only do that against
+# the ASGI backend, since each stream holds a gunicorn sync worker for the
+# whole generation.
+STREAM_PLANS = False
+PLAN_STREAM_URL = GRAPHQL_API_URL.rsplit("/graphql", 1)[0] + "/plans/stream"
+# Send only the sha256 of each query, falling back to the full text when the
+# backend has not seen it yet (automatic persisted queries).
+PERSISTED_QUERIES = True
+# Log each rerun's duration and backend round trips, and show them in the sidebar.
+SHOW_RERUN_STATS = False
 # --- Custom CSS for Vibrant UI ---
 def local_css():
     st.markdown("""
@@ -81,18 +98,149 @@ def local_css():
     """, unsafe_allow_html=True)
 
 
+# --- Backend Session ---
+# Connect quickly, but give the model-backed mutations (swap, recipe) time to answer.
+REQUEST_TIMEOUT = (3.05, 30)
+LLM_REQUEST_TIMEOUT = (3.05, 120)
+HTTP_POOL_SIZE = 20
+
+@st.cache_resource
+def http_session():
+    """
+    One keep-alive session for the whole Streamlit process, shared by every
+    browser session: pooled connections, compressed responses, and a retry
+    for connections that could not be opened (nothing was sent yet).
+    """
+    session = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.2)
+    session.mount("http://", HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=retry))
+    session.mount("https://", HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=retry))
+    # gzip/deflate, plus br when the brotli package is installed.
+    session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+    return session
+
+def record_backend_call(started):
+    """Counts one backend round trip towards this rerun's stats (see main)."""
+    stats = st.session_state.setdefault('run_stats', {'calls': 0, 'backend_seconds': 0.0})
+    stats['calls'] += 1
+    stats['backend_seconds'] += time.perf_counter() - started
+
+def post_graphql(payload, headers=None, timeout=REQUEST_TIMEOUT):
+    # Every browser session shares this process's address, so the backend charges query costs to the logged-in user.
+    if st.session_state.get('user'):
+        headers = {**(headers or {}), 'X-User-Id': str(st.session_state.user['id'])}
+    started = time.perf_counter()
+    try:
+        return http_session().post(GRAPHQL_API_URL, json=payload, headers=headers, timeout=timeout)
+    finally:
+        record_backend_call(started)
+
+def send_graphql(query, variables=None, headers=None, timeout=REQUEST_TIMEOUT):
+    """
+    Posts a GraphQL request over the shared session and returns the Response.
+    With PERSISTED_QUERIES only the query's hash is sent, and the full text
+    only if the backend asks for it. Network errors are raised.
+    """
+    payload = {'query': query, 'variables': variables or {}}
+    if PERSISTED_QUERIES:
+        payload['extensions'] = {'persistedQuery': {'version': 1, 'sha256Hash': hashlib.sha256(query.encode()).hexdigest()}}
+        response = post_graphql({k: v for k, v in payload.items() if k != 'query'}, headers, timeout)
+        if not (response.status_code == 200 and any((error.get('extensions') or {}).get('code') == 'PERSISTED_QUERY_NOT_FOUND' for error in response.json().get('errors', []))):
+            return response
+    return post_graphql(payload, headers, timeout)
+
 # --- GraphQL Helper ---
-def graphql_request(query, variables=None):
-    """A simple helper to send GraphQL requests."""
+def graphql_request(query, variables=None, timeout=REQUEST_TIMEOUT):
+    """A simple helper to send GraphQL requests (mutations and anything not worth caching)."""
     try:
-        response = requests.post(GRAPHQL_API_URL, json={'query': query, 'variables': variables or {}})
+        response = send_graphql(query, variables, timeout=timeout)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         st.error(f"Network Error: Could not connect to the backend. Is it running? Details: {e}")
         return None
 
-# --- Reusable Component to Display a Plan ---
+# --- Cached Queries ---
+# Dashboard and plan reads are cached across reruns (and sessions) per user.
+# Each user's cache entries carry a generation number; mutations that change
+# their data bump it, so the next rerun fetches fresh data. The TTL bounds how
+# long changes made elsewhere (another device, a bulk import) stay unseen.
+DATA_CACHE_TTL_SECONDS = 300
+DATA_CACHE_MAX_ENTRIES = 1000
+
+class BackendError(Exception):
+    """The backend answered, but not with usable data; raised so it is never cached."""
+
+@st.cache_resource
+def user_data_generations():
+    return {}
+
+@st.cache_resource
+def etag_store():
+    """Last ETag and body per query and variables, so a TTL expiry is revalidated with a cheap 304."""
+    return {}
+
+def invalidate_user_data(user_id):
+    """Call after a mutation that changes the user's dashboard or plans."""
+    generations = user_data_generations()
+    generations[str(user_id)] = generations.get(str(user_id), 0) + 1
+
+@st.cache_data(ttl=DATA_CACHE_TTL_SECONDS, max_entries=DATA_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_graphql(query, variables, user_id, generation):
+    """
+    Runs a read-only query. `user_id` and `generation` only key the cache. The
+    request is conditional on the last ETag seen for it, so an unchanged
+    dashboard comes back as an empty 304.
+    """
+    request_key = hashlib.sha256(json.dumps([query, variables], sort_keys=True).encode()).hexdigest()
+    store = etag_store()
+    known = store.get(request_key)
+    response = send_graphql(query, variables, headers={'If-None-Match': known['etag']} if known else None)
+    if response.status_code == 304 and known:
+        return known['body']
+    response.raise_for_status()
+    body = response.json()
+    if body.get('errors') or not body.get('data'):
+        raise BackendError(body.get('errors'))
+    if response.headers.get('ETag'):
+        if len(store) >= DATA_CACHE_MAX_ENTRIES:
+            store.clear()
+        store[request_key] = {'etag': response.headers['ETag'], 'body': body}
+    return body
+
+def cached_query(query, variables):
+    """cached_graphql for the logged-in user; shows the error and returns None on failure."""
+    user_id = st.session_state.user['id']
+    try:
+        return cached_graphql(query, variables, user_id, user_data_generations().get(str(user_id), 0))
+    except requests.exceptions.RequestException as e:
+        st.error(f"Network Error: Could not connect to the backend. Is it running? Details: {e}")
+    except BackendError:
+        pass
+    return None
+
+# --- Reusable Components to Display a Plan ---
+def render_meal_summary(meal):
+    """Renders a meal's name, dish, quantity and macros; missing fields show as '?'."""
+    nutrition = meal.get('nutrition') or {}
+    st.markdown(f"**{meal.get('name', 'Meal')}:** {meal.get('dish', '?')} - *({meal.get('quantity', '?')})*")
+    st.caption(f"🔥 {nutrition.get('calories', '?')} kcal | 💪 {nutrition.get('protein_g', '?')}g P | 🍞 {nutrition.get('carbs_g', '?')}g C | 🥑 {nutrition.get('fat_g', '?')}g F")
+
+# Replies the backend sends in place of a recipe when the model is unavailable; never memoized.
+RECIPE_UNAVAILABLE_PREFIXES = ("The meal planner is busy", "Sorry, I couldn't", "API key not configured")
+
+def fetch_recipe(dish):
+    """Returns the recipe text for a dish, asking the backend at most once per dish in this session."""
+    recipes = st.session_state.setdefault('recipes', {})
+    if dish not in recipes:
+        with st.spinner(f"Getting recipe for {dish}..."):
+            result = graphql_request("mutation GetRecipe($dish: String!) { getRecipe(dishName: $dish) }", {"dish": dish}, timeout=LLM_REQUEST_TIMEOUT)
+        recipe = result['data'].get('getRecipe') if result and result.get('data') else None
+        if not recipe or recipe.startswith(RECIPE_UNAVAILABLE_PREFIXES):
+            return recipe
+        recipes[dish] = recipe
+    return recipes[dish]
+
 def display_plan_details(plan_data, dietary_preference):
     """A reusable function to display the full details of any plan."""
     st.info(f"Showing details for plan generated on {datetime.fromisoformat(plan_data['created_at']).strftime('%B %d, %Y at %I:%M %p')}")
@@ -114,13 +262,12 @@ def display_plan_details(plan_data, dietary_preference):
                 for meal_index, meal in enumerate(day['meals']):
                     col1, col2, col3 = st.columns([4, 1, 1])
                     with col1:
-                        st.markdown(f"**{meal['name']}:** {meal['dish']} - *({meal['quantity']})*")
-                        st.caption(f"🔥 {meal['nutrition']['calories']} kcal | 💪 {meal['nutrition']['protein_g']}g P | 🍞 {meal['nutrition']['carbs_g']}g C | 🥑 {meal['nutrition']['fat_g']}g F")
+                        render_meal_summary(meal)
                     with col2:
                         if st.button("Swap", key=f"swap_{plan_data['id']}_{day_index}_{meal_index}"):
                             with st.spinner("Finding a replacement..."):
                                 swap_query = "mutation Swap($m: String!, $d: String!, $p: String!) { swapMeal(mealName: $m, dishToSwap: $d, dietaryPreference: $p) { name dish quantity nutrition { calories protein_g carbs_g fat_g } } }"
-                                new_meal = graphql_request(swap_query, {"m": meal['name'], "d": meal['dish'], "p": dietary_preference})
+                                new_meal = graphql_request(swap_query, {"m": meal['name'], "d": meal['dish'], "p": dietary_preference}, timeout=LLM_REQUEST_TIMEOUT)
                                 if new_meal and new_meal.get('data') and new_meal['data'].get('swapMeal'):
                                     st.session_state[plan_session_key][day_index]['meals'][meal_index] = new_meal['data']['swapMeal']
                                     st.rerun()
@@ -128,13 +275,11 @@ def display_plan_details(plan_data, dietary_preference):
                                     st.error("Could not swap meal.")
                     with col3:
                         if st.button("Recipe", key=f"recipe_{plan_data['id']}_{day_index}_{meal_index}"):
-                            with st.spinner(f"Getting recipe for {meal['dish']}..."):
-                                recipe_query = "mutation GetRecipe($dish: String!) { getRecipe(dishName: $dish) }"
-                                recipe_result = graphql_request(recipe_query, {"dish": meal['dish']})
-                                if recipe_result and recipe_result.get('data') and recipe_result['data'].get('getRecipe'):
-                                    st.info(f"**Recipe for {meal['dish']}**\n\n" + recipe_result['data']['getRecipe'])
-                                else:
-                                    st.error("Could not fetch recipe.")
+                            recipe = fetch_recipe(meal['dish'])
+                            if recipe:
+                                st.info(f"**Recipe for {meal['dish']}**\n\n" + recipe)
+                            else:
+                                st.error("Could not fetch recipe.")
 
     with exercise_tab:
         if not plan_data['generated_plan']['exercises']:
@@ -205,34 +350,61 @@ def login_page():
                         message = result['data']['registerUser']['message']
                     st.error(message)
 
+# --- On-Demand Plan Details ---
+def fetch_plan_details(plan_id):
+    """Loads a full plan with getPlan through the per-user cache, so reruns don't refetch it."""
+    query = """
+        query GetPlan($id: ID!) {
+            getPlan(id: $id) {
+                id created_at weight_kg bmi dietary_preference
+                generated_plan {
+                    diet { day daily_calories meals { name dish quantity nutrition { calories protein_g carbs_g fat_g } } }
+                    exercises { day activity }
+                    shoppingList { category items }
+                }
+            }
+        }
+    """
+    result = cached_query(query, {"id": plan_id})
+    if not result or not result['data'].get('getPlan'):
+        st.error("Could not load this plan.")
+        return None
+    return result['data']['getPlan']
+
 # --- Page 2: User Dashboard (History & Progress) ---
 def dashboard_page():
     st.title(f"Welcome, {st.session_state.user['username']}!")
 
+    # Only plan summaries are fetched here; full plans are loaded on "View Details".
     query = """
-        query GetUserDashboard($userId: ID!) {
+        query GetUserDashboard($userId: ID!, $first: Int!, $goalWeights: [Float!]) {
             getUserDashboard(userId: $userId) {
-                progressHistory { weight_kg log_date }
-                pastPlans { 
-                    id created_at weight_kg bmi dietary_preference
-                    generated_plan { 
-                        diet { day daily_calories meals { name dish quantity nutrition { calories protein_g carbs_g fat_g } } }
-                        exercises { day activity }
-                        shoppingList { category items }
-                    } 
+                progressAnalytics(goalWeights: $goalWeights) {
+                    total_entries
+                    points { log_date weight_kg rolling_avg_kg }
+                    trend { slope_kg_per_week }
+                    goals { goal_kg projected_date }
+                }
+                pastPlansConnection(first: $first) {
+                    edges { node { id created_at weight_kg bmi dietary_preference } }
+                    pageInfo { hasNextPage }
                 }
             }
         }
     """
-    result = graphql_request(query, {"userId": st.session_state.user['id']})
+    plans_shown = st.session_state.get('plans_shown', PLANS_PAGE_SIZE)
+    goal_weight = st.session_state.get('goal_weight')
+    variables = {"userId": st.session_state.user['id'], "first": plans_shown, "goalWeights": [goal_weight] if goal_weight else None}
+    result = cached_query(query, variables)
 
-    if not result or not result.get('data') or not result['data'].get('getUserDashboard'):
+    if not result or not result['data'].get('getUserDashboard'):
         st.warning("Could not load your dashboard data.")
         return
 
     dashboard_data = result['data']['getUserDashboard']
-    progress_history = dashboard_data.get('progressHistory', [])
-    past_plans = dashboard_data.get('pastPlans', [])
+    analytics = dashboard_data['progressAnalytics']
+    plans_connection = dashboard_data['pastPlansConnection']
+    past_plans = [edge['node'] for edge in plans_connection['edges']]
 
     # --- Progress Tracking Section ---
     st.header("Your Progress")
@@ -248,6 +420,7 @@ def dashboard_page():
                     log_query = "mutation LogWeight($userId: ID!, $weight: Float!, $date: Date!) { logWeight(userId: $userId, weight: $weight, date: $date) { success message } }"
                     log_result = graphql_request(log_query, {"userId": st.session_state.user['id'], "weight": weight, "date": str(log_date)})
                     if log_result and log_result['data']['logWeight']['success']:
+                        invalidate_user_data(st.session_state.user['id'])
                         st.success("Weight logged!")
                         st.session_state.viewing_plan_id = None
                         st.rerun()
@@ -255,11 +428,21 @@ def dashboard_page():
                         st.error("Failed to log weight.")
 
         with col2:
-            if progress_history:
-                df = pd.DataFrame(progress_history)
+            # The server sends a chart-sized series (downsampled past ~120 points) with its rolling average.
+            if analytics['points']:
+                df = pd.DataFrame(analytics['points'])
                 df['log_date'] = pd.to_datetime(df['log_date'])
                 df = df.set_index('log_date')
-                st.line_chart(df, y="weight_kg", color="#ff6a00")
+                st.line_chart(df, y=["weight_kg", "rolling_avg_kg"], color=["#ff6a00", "#1f77b4"])
+                if analytics['trend']:
+                    st.caption(f"Trend over the last 90 days: {analytics['trend']['slope_kg_per_week']:+.2f} kg/week ({analytics['total_entries']} entries logged)")
+                st.number_input("Goal weight (kg)", min_value=0.0, step=0.5, format="%.1f", key="goal_weight",
+                                help="Set to 0 to hide the projection.")
+                for goal in analytics['goals']:
+                    if goal['projected_date']:
+                        st.caption(f"At this pace you reach {goal['goal_kg']:.1f} kg around {goal['projected_date']}.")
+                    else:
+                        st.caption(f"Your current trend is not heading towards {goal['goal_kg']:.1f} kg.")
             else:
                 st.info("Log your weight to see your progress chart here!")
 
@@ -281,12 +464,16 @@ def dashboard_page():
                     st.write("") # Spacer
                     if st.button("View Details", key=f"view_{plan['id']}"):
                         st.session_state.viewing_plan_id = plan['id']
+        if plans_connection['pageInfo']['hasNextPage']:
+            if st.button("Show older plans"):
+                st.session_state.plans_shown = plans_shown + PLANS_PAGE_SIZE
+                st.rerun()
                         
     st.divider()
     
     # --- Detailed Plan Viewer ---
     if 'viewing_plan_id' in st.session_state and st.session_state.viewing_plan_id:
-        selected_plan = next((p for p in past_plans if p['id'] == st.session_state.viewing_plan_id), None)
+        selected_plan = fetch_plan_details(st.session_state.viewing_plan_id)
         if selected_plan:
             with st.container(border=True):
                 st.header("Viewing Past Plan")
@@ -295,6 +482,84 @@ def dashboard_page():
                     st.session_state.viewing_plan_id = None
                     st.rerun()
 
+# --- Streaming Plan Generation ---
+def stream_plan(variables):
+    """
+    Streams a new plan from the backend's /plans/stream endpoint, rendering each
+    day as soon as it is complete. Returns the stored DietPlan, or None on failure.
+    """
+    plan = {"diet": [], "exercises": [], "shoppingList": []}
+    summary = None
+    status = st.status("Your personal AI chef and trainer are crafting the perfect plan...")
+    days_area = st.container()
+    try:
+        with http_session().post(PLAN_STREAM_URL, json=variables, stream=True, timeout=(5, 300)) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    payload = json.loads(line[len("data: "):])
+                    if event == "day":
+                        plan["diet"].append(payload)
+                        with days_area.container(border=True):
+                            st.markdown(f"**{payload.get('day', 'Day')}** ({payload.get('daily_calories') or 0:,} kcal)")
+                            for meal in payload.get('meals') or []:
+                                render_meal_summary(meal)
+                        status.update(label=f"{payload.get('day', 'Day')} is ready ({len(plan['diet'])}/7 days)...")
+                    elif event in ("exercises", "shoppingList"):
+                        plan[event] = payload
+                    elif event == "dietPlan":
+                        summary = payload
+                    elif event == "error":
+                        status.update(label=payload['message'], state="error")
+                        return None
+    except requests.exceptions.RequestException as e:
+        status.update(label="Failed to generate plan.", state="error")
+        st.error(f"Network Error: Could not connect to the backend. Is it running? Details: {e}")
+        return None
+    if summary is None:
+        status.update(label="Failed to generate plan.", state="error")
+        return None
+    invalidate_user_data(variables['userId'])
+    status.update(label="Your plan is ready!", state="complete")
+    summary['generated_plan'] = plan
+    return summary
+
+# --- Background Plan Job Polling ---
+def wait_for_plan_job(job_id):
+    """Polls a requestDietPlan job until it finishes and returns its DietPlan (or None)."""
+    job_query = """
+        query GetPlanJob($jobId: ID!) {
+            getPlanJob(jobId: $jobId) {
+                id status error
+                dietPlan { id created_at bmi dietary_preference generated_plan {
+                    diet { day daily_calories meals { name dish quantity nutrition { calories protein_g carbs_g fat_g } } }
+                    exercises { day activity }
+                    shoppingList { category items }
+                }}
+            }
+        }
+    """
+    started = time.time()
+    with st.status("Your personal AI chef and trainer are crafting the perfect plan...") as status:
+        while True:
+            result = graphql_request(job_query, {"jobId": job_id})
+            job = result['data'].get('getPlanJob') if result and result.get('data') else None
+            if not job:
+                status.update(label="Lost track of your plan request. Please try again.", state="error")
+                return None
+            if job['status'] == "succeeded":
+                invalidate_user_data(st.session_state.user['id'])
+                status.update(label="Your plan is ready!", state="complete")
+                return job['dietPlan']
+            if job['status'] == "failed":
+                status.update(label=job['error'] or "Failed to generate plan.", state="error")
+                return None
+            status.update(label=f"Crafting your plan... ({job['status']}, {int(time.time() - started)}s)")
+            time.sleep(PLAN_JOB_POLL_SECONDS)
+
 # --- Page 3: The Main Planner ---
 def planner_page():
     st.title("Generate a New Health Plan")
@@ -321,30 +586,37 @@ def planner_page():
         for key in list(st.session_state.keys()):
             if key.startswith("diet_plan_"):
                 del st.session_state[key]
-        with st.spinner("Your personal AI chef and trainer are crafting the perfect plan..."):
-            query = """
-                mutation GeneratePlan($userId: ID!, $weight: Float!, $height: Float!, $activityLevel: String!, $includeCheatMeal: Boolean!, $dietaryPreference: String!, $allergies: [String!]) {
-                    generateDietPlan(userId: $userId, weight: $weight, height: $height, activityLevel: $activityLevel, includeCheatMeal: $includeCheatMeal, dietaryPreference: $dietaryPreference, allergies: $allergies) {
-                        success message dietPlan { id created_at bmi dietary_preference generated_plan {
-                            diet { day daily_calories meals { name dish quantity nutrition { calories protein_g carbs_g fat_g } } }
-                            exercises { day activity }
-                            shoppingList { category items }
-                        }}
-                    }
+        query = """
+            mutation RequestPlan($userId: ID!, $weight: Float!, $height: Float!, $activityLevel: String!, $includeCheatMeal: Boolean!, $dietaryPreference: String!, $allergies: [String!]) {
+                requestDietPlan(userId: $userId, weight: $weight, height: $height, activityLevel: $activityLevel, includeCheatMeal: $includeCheatMeal, dietaryPreference: $dietaryPreference, allergies: $allergies) {
+                    success message job { id status }
                 }
-            """
-            variables = {
-                "userId": st.session_state.user['id'], "weight": weight, "height": height, 
-                "activityLevel": activity_level, "includeCheatMeal": include_cheat_meal,
-                "dietaryPreference": dietary_preference, "allergies": allergies
             }
-            result = graphql_request(query, variables)
-            if result and result.get('data') and result['data']['generateDietPlan']['success']:
-                st.session_state.generated_plan = result['data']['generateDietPlan']['dietPlan']
-                st.session_state.viewing_plan_id = None
+        """
+        variables = {
+            "userId": st.session_state.user['id'], "weight": weight, "height": height, 
+            "activityLevel": activity_level, "includeCheatMeal": include_cheat_meal,
+            "dietaryPreference": dietary_preference, "allergies": allergies
+        }
+        st.session_state.generated_plan = None
+        st.session_state.viewing_plan_id = None
+        if STREAM_PLANS:
+            st.session_state.generated_plan = stream_plan(variables)
+            if st.session_state.generated_plan:
+                # Rerun so the streamed preview is replaced by the interactive plan view.
+                st.rerun()
+        else:
+            result = graphql_request(query, variables, timeout=LLM_REQUEST_TIMEOUT)
+            if result and result.get('data') and result['data']['requestDietPlan']['success']:
+                st.session_state.plan_job_id = result['data']['requestDietPlan']['job']['id']
             else:
                 st.error("Failed to generate plan.")
-                st.session_state.generated_plan = None
+
+    # --- Follow the Background Job ---
+    # The job ID survives reruns, so polling resumes if the user clicks elsewhere.
+    if st.session_state.get('plan_job_id'):
+        st.session_state.generated_plan = wait_for_plan_job(st.session_state.plan_job_id)
+        st.session_state.plan_job_id = None
 
     # --- Display Newly Generated Plan ---
     if 'generated_plan' in st.session_state and st.session_state.generated_plan:
@@ -363,10 +635,40 @@ def planner_page():
         display_plan_details(plan_data, plan_data['dietary_preference'])
 
 
+# --- Rerun Instrumentation ---
+def report_rerun(started):
+    """Logs how long this rerun took and how many backend round trips it made, when SHOW_RERUN_STATS is on."""
+    if not SHOW_RERUN_STATS:
+        return
+    stats = st.session_state.get('run_stats', {'calls': 0, 'backend_seconds': 0.0})
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    history = st.session_state.setdefault('rerun_history', [])
+    history.append((stats['calls'], elapsed_ms))
+    del history[:-50]
+    print(f"rerun page={st.session_state.get('page')}: {elapsed_ms:.0f} ms, {stats['calls']} backend calls "
+          f"({stats['backend_seconds'] * 1000:.0f} ms waiting on the backend)")
+
+def show_rerun_stats():
+    history = st.session_state.get('rerun_history')
+    if SHOW_RERUN_STATS and history:
+        calls, elapsed_ms = history[-1]
+        average_calls = sum(c for c, _ in history) / len(history)
+        st.sidebar.caption(f"Last rerun: {elapsed_ms:.0f} ms, {calls} backend calls (average {average_calls:.1f} over {len(history)} reruns)")
+
 # --- Main App Router ---
 def main():
+    started = time.perf_counter()
+    st.session_state.run_stats = {'calls': 0, 'backend_seconds': 0.0}
+    try:
+        render_app()
+    finally:
+        # Also runs when st.rerun() cuts the script short.
+        report_rerun(started)
+
+def render_app():
     st.set_page_config(page_title="AI Health Companion", layout="wide")
     local_css() # Apply custom styles
+    show_rerun_stats()
 
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
@@ -0,0 +1,22 @@
+# tests/conftest.py
+# Shared fixtures: the project root on sys.path and a migrated database per test.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db import ConnectionPool  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """A connection pool over a fresh, fully migrated database."""
+    pool = ConnectionPool(str(tmp_path / "test.db"))
+    with pool.connection() as conn:
+        migrate(conn)
+    yield pool
+    pool.close_all()
@@ -0,0 +1,30 @@
+# tests/test_llm_cache.py
+
+import time
+
+import llm_cache
+from llm_cache import LLMResponseCache, MemoryTier, SQLiteTier
+
+TTL = 100
+
+
+def test_promoted_entry_expires_at_its_original_deadline(pool, monkeypatch):
+    now = time.time()
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO llm_response_cache (cache_key, response, created_at) VALUES ('k', 'stored', ?)", (now - 95,))
+        conn.commit()
+    cache = LLMResponseCache(MemoryTier(), SQLiteTier(pool), ttl_seconds=TTL)
+
+    assert cache.get("k") == "stored"
+    assert cache.stats()["sqlite_hits"] == 1
+
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now + 6)
+    assert cache.get("k") is None
+    assert cache.stats()["memory_hits"] == 0
+
+
+def test_fresh_entry_is_served_from_memory(pool):
+    cache = LLMResponseCache(MemoryTier(), SQLiteTier(pool), ttl_seconds=TTL)
+    cache.put("k", "fresh")
+    assert cache.get("k") == "fresh"
+    assert cache.stats()["memory_hits"] == 1
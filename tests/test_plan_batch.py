@@ -0,0 +1,47 @@
+# tests/test_plan_batch.py
+
+from plan_batch import BatchPlanGenerator
+
+PLAN = {
+    "diet": [{"day": "Monday", "daily_calories": 450, "meals": [
+        {"name": "Lunch", "dish": "Gongura pappu with rice", "quantity": "1 bowl",
+         "nutrition": {"calories": 450, "protein_g": 20, "carbs_g": 55, "fat_g": 12}},
+    ]}],
+    "exercises": [{"day": "Monday", "activity": "30 minutes brisk walking"}],
+    "shoppingList": [{"category": "Vegetables", "items": ["Gongura"]}],
+}
+
+
+def profile(user_id, weight=70):
+    return {"userId": user_id, "weight": weight, "height": 170, "activityLevel": "Sedentary",
+            "includeCheatMeal": False, "dietaryPreference": "Vegetarian", "allergies": []}
+
+
+def test_malformed_user_id_fails_only_its_own_item(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('member', 'x')")
+        conn.commit()
+    batch = BatchPlanGenerator(pool, lambda **fields: (24.2, PLAN))
+
+    summary = batch.run([profile("1"), profile("not-a-number"), profile("99"), profile("1", weight=72)])
+
+    assert [item["success"] for item in summary["items"]] == [True, False, False, True]
+    assert [item["error"] for item in summary["items"]] == [None, "Unknown user.", "Unknown user.", None]
+    assert summary["succeeded"] == 2
+    assert {item["dietPlan"]["user_id"] for item in summary["items"] if item["success"]} == {1}
+
+
+def test_generation_failure_is_reported_per_unique_profile(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('member', 'x')")
+        conn.commit()
+
+    def generate(weight, **fields):
+        if weight == 80:
+            raise ValueError("bad plan")
+        return 24.2, PLAN
+
+    summary = BatchPlanGenerator(pool, generate).run([profile(1), profile(1, weight=80), profile(1, weight=80)])
+
+    assert [item["error"] for item in summary["items"]] == [None, "ValueError: bad plan", "ValueError: bad plan"]
+    assert (summary["succeeded"], summary["uniqueProfiles"]) == (1, 2)
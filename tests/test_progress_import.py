@@ -0,0 +1,64 @@
+# tests/test_progress_import.py
+# The /progress/import route against a client that uploads slowly.
+
+import os
+import sqlite3
+import tempfile
+import threading
+
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(TMP_DIR.name, "import.db")
+
+import backend_server  # noqa: E402
+
+ROWS = [f"2024-01-{day:02d},{70 + day / 10}\n".encode() for day in range(1, 11)]
+
+
+class SlowUpload:
+    """A request body that stalls after its first rows until the test releases it."""
+
+    def __init__(self, first_rows):
+        self.parts = [b"date,weight\n" + b"".join(ROWS[:first_rows]), b"".join(ROWS[first_rows:])]
+        self.stalled = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size=-1):
+        if not self.parts:
+            return b""
+        if len(self.parts) == 1:
+            self.stalled.set()
+            self.release.wait(5)
+        return self.parts.pop(0)
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+
+def test_slow_upload_does_not_hold_the_write_lock(monkeypatch):
+    backend_server.init_db()
+    with backend_server.db_pool.connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('member', 'x')")
+        conn.commit()
+    # Small batches, so an import that wrote while reading would already be inside its transaction.
+    monkeypatch.setattr(backend_server, "PROGRESS_IMPORT_BATCH_SIZE", 2)
+    body = SlowUpload(first_rows=4)
+    responses = []
+    upload = threading.Thread(target=lambda: responses.append(backend_server.app.test_client().post(
+        "/progress/import?userId=1&format=csv", content_type="text/csv",
+        environ_overrides={"wsgi.input": body, "CONTENT_LENGTH": str(len(body))})))
+    upload.start()
+    try:
+        assert body.stalled.wait(5)
+        writer = sqlite3.connect(os.environ["DB_PATH"], timeout=0.5)
+        writer.execute("INSERT INTO user_progress (user_id, weight_kg, log_date) VALUES (1, 90, '2023-12-31')")
+        writer.commit()
+        writer.close()
+    finally:
+        body.release.set()
+        upload.join(5)
+
+    result = responses[0].get_json()
+    assert result["success"], result
+    assert result["imported"] == len(ROWS)
+    with backend_server.db_pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM user_progress WHERE user_id = 1").fetchone()[0] == len(ROWS) + 1
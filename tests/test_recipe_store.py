@@ -0,0 +1,21 @@
+# tests/test_recipe_store.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+from recipe_store import RecipeStore
+
+
+def test_stored_recipe_matches_any_spelling_of_the_dish(pool):
+    store = RecipeStore(pool)
+    store.put("Gongura Pachadi", "Grind the leaves.")
+    assert store.get("  gongura  pachadi! ") == "Grind the leaves."
+    assert store.get("Pesarattu") is None
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_counters_are_exact_under_concurrent_lookups(pool):
+    store = RecipeStore(pool)
+    store.put("Pulihora", "Temper the rice.")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda n: store.get("Pulihora" if n % 2 else "Upma"), range(400)))
+    assert (store.hits, store.misses) == (200, 200)
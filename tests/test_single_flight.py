@@ -0,0 +1,127 @@
+# tests/test_single_flight.py
+# Two SingleFlight instances on one database stand in for two workers.
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from llm_gateway import CircuitOpenError, LLMGatewayError
+from single_flight import AsyncSingleFlight, SingleFlight, SingleFlightError
+
+ERRORS = {"LLMGatewayError": LLMGatewayError, "CircuitOpenError": CircuitOpenError}
+
+
+def lead_and_follow(pool, fn):
+    """Runs fn as worker A's leader, then the same key from worker B; returns B's future."""
+    leader, follower = SingleFlight(pool, error_types=ERRORS), SingleFlight(pool, error_types=ERRORS)
+    started, release = threading.Event(), threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait(5)
+        return fn()
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    leading = executor.submit(leader.do, "k", blocked)
+    started.wait(5)
+    following = executor.submit(follower.do, "k", lambda: "follower called upstream")
+    time.sleep(0.1)
+    release.set()
+    executor.shutdown(wait=False)
+    return leading, following, follower
+
+
+def test_follower_gets_the_leaders_result(pool):
+    leading, following, follower = lead_and_follow(pool, lambda: "plan")
+    assert following.result(5) == leading.result(5) == "plan"
+    assert follower.stats()["coalesced_remote"] == 1
+
+
+def test_follower_raises_the_leaders_registered_error_type(pool):
+    def fail():
+        raise CircuitOpenError("The LLM circuit breaker is open.")
+
+    _, following, _ = lead_and_follow(pool, fail)
+    with pytest.raises(CircuitOpenError, match="circuit breaker"):
+        following.result(5)
+
+
+def test_unregistered_error_reaches_the_follower_as_single_flight_error(pool):
+    def fail():
+        raise ValueError("bad prompt")
+
+    _, following, _ = lead_and_follow(pool, fail)
+    with pytest.raises(SingleFlightError, match="ValueError: bad prompt"):
+        following.result(5)
+
+
+def test_cancelled_leader_is_taken_over(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO llm_inflight (cache_key, owner, started_at, finished_at, error, error_type) "
+                     "VALUES ('k', 'gone', ?, ?, 'leader was cancelled', '_LeaderCancelled')", (time.time(), time.time()))
+        conn.commit()
+    flight = SingleFlight(pool)
+    # The lease is finished, so this worker acquires it straight away.
+    assert flight.do("k", lambda: "fresh") == "fresh"
+    assert flight.stats()["upstream_calls"] == 1
+
+
+def test_async_flights_coalesce_across_workers(pool):
+    first, second = AsyncSingleFlight(pool, error_types=ERRORS), AsyncSingleFlight(pool, error_types=ERRORS)
+
+    async def slow():
+        await asyncio.sleep(0.3)
+        return "plan"
+
+    async def fail_fast():
+        raise AssertionError("second worker called upstream")
+
+    async def run():
+        leading = asyncio.create_task(first.do("k", slow))
+        await asyncio.sleep(0.1)
+        return await asyncio.gather(leading, second.do("k", fail_fast))
+
+    assert asyncio.run(run()) == ["plan", "plan"]
+    assert second.stats()["upstream_calls"] == 0
+    assert second.stats()["coalesced_remote"] == 1
+
+
+def test_async_follower_raises_the_leaders_error_type(pool):
+    first, second = AsyncSingleFlight(pool, error_types=ERRORS), AsyncSingleFlight(pool, error_types=ERRORS)
+
+    async def busy():
+        await asyncio.sleep(0.3)
+        raise LLMGatewayError("queue full")
+
+    async def run():
+        leading = asyncio.create_task(first.do("k", busy))
+        await asyncio.sleep(0.1)
+        return await asyncio.gather(leading, second.do("k", busy), return_exceptions=True)
+
+    assert [type(error) for error in asyncio.run(run())] == [LLMGatewayError, LLMGatewayError]
+    assert second.stats()["upstream_calls"] == 0
+
+
+def test_async_stream_yields_chunks_to_the_leader_and_the_whole_text_to_followers(pool):
+    flight = AsyncSingleFlight(pool)
+    opened = []
+
+    async def open_stream():
+        opened.append(1)
+        for chunk in ("{\"diet\"", ": [", "]}"):
+            await asyncio.sleep(0.05)
+            yield chunk
+
+    async def read(stream):
+        return [chunk async for chunk in stream]
+
+    async def run():
+        leading = asyncio.create_task(read(flight.stream("k", open_stream)))
+        await asyncio.sleep(0.01)
+        return await asyncio.gather(leading, read(flight.stream("k", open_stream)))
+
+    assert asyncio.run(run()) == [["{\"diet\"", ": [", "]}"], ["{\"diet\": []}"]]
+    assert len(opened) == 1